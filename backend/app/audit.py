@@ -0,0 +1,243 @@
+# app/audit.py
+"""
+Background sink for recognition audit images.
+
+Recognition handlers call AuditWriter.submit(content) which only hashes the
+bytes and enqueues them; it returns the final path right away so it can be
+stored in PredictionLog.image_path / Attendance.image_path (None when the
+image is not going to be stored). A writer thread then stores a recompressed
+thumbnail under a content-hash name in sharded subdirectories:
+
+    data/predictions/ab/cd/abcd...ef.jpg
+
+In "original" mode the extension follows the uploaded format (.png, .webp, ...).
+
+Identical uploads (kiosk retries, double submits) map to the same file, so
+nothing can collide and nothing is written twice. The shards are kept under
+a size cap (and optional age limit) by deleting the oldest files; anything
+else under root (e.g. the flat files of the old layout) is never counted or
+deleted.
+"""
+import os
+import re
+import time
+import queue
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+
+
+SHARD_RE = re.compile(r"[0-9a-f]{2}")
+
+
+def content_hash(content: bytes) -> str:
+    """Fast 128-bit content hash used for audit file names and caches."""
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def image_ext(content: bytes) -> str:
+    """File extension for the image format in the leading magic bytes (".bin" if unknown)."""
+    head = content[:12]
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head.startswith(b"BM"):
+        return ".bmp"
+    if head.startswith((b"II*\x00", b"MM\x00*")):
+        return ".tif"
+    return ".bin"
+
+
+class AuditWriter:
+    def __init__(self, root: str, mode: str = "thumbnail", max_side: int = 480, jpeg_quality: int = 80,
+                 max_bytes: int = 2 * 1024 ** 3, max_age_days: float = 0, queue_size: int = 512):
+        """
+        mode: "thumbnail" (recompressed, long side <= max_side), "original"
+              (bytes as uploaded) or "off" (nothing stored, image_path is None)
+        max_bytes / max_age_days: retention caps for everything under root
+        """
+        self.root = root
+        self.mode = mode
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400.0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._total_bytes = None   # computed by the writer thread on start
+        self.written = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.pruned = 0
+
+    def path_for(self, digest: str, ext: str = ".jpg") -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + ext)
+
+    # ---------------------------
+    # Request side
+    # ---------------------------
+
+    def submit(self, content: bytes, digest: str = None):
+        """
+        Queue an upload for storage and return the path it will have
+        (digest: its content_hash, if known). Returns None if nothing will be
+        stored (mode "off", or the queue is full).
+        """
+        if self.mode == "off":
+            return None
+        ext = image_ext(content) if self.mode == "original" else ".jpg"
+        path = self.path_for(digest or content_hash(content), ext)
+        try:
+            self._queue.put_nowait((path, content))
+        except queue.Full:
+            # never block a request on audit I/O
+            self.dropped += 1
+            print(f"Warning: audit queue full, not storing {path}")
+            return None
+        return path
+
+    # ---------------------------
+    # Writer thread
+    # ---------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Drain what is queued, then stop the writer; gives up (daemon thread) after `timeout` seconds."""
+        if self._thread is not None:
+            deadline = time.monotonic() + timeout
+            try:
+                self._queue.put(None, timeout=timeout)
+                self._thread.join(max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+            if self._thread.is_alive():
+                print(f"Warning: audit writer did not finish within {timeout:.0f}s, "
+                      f"{self._queue.qsize()} images not stored")
+            self._thread = None
+
+    def _run(self):
+        self._total_bytes = self._scan_size()
+        last_expiry = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=60.0)
+            except queue.Empty:
+                item = False   # idle: only housekeeping below
+            if item is None:
+                break
+            if item:
+                path, content = item
+                try:
+                    self._write(path, content)
+                except Exception as e:
+                    print(f"Warning: could not store audit image {path}: {e}")
+
+            # size cap on every write, age limit at most hourly
+            expiry_due = self.max_age > 0 and time.monotonic() - last_expiry > 3600.0
+            if self._total_bytes > self.max_bytes or expiry_due:
+                self._prune()
+                last_expiry = time.monotonic()
+
+    def _encode(self, content: bytes) -> bytes:
+        if self.mode == "original":
+            return content
+        img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return content
+        h, w = img.shape[:2]
+        if max(h, w) > self.max_side:
+            r = self.max_side / float(max(h, w))
+            img = cv2.resize(img, (max(1, int(w * r)), max(1, int(h * r))), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buf.tobytes() if ok else content
+
+    def _write(self, path: str, content: bytes):
+        if os.path.exists(path):
+            self.deduplicated += 1
+            return
+        data = self._encode(content)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._total_bytes += len(data)
+        self.written += 1
+
+    # ---------------------------
+    # Retention
+    # ---------------------------
+
+    def _shard_dirs(self):
+        """The root/ab/cd directories written by path_for()."""
+        for top in _subdirs(self.root):
+            if SHARD_RE.fullmatch(top.name):
+                for sub in _subdirs(top.path):
+                    if SHARD_RE.fullmatch(sub.name):
+                        yield sub.path
+
+    def _files(self):
+        for shard in self._shard_dirs():
+            try:
+                entries = list(os.scandir(shard))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, entry.path
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._files())
+
+    def _prune(self):
+        """Delete expired files, then oldest files until under 90% of max_bytes."""
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        now = time.time()
+        target = int(self.max_bytes * 0.9)
+        for mtime, size, fpath in files:
+            expired = self.max_age > 0 and now - mtime > self.max_age
+            if not expired and total <= target:
+                break
+            try:
+                os.remove(fpath)
+                total -= size
+                self.pruned += 1
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "pruned": self.pruned,
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def _subdirs(path: str) -> list:
+    try:
+        return [e for e in os.scandir(path) if e.is_dir()]
+    except OSError:
+        return []
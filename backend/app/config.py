@@ -0,0 +1,134 @@
+# app/config.py
+"""
+Tunables for the recognition side of the backend, read from the environment
+(.env is loaded the same way as in database.py).
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(APP_DIR)
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+
+# Packed embedding gallery (see gallery_store.py)
+GALLERY_PATH = os.getenv("GALLERY_PATH", os.path.join(REPO_ROOT, "data", "enrollments", "gallery.bin"))
+# compact once this fraction of rows are tombstones, but not for fewer than GALLERY_COMPACT_MIN_DEAD rows
+GALLERY_COMPACT_DEAD_RATIO = float(os.getenv("GALLERY_COMPACT_DEAD_RATIO", "0.25"))
+GALLERY_COMPACT_MIN_DEAD = int(os.getenv("GALLERY_COMPACT_MIN_DEAD", "64"))
+
+# Nearest-neighbour index behind recognition (see vector_index.py): "exact", "ivf",
+# or "float16" / "int8" (compressed brute force + exact float32 re-rank)
+INDEX_BACKEND = os.getenv("INDEX_BACKEND", "exact")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))              # 0 -> ~4*sqrt(N) cells
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))            # cells scanned per probe (recall vs speed)
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", "2048"))   # brute force below this gallery size
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "4.0"))
+INDEX_RERANK = int(os.getenv("INDEX_RERANK", "16"))      # float16 / int8: candidates re-scored in float32
+
+# Cosine similarity needed to accept a match
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.65"))
+# Upper bound on images accepted by /recognize/batch (files + zip members)
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "256"))
+# ...and on the uncompressed size of a zip archive's images (checked before anything is inflated)
+MAX_BATCH_ARCHIVE_BYTES = int(float(os.getenv("MAX_BATCH_ARCHIVE_MB", "512")) * 1024 * 1024)
+# Group photos: candidates pooled per face before one-to-one assignment, and min detector score
+GROUP_CANDIDATES_PER_FACE = int(os.getenv("GROUP_CANDIDATES_PER_FACE", "5"))
+GROUP_MIN_DET_SCORE = float(os.getenv("GROUP_MIN_DET_SCORE", "0.5"))
+
+# Inference pool (see inference.py): "thread" or "process", running workers,
+# extra queued jobs before 503, and the Retry-After value sent with the 503
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "8"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+
+# Micro-batching of concurrent /recognize embeddings (see microbatch.py)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "1") == "1"
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "16"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+
+# Face engine (see embed_utils.py). Only the modules we use are loaded by default:
+# detection (bbox + 5 keypoints) and recognition (ArcFace embedding).
+EMBED_MODEL_PACK = os.getenv("EMBED_MODEL_PACK", "buffalo_l")
+EMBED_MODEL_ROOT = os.getenv("EMBED_MODEL_ROOT", "~/.insightface")
+EMBED_MODULES = [m.strip() for m in os.getenv("EMBED_MODULES", "detection,recognition").split(",") if m.strip()]
+EMBED_DET_SIZE = int(os.getenv("EMBED_DET_SIZE", "640"))        # detector input is DET_SIZE x DET_SIZE
+EMBED_DET_THRESH = float(os.getenv("EMBED_DET_THRESH", "0.5"))
+EMBED_CTX_ID = int(os.getenv("EMBED_CTX_ID", "-1"))             # -1 = CPU
+EMBED_PROVIDERS = [p.strip() for p in os.getenv("EMBED_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+# onnxruntime session options (0 = let onnxruntime decide)
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+ORT_EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential")   # sequential | parallel
+ORT_GRAPH_OPTIMIZATION = os.getenv("ORT_GRAPH_OPTIMIZATION", "all")  # disable | basic | extended | all
+
+# Model loading (see embed_utils.get_engine). LOAD_FACE_MODELS=0 runs a CRUD-only
+# process that never loads InsightFace; face endpoints then return 503.
+LOAD_FACE_MODELS = os.getenv("LOAD_FACE_MODELS", "1") == "1"
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+# Upload decoding (see embed_utils.decode_for_detection). Probes are decoded with
+# reduced-resolution JPEG decoding / resized to at most DECODE_MAX_SIDE pixels on the
+# long side for detection (0 = full resolution). Faces smaller than ALIGN_MIN_FACE_PX
+# on the reduced image are re-cropped from full resolution; larger ones already cover
+# the 112px crop and are aligned from the reduced image, unless ALIGN_FULL_RESOLUTION=1
+# (every crop from a full-resolution decode; see benchmarks/bench_decode.py for the cost)
+DECODE_MAX_SIDE = int(os.getenv("DECODE_MAX_SIDE", "1280"))
+GROUP_DECODE_MAX_SIDE = int(os.getenv("GROUP_DECODE_MAX_SIDE", "2560"))
+ALIGN_MIN_FACE_PX = int(os.getenv("ALIGN_MIN_FACE_PX", "112"))
+ALIGN_FULL_RESOLUTION = os.getenv("ALIGN_FULL_RESOLUTION", "0") == "1"
+# "rgb" matches the existing gallery; "bgr" skips a colour conversion but needs re-enrollment
+EMBED_COLOR_ORDER = os.getenv("EMBED_COLOR_ORDER", "rgb")
+
+# Audit images for recognition attempts (see audit.py)
+AUDIT_MODE = os.getenv("AUDIT_MODE", "thumbnail")              # thumbnail | original | off
+AUDIT_MAX_SIDE = int(os.getenv("AUDIT_MAX_SIDE", "480"))
+AUDIT_JPEG_QUALITY = int(os.getenv("AUDIT_JPEG_QUALITY", "80"))
+AUDIT_MAX_BYTES = int(float(os.getenv("AUDIT_MAX_MB", "2048")) * 1024 * 1024)
+AUDIT_MAX_AGE_DAYS = float(os.getenv("AUDIT_MAX_AGE_DAYS", "0"))  # 0 = keep until the size cap
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "512"))
+
+# Attendance export: rows fetched per server-side cursor round trip / Parquet row group
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# Admin list endpoints: largest page a client may ask for with ?limit=
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+
+# GET /sessions/active cache: reload at least this often (seconds)
+ACTIVE_SESSION_CACHE_TTL = float(os.getenv("ACTIVE_SESSION_CACHE_TTL", "30"))
+
+# Recognition hot path: sessions whose "already marked" sets are kept in memory
+MARKED_SESSIONS_CACHE_SIZE = int(os.getenv("MARKED_SESSIONS_CACHE_SIZE", "64"))
+# cached student name / semester: reloaded after this many seconds, so edits made
+# through another uvicorn worker show up in recognitions within that time
+STUDENT_CACHE_TTL = float(os.getenv("STUDENT_CACHE_TTL", "60"))
+
+# predictions_log writes: "sync" (in the request transaction) or "buffered"
+# (write-behind, bulk inserted every PREDICTION_LOG_FLUSH_ROWS rows / _FLUSH_MS)
+PREDICTION_LOG_MODE = os.getenv("PREDICTION_LOG_MODE", "sync")
+PREDICTION_LOG_FLUSH_ROWS = int(os.getenv("PREDICTION_LOG_FLUSH_ROWS", "200"))
+PREDICTION_LOG_FLUSH_MS = float(os.getenv("PREDICTION_LOG_FLUSH_MS", "1000"))
+PREDICTION_LOG_MAX_PENDING = int(os.getenv("PREDICTION_LOG_MAX_PENDING", "20000"))
+
+# Recognition with a session_id scores only the class roster (class_enrollments);
+# classes without a roster always use the full gallery
+ROSTER_SCOPED_MATCHING = os.getenv("ROSTER_SCOPED_MATCHING", "1") == "1"
+# also try the full gallery when no roster member reaches MATCH_THRESHOLD
+ROSTER_FALLBACK_FULL_GALLERY = os.getenv("ROSTER_FALLBACK_FULL_GALLERY", "0") == "1"
+ROSTER_CACHE_SIZE = int(os.getenv("ROSTER_CACHE_SIZE", "64"))       # sessions
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "60"))       # seconds
+
+# Probe embeddings cached by content hash (retries, double submits, re-uploaded photos)
+PROBE_CACHE_SIZE = int(os.getenv("PROBE_CACHE_SIZE", "1024"))   # entries per worker, 0 = off
+PROBE_CACHE_TTL = float(os.getenv("PROBE_CACHE_TTL", "300"))    # seconds
+
+# /ws/recognize/stream: faces are tracked across frames and embedded once per
+# track (again every STREAM_EMBED_REFRESH_SECS while still unmatched)
+STREAM_IOU_THRESHOLD = float(os.getenv("STREAM_IOU_THRESHOLD", "0.3"))
+STREAM_MAX_MISSED_FRAMES = int(os.getenv("STREAM_MAX_MISSED_FRAMES", "15"))
+STREAM_EMBED_REFRESH_SECS = float(os.getenv("STREAM_EMBED_REFRESH_SECS", "2.0"))
+STREAM_MIN_DET_SCORE = float(os.getenv("STREAM_MIN_DET_SCORE", "0.5"))
+STREAM_MIN_FACE_PX = int(os.getenv("STREAM_MIN_FACE_PX", "40"))          # smaller faces are ignored
+STREAM_MAX_FRAME_BYTES = int(float(os.getenv("STREAM_MAX_FRAME_MB", "4")) * 1024 * 1024)
@@ -1,37 +1,374 @@
-import insightface
+# insightface / onnxruntime are imported lazily in get_engine(), so importing
+# this module (main.py does) costs nothing until a face is actually processed.
+import io
+import os
+import glob
+import time
+import threading
 import cv2
 import numpy as np
 
-app = insightface.app.FaceAnalysis()
-# simplest: just prepare on CPU with default settings
-app.prepare(ctx_id=-1)  # removed nms argument
+try:
+    from . import config
+except ImportError:  # imported as a top-level module by make_canonical.py
+    import config
+
+
+class EngineUnavailable(RuntimeError):
+    """Face models are disabled in this process (LOAD_FACE_MODELS=0)."""
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def make_session_options():
+    """onnxruntime session options from ORT_* settings."""
+    import onnxruntime
+    so = onnxruntime.SessionOptions()
+    if config.ORT_INTRA_OP_THREADS > 0:
+        so.intra_op_num_threads = config.ORT_INTRA_OP_THREADS
+    if config.ORT_INTER_OP_THREADS > 0:
+        so.inter_op_num_threads = config.ORT_INTER_OP_THREADS
+    so.execution_mode = (
+        onnxruntime.ExecutionMode.ORT_PARALLEL
+        if config.ORT_EXECUTION_MODE == "parallel"
+        else onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    )
+    so.graph_optimization_level = {
+        "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    }.get(config.ORT_GRAPH_OPTIMIZATION, onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL)
+    return so
+
+def _model_family(onnx_file: str):
+    """
+    Model family of an insightface .onnx file ("detection", "recognition",
+    "landmark", "attribute", "swapper" or None), read from its graph inputs /
+    outputs with the same rules as insightface's ModelRouter, but without
+    creating an inference session.
+    """
+    import onnx
+    graph = onnx.load(onnx_file, load_external_data=False).graph
+    weights = {t.name for t in graph.initializer}
+    inputs = [i for i in graph.input if i.name not in weights]
+    dims = [d.dim_value if d.HasField("dim_value") else None for d in inputs[0].type.tensor_type.shape.dim]
+    h, w = (dims[2], dims[3]) if len(dims) == 4 else (None, None)
+    if len(graph.output) >= 5:
+        return "detection"
+    if h == 192 and w == 192:
+        return "landmark"
+    if h == 96 and w == 96:
+        return "attribute"
+    if len(inputs) == 2 and h == 128 and w == 128:
+        return "swapper"
+    if h is not None and h == w and h >= 112 and h % 16 == 0:
+        return "recognition"
+    return None
+
+def _module_family(module: str) -> str:
+    """EMBED_MODULES name (a model taskname) -> _model_family() name."""
+    if module.startswith("landmark"):
+        return "landmark"
+    if module == "genderage" or module.startswith("attribute"):
+        return "attribute"
+    return module
+
+def build_face_analysis(
+    model_pack: str = None,
+    modules: list = None,
+    det_size: int = None,
+    providers: list = None,
+    session_options=None,
+):
+    """
+    Builds a FaceAnalysis engine with only the requested model modules.
+
+    By default only detection + recognition are loaded (we never use the
+    landmark-3d / 2d106 / genderage heads) and the detector runs at
+    EMBED_DET_SIZE. Everything can be overridden, e.g. by the benchmark.
+
+    FaceAnalysis() itself opens a session for every .onnx file in the pack
+    (even the ones allowed_modules drops) and has no way to pass
+    SessionOptions. So the pack's files are classified first, and only the
+    requested ones get a session, created once with our providers and options.
+    """
+    import onnxruntime
+    from insightface.app import FaceAnalysis
+    from insightface.model_zoo.model_zoo import ModelRouter
+    from insightface.utils import ensure_available
+
+    model_pack = model_pack or config.EMBED_MODEL_PACK
+    modules = modules if modules is not None else config.EMBED_MODULES
+    det_size = det_size or config.EMBED_DET_SIZE
+    providers = providers or config.EMBED_PROVIDERS
+    so = session_options or make_session_options()
+
+    onnxruntime.set_default_logger_severity(3)
+    model_dir = ensure_available("models", model_pack, root=config.EMBED_MODEL_ROOT)
+    wanted = {_module_family(m) for m in modules}
+    models = {}
+    for onnx_file in sorted(glob.glob(os.path.join(model_dir, "*.onnx"))):
+        if _model_family(onnx_file) not in wanted:
+            continue
+        model = ModelRouter(onnx_file).get_model(providers=providers, sess_options=so)
+        if model is not None and model.taskname in modules and model.taskname not in models:
+            models[model.taskname] = model
+    if "detection" not in models:
+        raise RuntimeError(f"No detection model found in {model_dir}")
+
+    # FaceAnalysis.__init__ would load every model again; fill in what it sets
+    fa = FaceAnalysis.__new__(FaceAnalysis)
+    fa.model_dir = model_dir
+    fa.models = models
+    fa.det_model = models["detection"]
+    fa.prepare(ctx_id=config.EMBED_CTX_ID, det_thresh=config.EMBED_DET_THRESH, det_size=(det_size, det_size))
+    return fa
+
+def get_engine():
+    """The process-wide FaceAnalysis engine, loaded on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if not config.LOAD_FACE_MODELS:
+                    raise EngineUnavailable("Face models are disabled in this process (LOAD_FACE_MODELS=0)")
+                _engine = build_face_analysis()
+    return _engine
+
+def is_loaded() -> bool:
+    return _engine is not None
+
+def warm_worker():
+    """
+    Inference process-pool initializer: every worker loads and warms its
+    engine before it takes its first job, so no process serves a request cold.
+    """
+    if not config.LOAD_FACE_MODELS:
+        return
+    try:
+        warmup()
+    except Exception as e:
+        # a raising initializer breaks the whole pool; the first job reports the error instead
+        print(f"Warning: inference worker warm-up failed: {e}")
+
+def warmup() -> bool:
+    """Load the engine and push one dummy image through it."""
+    fa = get_engine()
+    dummy = np.zeros((config.EMBED_DET_SIZE, config.EMBED_DET_SIZE, 3), dtype=np.uint8)
+    fa.det_model.detect(dummy, max_num=0, metric="default")
+    rec = fa.models["recognition"]
+    rec.get_feat([np.zeros((rec.input_size[1], rec.input_size[0], 3), dtype=np.uint8)])
+    return True
 
 def bytes_to_rgb_image(file_bytes: bytes):
-    """Convert raw bytes -> RGB image (H, W, 3)."""
+    """Convert raw bytes -> full-resolution image (H, W, 3) in the model's colour order."""
     arr = np.frombuffer(file_bytes, np.uint8)
     bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
     if bgr is None:
         raise ValueError("Could not decode image")
-    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-    return rgb
+    return to_model_colors(bgr)
+
+def to_model_colors(bgr: np.ndarray) -> np.ndarray:
+    """
+    EMBED_COLOR_ORDER=rgb (default) keeps the historical RGB input the
+    existing gallery was built with; "bgr" skips the conversion (the
+    InsightFace models natively take BGR) but needs a re-enrolled gallery.
+    """
+    if config.EMBED_COLOR_ORDER == "bgr":
+        return bgr
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+def read_image_size(file_bytes: bytes):
+    """(width, height) from the image header without decoding pixels, or None."""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(file_bytes)) as im:
+            return im.size
+    except Exception:
+        return None
+
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def decode_for_detection(file_bytes: bytes, max_side: int = None):
+    """
+    Decodes an upload at a bounded resolution for detection.
+
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale (IMREAD_REDUCED_*),
+    which skips most of the IDCT work for 12MP phone photos; whatever is
+    still above max_side is resized down. Returns (img, (sx, sy)) where
+    sx/sy map detection coordinates back to full resolution.
+    """
+    max_side = config.DECODE_MAX_SIDE if max_side is None else max_side
+    arr = np.frombuffer(file_bytes, np.uint8)
+
+    flag = cv2.IMREAD_COLOR
+    size = read_image_size(file_bytes) if max_side > 0 else None
+    if size is not None:
+        long_side = max(size)
+        for factor in (8, 4, 2):
+            if long_side // factor >= max_side:
+                flag = _REDUCED_FLAGS[factor]
+                break
+
+    bgr = cv2.imdecode(arr, flag)
+    if bgr is None:
+        raise ValueError("Could not decode image")
+
+    h, w = bgr.shape[:2]
+    if max_side > 0 and max(h, w) > max_side:
+        r = max_side / float(max(h, w))
+        bgr = cv2.resize(bgr, (max(1, int(round(w * r))), max(1, int(round(h * r)))), interpolation=cv2.INTER_AREA)
+
+    # isotropic scale from the long sides: EXIF rotation may swap w/h
+    # between the header and the decoded pixels
+    full_long = max(size) if size is not None else max(h, w)
+    s = full_long / float(max(bgr.shape[:2]))
+    return to_model_colors(bgr), (s, s)
+
+def _align_faces(file_bytes: bytes, img: np.ndarray, scale, bboxes: np.ndarray, kpss: np.ndarray) -> list:
+    """
+    Aligns faces found on the (possibly reduced) detection image. A face that
+    is smaller than ALIGN_MIN_FACE_PX there is re-cropped from a single
+    full-resolution decode, so downscaling never costs recognition detail.
+
+    Larger faces are aligned from the reduced image: they already cover the
+    recognition crop at or above its resolution, and a second full decode
+    would give back most of what the reduced decode saved. With
+    ALIGN_FULL_RESOLUTION=1 every face is cropped from the full-resolution
+    decode instead (bench_decode.py reports both).
+    """
+    sx, sy = scale
+    full = None
+    crops = []
+    for bbox, kps in zip(bboxes, kpss):
+        face_px = min(bbox[2] - bbox[0], bbox[3] - bbox[1])
+        if (sx > 1.0 or sy > 1.0) and (config.ALIGN_FULL_RESOLUTION or face_px < config.ALIGN_MIN_FACE_PX):
+            if full is None:
+                full = bytes_to_rgb_image(file_bytes)
+            crops.append(align_face(full, kps * np.array([sx, sy], dtype=np.float32)))
+        else:
+            crops.append(align_face(img, kps))
+    return crops
+
+def detect_faces(img: np.ndarray):
+    """
+    Runs only the detector on an image.
+    Returns (bboxes (N, 5) with score in the last column, kpss (N, 5, 2)).
+    """
+    bboxes, kpss = get_engine().det_model.detect(img, max_num=0, metric="default")
+    return bboxes, kpss
+
+def largest_face_index(bboxes: np.ndarray) -> int:
+    areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    return int(areas.argmax())
+
+def align_face(img: np.ndarray, kps: np.ndarray) -> np.ndarray:
+    """5-point similarity alignment to the recognition model's input crop."""
+    from insightface.utils import face_align
+    rec = get_engine().models["recognition"]
+    return face_align.norm_crop(img, landmark=kps, image_size=rec.input_size[0])
+
+def embed_crops(crops: list) -> np.ndarray:
+    """
+    Batched ArcFace forward pass over aligned crops.
+    Returns L2-normalized embeddings, shape (len(crops), 512).
+    """
+    rec = get_engine().models["recognition"]
+    feats = np.asarray(rec.get_feat(crops), dtype=np.float32).reshape(len(crops), -1)
+    return feats / np.linalg.norm(feats, axis=1, keepdims=True)
 
-def get_face_embedding(file_bytes: bytes) -> np.ndarray:
+def largest_face_crop(file_bytes: bytes, timings: dict = None) -> np.ndarray:
+    """
+    Decode, detect and align the largest face. Raises ValueError if none.
+    If a timings dict is given, per-stage seconds are stored in it.
+    """
+    t0 = time.perf_counter()
+    img, scale = decode_for_detection(file_bytes)
+    t1 = time.perf_counter()
+    bboxes, kpss = detect_faces(img)
+    t2 = time.perf_counter()
+    if bboxes is None or len(bboxes) == 0:
+        raise ValueError("No face detected")
+    # pick largest face if multiple
+    i = largest_face_index(bboxes)
+    crop = _align_faces(file_bytes, img, scale, bboxes[i:i + 1], kpss[i:i + 1])[0]
+    if timings is not None:
+        timings["decode"] = t1 - t0
+        timings["detect"] = t2 - t1
+        timings["align"] = time.perf_counter() - t2
+    return crop
+
+def largest_face_crop_timed(file_bytes: bytes):
+    """largest_face_crop for the inference pool: returns (crop, timings)."""
+    timings: dict = {}
+    crop = largest_face_crop(file_bytes, timings)
+    return crop, timings
+
+def get_face_embedding(file_bytes: bytes, timings: dict = None) -> np.ndarray:
     """
     Returns a normalized embedding for the largest face in the image.
     Raises ValueError if no face is found.
     """
-    img = bytes_to_rgb_image(file_bytes)
-    faces = app.get(img)
-    if not faces:
-        raise ValueError("No face detected")
+    crop = largest_face_crop(file_bytes, timings)
+    t0 = time.perf_counter()
+    emb = embed_crops([crop])[0]
+    if timings is not None:
+        timings["embed"] = time.perf_counter() - t0
+    return emb
 
-    # pick largest face if multiple
-    def area(face):
-        x1, y1, x2, y2 = face.bbox
-        return (x2 - x1) * (y2 - y1)
-
-    face = max(faces, key=area)
-    emb = face.embedding.astype("float32")
-    # L2 normalize
-    norm = emb / np.linalg.norm(emb)
-    return norm
+def detect_and_align(file_bytes: bytes, min_score: float = 0.0, max_side: int = None, min_face_px: float = 0.0):
+    """
+    Detects and aligns every face without embedding them.
+    Returns (bboxes (N, 5) in full-resolution pixels, aligned crops); N may be 0.
+    min_face_px drops faces whose short side is smaller, in full-resolution pixels.
+    """
+    img, scale = decode_for_detection(file_bytes, max_side=max_side)
+    bboxes, kpss = detect_faces(img)
+    if bboxes is None or len(bboxes) == 0:
+        return np.zeros((0, 5), dtype=np.float32), []
+    full_bboxes = bboxes.copy()
+    full_bboxes[:, [0, 2]] *= scale[0]
+    full_bboxes[:, [1, 3]] *= scale[1]
+    face_px = np.minimum(full_bboxes[:, 2] - full_bboxes[:, 0], full_bboxes[:, 3] - full_bboxes[:, 1])
+    keep = (bboxes[:, 4] >= min_score) & (face_px >= min_face_px)
+    if not keep.any():
+        return full_bboxes[keep], []
+    crops = _align_faces(file_bytes, img, scale, bboxes[keep], kpss[keep])
+    return full_bboxes[keep], crops
+
+def get_all_face_embeddings(file_bytes: bytes, min_score: float = 0.0):
+    """
+    Group-photo mode: embeds every detected face with one batched pass.
+    Returns (bboxes (N, 5) in full-resolution pixels, embeddings (N, 512)); N may be 0.
+    """
+    bboxes, crops = detect_and_align(file_bytes, min_score=min_score, max_side=config.GROUP_DECODE_MAX_SIDE)
+    if not crops:
+        return bboxes, np.zeros((0, 512), dtype=np.float32)
+    return bboxes, embed_crops(crops)
+
+def get_face_embeddings_batch(files: list[bytes]) -> list:
+    """
+    Embeds the largest face of every image with one batched recognition pass.
+    Returns one entry per input: a normalized embedding, or the ValueError
+    explaining why that image could not be embedded.
+    """
+    results: list = [None] * len(files)
+    crops = []
+    crop_idx = []
+    for i, content in enumerate(files):
+        try:
+            crops.append(largest_face_crop(content))
+            crop_idx.append(i)
+        except ValueError as e:
+            results[i] = e
+
+    if crops:
+        embs = embed_crops(crops)
+        for j, i in enumerate(crop_idx):
+            results[i] = embs[j]
+    return results
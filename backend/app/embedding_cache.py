@@ -0,0 +1,125 @@
+# app/embedding_cache.py
+"""
+Probe embeddings keyed by the content hash of the uploaded bytes.
+
+Kiosks retry failed uploads, the frontend sometimes double-submits, and an
+enrollment photo is often uploaded again later for recognition. Identical
+bytes always give the same embedding, so the result of the detect + align +
+embed pipeline is kept in a bounded LRU with a TTL:
+
+- a hit skips inference entirely (embedding or the ValueError it raised,
+  e.g. "No face detected", so bad retries are cheap too)
+- a request for bytes that are being embedded right now waits for that
+  result instead of running the pipeline a second time
+- other failures (pool saturated, engine unavailable, cancellation) are not
+  cached; waiters then run the pipeline themselves
+
+The cache is per process (each uvicorn worker has its own).
+"""
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import numpy as np
+
+_FAILED = object()   # in-flight result that waiters must not reuse
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[float, object]]" = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}   # only touched on the event loop
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, digest: str) -> tuple[bool, object]:
+        """(found, embedding or ValueError); counts a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[digest]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, digest: str, value):
+        """Store an embedding (made read-only, it is shared) or a ValueError."""
+        if not self.enabled:
+            return
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+        elif not isinstance(value, ValueError):
+            return
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    @staticmethod
+    def unwrap(value) -> np.ndarray:
+        if isinstance(value, ValueError):
+            raise ValueError(str(value))
+        return value
+
+    async def get_or_compute(self, digest: str, compute: Callable[[], Awaitable[np.ndarray]]) -> np.ndarray:
+        """Cached embedding for digest, else `await compute()` (once for concurrent callers)."""
+        if not self.enabled:
+            return await compute()
+        found, value = self.lookup(digest)
+        if found:
+            return self.unwrap(value)
+
+        pending = self._inflight.get(digest)
+        if pending is not None:
+            with self._lock:
+                self.coalesced += 1
+            value = await asyncio.shield(pending)
+            if value is _FAILED:
+                return await compute()
+            return self.unwrap(value)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[digest] = fut
+        try:
+            try:
+                value = await compute()
+            except ValueError as e:
+                value = e   # no face / undecodable: the same bytes give the same answer
+            self.put(digest, value)
+            fut.set_result(value)
+            return self.unwrap(value)
+        except BaseException:
+            if not fut.done():
+                fut.set_result(_FAILED)
+            raise
+        finally:
+            self._inflight.pop(digest, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
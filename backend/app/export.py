@@ -0,0 +1,161 @@
+# app/export.py
+"""
+Streaming attendance export.
+
+Rows are read with a server-side cursor (stream_results + yield_per) as
+plain column tuples, never ORM entities, and written out chunk by chunk as
+CSV or Parquet. Memory stays bounded by one chunk no matter how many rows
+match, so a whole semester can be exported in one request.
+
+Each generator opens its own DB session: it runs after the endpoint has
+returned, while StreamingResponse is sending the body.
+"""
+import io
+import csv
+from datetime import date
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from .database import SessionLocal
+from .models import Attendance, Session as DBSess, Class
+
+COLUMNS = [
+    "attendance_id",
+    "enrollment_no",
+    "name_at_time",
+    "semester_at_time",
+    "date",
+    "time",
+    "timestamp",
+    "confidence",
+    "session_id",
+    "class_id",
+    "class_title",
+]
+
+
+def attendance_query(class_id: Optional[int] = None, session_id: Optional[int] = None,
+                     date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """SELECT of the export columns, filtered and ordered by attendance id."""
+    stmt = (
+        select(
+            Attendance.id,
+            Attendance.enrollment_no,
+            Attendance.name_at_time,
+            Attendance.semester_at_time,
+            Attendance.date,
+            Attendance.time,
+            Attendance.timestamp,
+            Attendance.confidence,
+            Attendance.session_id,
+            DBSess.class_id,
+            Class.title,
+        )
+        .outerjoin(DBSess, Attendance.session_id == DBSess.id)
+        .outerjoin(Class, DBSess.class_id == Class.id)
+    )
+    if class_id is not None:
+        stmt = stmt.where(DBSess.class_id == class_id)
+    if session_id is not None:
+        stmt = stmt.where(Attendance.session_id == session_id)
+    if date_from is not None:
+        stmt = stmt.where(Attendance.date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Attendance.date <= date_to)
+    return stmt.order_by(Attendance.id)
+
+
+def iter_row_chunks(stmt, chunk_size: int) -> Iterator[list]:
+    """Yields lists of at most chunk_size row tuples from a server-side cursor."""
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+        for chunk in result.partitions():
+            yield chunk
+    finally:
+        db.close()
+
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    if hasattr(v, "isoformat"):
+        return v.isoformat()
+    return v
+
+
+def iter_csv(stmt, chunk_size: int = 2000) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(COLUMNS)
+    yield buf.getvalue().encode("utf-8")
+    for chunk in iter_row_chunks(stmt, chunk_size):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([_csv_value(v) for v in row] for row in chunk)
+        yield buf.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after every row group."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def iter_parquet(stmt, chunk_size: int = 50000) -> Iterator[bytes]:
+    """One Parquet row group per chunk. Needs pyarrow (optional dependency)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("attendance_id", pa.int64()),
+        ("enrollment_no", pa.string()),
+        ("name_at_time", pa.string()),
+        ("semester_at_time", pa.string()),
+        ("date", pa.date32()),
+        ("time", pa.time64("us")),
+        ("timestamp", pa.timestamp("us")),
+        ("confidence", pa.float64()),
+        ("session_id", pa.int64()),
+        ("class_id", pa.int64()),
+        ("class_title", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for chunk in iter_row_chunks(stmt, chunk_size):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,288 @@
+# app/gallery.py
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from .gallery_store import PackedGalleryStore, GalleryView, import_npy_dir, fuse_embeddings
+from .vector_index import VectorIndex, ExactIndex
+
+EMB_DIM = 512  # ArcFace embedding size
+BELOW_THRESHOLD = -1e6   # assignment weight of a pair that can never be accepted
+
+
+def assign_unique(scores: np.ndarray, threshold: float) -> list[int]:
+    """
+    One-to-one assignment for a (Q, C) score matrix: the column each row is
+    assigned to, or -1. Pairs below threshold are floored before solving, so
+    the assignment maximizes the number of accepted pairs (then their total
+    score) instead of trading an accepted pair for below-threshold ones.
+    """
+    out = [-1] * scores.shape[0]
+    weights = np.where(scores >= threshold, scores, BELOW_THRESHOLD)
+    pr, pc = linear_sum_assignment(weights, maximize=True)
+    for i, j in zip(pr.tolist(), pc.tolist()):
+        if scores[i, j] >= threshold:
+            out[i] = j
+    return out
+
+
+class Gallery:
+    """
+    Process-wide view of every canonical embedding.
+
+    The vectors live in the packed, memory-mapped store (gallery_store.py), so
+    matching a probe is a single matrix-vector product over the mapped float32
+    matrix with no per-student file I/O, and every uvicorn worker shares the
+    same page-cached copy.
+
+    The store is opened lazily on first use. If it does not exist yet but the
+    legacy per-student <enrollment_no>__canonical.npy files do, they are
+    imported once. /enroll (upsert) and DELETE /students/{enrollment_no}
+    (remove) keep it in sync; changes made by other workers are picked up via
+    the store's generation counter.
+
+    Matching goes through a pluggable VectorIndex (vector_index.py): exact
+    brute force by default, or an ANN index that is updated incrementally as
+    rows are added/tombstoned and persisted next to the store.
+
+    The lock only covers syncing with the store. Queries take a snapshot of
+    the rows, index and id map (rebuilt once per store generation) under it
+    and score after releasing it, so concurrent recognitions run in parallel.
+    """
+
+    def __init__(self, store_path: str, legacy_dir: Optional[str] = None, dim: int = EMB_DIM,
+                 compact_dead_ratio: float = 0.25, compact_min_dead: int = 64,
+                 index: Optional[VectorIndex] = None):
+        self.store_path = store_path
+        self.legacy_dir = legacy_dir
+        self.dim = dim
+        self.compact_dead_ratio = compact_dead_ratio
+        self.compact_min_dead = compact_min_dead
+        self._lock = threading.RLock()
+        self.index = index or ExactIndex()
+        self.index_path = f"{store_path}.{self.index.name}.npz"
+        self._store: Optional[PackedGalleryStore] = None
+        self._gen = -1
+        self._epoch = -1
+        self._live: Optional[np.ndarray] = None   # sorted live rows known to the index
+        self._rows: dict[str, int] = {}  # enrollment_no -> live row index (replaced, never mutated)
+        self._snap: Optional[tuple[GalleryView, VectorIndex, dict[str, int]]] = None
+
+    # ---------------------------
+    # Loading / syncing with the store
+    # ---------------------------
+
+    def load(self):
+        """Open (and if needed create or migrate) the packed store."""
+        with self._lock:
+            if not os.path.exists(self.store_path) and self.legacy_dir and os.path.isdir(self.legacy_dir):
+                n = import_npy_dir(self.legacy_dir, self.store_path, self.dim)
+                if n:
+                    print(f"Imported {n} legacy canonical embeddings into {self.store_path}")
+            store = PackedGalleryStore.open_or_create(self.store_path, self.dim)
+            live = store.live_rows()
+            if not self.index.load(self.index_path, store, live, store.generation):
+                self.index.rebuild(store, live)
+                self.save_index(store)
+            self._store = store
+            self._live = live
+            self._rows = {store.id_at(int(r)): int(r) for r in live}
+            self._gen = store.generation
+            self._epoch = store.map_epoch
+            self._snap = None
+
+    def _sync(self):
+        """Caller holds the lock. Bring the id map and the index up to date with the store."""
+        if self._store is None:
+            self.load()
+            return
+        store = self._store
+        store.refresh()
+        gen = store.generation
+        if gen == self._gen and store.map_epoch == self._epoch:
+            return
+
+        live = store.live_rows()
+        if store.map_epoch != self._epoch:
+            # file was rewritten (grow/compaction): row numbers changed
+            self.index.rebuild(store, live)
+            self._rows = {store.id_at(int(r)): int(r) for r in live}
+            self.save_index(store)
+        else:
+            removed = np.setdiff1d(self._live, live, assume_unique=True)
+            added = np.setdiff1d(live, self._live, assume_unique=True)
+            rows = dict(self._rows)   # snapshots may still be reading the old map
+            if removed.size:
+                self.index.remove(removed)
+                for r in removed.tolist():
+                    sid = store.id_at(r)
+                    if rows.get(sid) == r:
+                        del rows[sid]
+            if added.size:
+                self.index.add(store, added)
+                for r in added.tolist():
+                    rows[store.id_at(r)] = r
+            self._rows = rows
+        self._live = live
+        self._gen = gen
+        self._epoch = store.map_epoch
+        self._snap = None
+
+    def _snapshot(self) -> tuple[GalleryView, VectorIndex, dict[str, int]]:
+        """(rows, index, id map) as of now; unaffected by later writes, safe to use unlocked."""
+        with self._lock:
+            self._sync()
+            if self._snap is None:
+                self._snap = (self._store.view(), self.index.snapshot(), self._rows)
+            return self._snap
+
+    def save_index(self, store: Optional[PackedGalleryStore] = None):
+        """Persist ANN index state next to the store (no-op for the exact index)."""
+        with self._lock:
+            store = store or self._store
+            if store is not None and getattr(self.index, "dirty", False):
+                try:
+                    self.index.save(self.index_path, store.generation)
+                except Exception as e:
+                    print(f"Warning: could not save vector index {self.index_path}: {e}")
+
+    @property
+    def store(self) -> PackedGalleryStore:
+        with self._lock:
+            self._sync()
+            return self._store
+
+    # ---------------------------
+    # Updates
+    # ---------------------------
+
+    def upsert(self, enrollment_no: str, emb: np.ndarray):
+        """Append (or replace) the embedding for a student."""
+        with self._lock:
+            self._sync()
+            self._store.append(enrollment_no, emb)
+            self._sync()
+
+    def merge(self, enrollment_no: str, emb: np.ndarray, existing_images: int) -> np.ndarray:
+        """
+        Fuse one new image's embedding into the student's template, which was
+        built from `existing_images` images (make_canonical's mean, weighted
+        accordingly), and store the result. A student without a template, or
+        existing_images == 0, gets `emb` as is. Returns the stored template.
+        """
+        with self._lock:
+            self._sync()
+            row = self._rows.get(enrollment_no)
+            if row is not None and existing_images > 0:
+                emb = fuse_embeddings(np.vstack([self._store.vectors[row], emb]), weights=[existing_images, 1])
+            self._store.append(enrollment_no, emb)
+            self._sync()
+            return emb
+
+    def remove(self, enrollment_no: str) -> bool:
+        """Tombstone a student's embedding. Returns False if it was not present."""
+        with self._lock:
+            self._sync()
+            removed = self._store.tombstone(enrollment_no)
+            if removed:
+                self._store.maybe_compact(self.compact_dead_ratio, self.compact_min_dead)
+            self._sync()
+            return removed
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+
+    def search(self, probe: np.ndarray) -> tuple[Optional[str], float]:
+        """
+        Returns (enrollment_no, cosine_score) of the best match for a
+        normalized probe, or (None, -inf) if the gallery is empty.
+        """
+        view, index, _ = self._snapshot()
+        rows, scores = index.search(view, probe.reshape(1, -1), k=1)
+        best_row = int(rows[0, 0])
+        if best_row < 0:
+            return None, float("-inf")
+        return view.id_at(best_row), float(scores[0, 0])
+
+    def search_many(self, probes: np.ndarray) -> list[tuple[Optional[str], float]]:
+        """
+        Best match for every row of a (Q, D) probe matrix, scored with one
+        matrix-matrix product. Returns [(enrollment_no, score), ...].
+        """
+        view, index, _ = self._snapshot()
+        rows, scores = index.search(view, probes, k=1)
+        out = []
+        for r, s in zip(rows[:, 0].tolist(), scores[:, 0].tolist()):
+            if r < 0:
+                out.append((None, float("-inf")))
+            else:
+                out.append((view.id_at(r), float(s)))
+        return out
+
+    def match_unique(self, probes: np.ndarray, threshold: float, k: int = 5) -> list[tuple[Optional[str], float]]:
+        """
+        One-to-one assignment of probes (e.g. every face in a group photo) to
+        gallery identities: no student is matched twice.
+
+        Each probe's top-k candidates are pooled and the probe x candidate
+        score matrix is solved with the Hungarian algorithm over the pairs at
+        or above threshold (assign_unique).
+        Returns one (enrollment_no or None, score) per probe; score is the best
+        raw score for unmatched probes.
+        """
+        q = probes.shape[0]
+        if q == 0:
+            return []
+        view, index, _ = self._snapshot()
+        rows, top = index.search(view, probes, k=k)
+        cand = np.unique(rows[rows >= 0])
+        if cand.size == 0:
+            return [(None, float("-inf"))] * q
+        scores = probes.astype(np.float32, copy=False).dot(view.vectors[cand].T)   # (Q, C)
+        ids = [view.id_at(int(r)) for r in cand]
+
+        out: list[tuple[Optional[str], float]] = [(None, float(top[i, 0])) for i in range(q)]
+        for i, j in enumerate(assign_unique(scores, threshold)):
+            if j >= 0:
+                out[i] = (ids[j], float(scores[i, j]))
+        return out
+
+    def version(self) -> tuple[int, int]:
+        """Changes whenever the set of live embeddings (or their row numbers) does."""
+        with self._lock:
+            self._sync()
+            return self._gen, self._epoch
+
+    def subset(self, ids) -> tuple[list[str], np.ndarray, tuple[int, int]]:
+        """
+        Float32 copy of the embeddings of `ids` (e.g. a class roster) for
+        scoped matching. Returns (ids that have a live embedding, their
+        (M, D) vectors, version() they were copied at).
+        """
+        with self._lock:
+            view, _, id_rows = self._snapshot()
+            version = (self._gen, self._epoch)
+        found = [sid for sid in ids if sid in id_rows]
+        rows = np.fromiter((id_rows[sid] for sid in found), dtype=np.int64, count=len(found))
+        vecs = np.asarray(view.vectors[rows], dtype=np.float32).reshape(len(found), self.dim)
+        return found, vecs, version
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync()
+            return len(self._rows)
+
+    def ids(self) -> set[str]:
+        """Snapshot of every enrollment_no that has a live embedding."""
+        with self._lock:
+            self._sync()
+            return set(self._rows)
+
+    def __contains__(self, enrollment_no: str) -> bool:
+        with self._lock:
+            self._sync()
+            return enrollment_no in self._rows
@@ -0,0 +1,443 @@
+# app/gallery_store.py
+"""
+Packed, memory-mapped embedding gallery.
+
+One file holds every canonical embedding:
+
+    [ header (64 B) | ids (capacity x 64 B) | alive flags (capacity x 1 B, padded) | vectors (capacity x dim float32) ]
+
+- Enrolments append a row (growing the file by rewriting it with double capacity).
+- Deletes only clear the row's alive flag (tombstone); compaction rewrites the
+  file with live rows only once enough rows are dead.
+- Readers open the file with np.memmap, so several uvicorn workers share one
+  page-cached copy of the matrix. Every write bumps `generation` in the header;
+  a rewrite (grow/compact) also sets FLAG_SUPERSEDED in the *old* file so other
+  processes know to reopen.
+
+This module only depends on numpy so it can be used both from the API and
+from the offline scripts (make_canonical.py, migrate_enrollments.py).
+"""
+import os
+import contextlib
+from typing import Optional
+
+import numpy as np
+
+MAGIC = b"FAGALv01"
+VERSION = 1
+HEADER_SIZE = 64
+ID_BYTES = 64               # enrollment_no is String(50) in the DB
+ALIGN = 64
+DEFAULT_CAPACITY = 1024
+
+FLAG_SUPERSEDED = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("dim", "<u4"),
+    ("capacity", "<u8"),
+    ("count", "<u8"),        # rows used (live + tombstoned)
+    ("live", "<u8"),         # rows with alive == 1
+    ("generation", "<u8"),   # bumped on every change
+    ("flags", "<u8"),
+    ("_pad", "V8"),
+])
+assert HEADER_DTYPE.itemsize == HEADER_SIZE
+
+
+def fuse_embeddings(embs: np.ndarray, weights=None) -> np.ndarray:
+    """
+    One template from several normalized (N, D) embeddings: their (weighted)
+    mean, re-normalized.
+    """
+    embs = np.asarray(embs, dtype=np.float32)
+    mean = np.average(embs.reshape(-1, embs.shape[-1]), axis=0, weights=weights)
+    return (mean / np.linalg.norm(mean)).astype(np.float32)
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(capacity: int, dim: int) -> tuple[int, int, int, int]:
+    """Returns (ids_offset, alive_offset, vecs_offset, total_size)."""
+    ids_off = HEADER_SIZE
+    alive_off = ids_off + capacity * ID_BYTES
+    vecs_off = _align(alive_off + capacity)
+    total = vecs_off + capacity * dim * 4
+    return ids_off, alive_off, vecs_off, total
+
+
+def _encode_id(enrollment_no: str) -> bytes:
+    raw = enrollment_no.encode("utf-8")
+    if len(raw) > ID_BYTES:
+        raise ValueError(f"enrollment_no too long for gallery store: {enrollment_no!r}")
+    return raw
+
+
+@contextlib.contextmanager
+def _file_lock(lock_path: str):
+    """Cross-process exclusive lock (fcntl on POSIX, msvcrt on Windows)."""
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        except ImportError:
+            import msvcrt
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+
+class PackedGalleryStore:
+    """Header + id index + float32 matrix in one np.memmap'ed file."""
+
+    def __init__(self, path: str, mode: str = "r+"):
+        self.path = path
+        self.mode = mode
+        self.lock_path = path + ".lock"
+        self.map_epoch = 0   # bumped on every (re)map; row numbers may change across epochs
+        self._map()
+
+    # ---------------------------
+    # File creation / mapping
+    # ---------------------------
+
+    @classmethod
+    def create(cls, path: str, dim: int, capacity: int = DEFAULT_CAPACITY) -> "PackedGalleryStore":
+        """Create an empty store (overwrites any existing file)."""
+        _write_file(path, dim, capacity, [], np.empty((0, dim), dtype=np.float32))
+        return cls(path)
+
+    @classmethod
+    def open_or_create(cls, path: str, dim: int, capacity: int = DEFAULT_CAPACITY) -> "PackedGalleryStore":
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with _file_lock(path + ".lock"):
+            if not os.path.exists(path):
+                _write_file(path, dim, capacity, [], np.empty((0, dim), dtype=np.float32))
+        store = cls(path)
+        if store.dim != dim:
+            raise ValueError(f"Gallery store {path} has dim {store.dim}, expected {dim}")
+        return store
+
+    def _map(self):
+        mm = np.memmap(self.path, dtype=np.uint8, mode=self.mode)
+        header = mm[:HEADER_SIZE].view(HEADER_DTYPE)
+        if header["magic"][0] != MAGIC:
+            raise ValueError(f"{self.path} is not a packed gallery file")
+        if int(header["version"][0]) != VERSION:
+            raise ValueError(f"Unsupported gallery version {int(header['version'][0])}")
+
+        dim = int(header["dim"][0])
+        capacity = int(header["capacity"][0])
+        ids_off, alive_off, vecs_off, total = _layout(capacity, dim)
+        if mm.shape[0] < total:
+            raise ValueError(f"Gallery file {self.path} is truncated")
+
+        self._mm = mm
+        self._header = header
+        self.dim = dim
+        self.capacity = capacity
+        self.ids = mm[ids_off:alive_off].view(f"S{ID_BYTES}")
+        self.alive = mm[alive_off:alive_off + capacity]
+        self.vectors = mm[vecs_off:vecs_off + capacity * dim * 4].view(np.float32).reshape(capacity, dim)
+        self.map_epoch += 1
+
+    def close(self):
+        self.ids = self.alive = self.vectors = self._header = None
+        self._mm = None
+
+    # ---------------------------
+    # Header accessors (always read through the mapping)
+    # ---------------------------
+
+    @property
+    def count(self) -> int:
+        return int(self._header["count"][0])
+
+    @property
+    def live(self) -> int:
+        return int(self._header["live"][0])
+
+    @property
+    def generation(self) -> int:
+        return int(self._header["generation"][0])
+
+    @property
+    def superseded(self) -> bool:
+        return bool(int(self._header["flags"][0]) & FLAG_SUPERSEDED)
+
+    def refresh(self) -> bool:
+        """Remap if another process rewrote the file. Returns True if remapped."""
+        if self.superseded:
+            self._map()
+            return True
+        return False
+
+    def _bump(self, count_delta: int = 0, live_delta: int = 0):
+        self._header["count"] = self.count + count_delta
+        self._header["live"] = self.live + live_delta
+        self._header["generation"] = self.generation + 1
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    def live_rows(self) -> np.ndarray:
+        """Row indices of all non-tombstoned entries."""
+        n = self.count
+        return np.flatnonzero(self.alive[:n])
+
+    def id_at(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+    def find(self, enrollment_no: str) -> Optional[int]:
+        """Row index of the live entry for enrollment_no (vectorized scan)."""
+        n = self.count
+        hits = np.flatnonzero((self.ids[:n] == _encode_id(enrollment_no)) & (self.alive[:n] == 1))
+        return int(hits[-1]) if hits.size else None
+
+    def view(self) -> "GalleryView":
+        return GalleryView(self)
+
+    # ---------------------------
+    # Writes (serialized across processes by the lock file)
+    # ---------------------------
+
+    def append(self, enrollment_no: str, emb: np.ndarray) -> int:
+        """
+        Append a row for enrollment_no, tombstoning any previous live row.
+        Returns the new row index.
+        """
+        key = _encode_id(enrollment_no)
+        v = np.asarray(emb, dtype=np.float32).reshape(self.dim)
+        with _file_lock(self.lock_path):
+            self.refresh()
+            old = self.find(enrollment_no)
+            if old is not None:
+                self.alive[old] = 0
+                self._bump(live_delta=-1)
+
+            if self.count == self.capacity:
+                self._rewrite(max(DEFAULT_CAPACITY, 2 * self.capacity))
+
+            row = self.count
+            self.vectors[row] = v
+            self.ids[row] = key
+            self.alive[row] = 1
+            # header last, so readers never see a half-written row
+            self._bump(count_delta=1, live_delta=1)
+            self._mm.flush()
+            return row
+
+    def append_many(self, items) -> list[int]:
+        """
+        Bulk append: like append() for every (enrollment_no, emb) pair, but
+        under one lock, with at most one grow and one flush. Later pairs win
+        for a repeated enrollment_no. Returns the new row indices.
+        """
+        latest = {}
+        for enrollment_no, emb in items:
+            latest[_encode_id(enrollment_no)] = np.asarray(emb, dtype=np.float32).reshape(self.dim)
+        if not latest:
+            return []
+        keys = list(latest)
+        with _file_lock(self.lock_path):
+            self.refresh()
+            n = self.count
+            old = np.flatnonzero(np.isin(self.ids[:n], keys) & (self.alive[:n] == 1))
+            if old.size:
+                self.alive[old] = 0
+                self._bump(live_delta=-int(old.size))
+
+            if self.count + len(keys) > self.capacity:
+                capacity = max(DEFAULT_CAPACITY, 2 * self.capacity)
+                while capacity < self.live + len(keys):
+                    capacity *= 2
+                self._rewrite(capacity)   # also drops the rows tombstoned above
+
+            start = self.count
+            rows = list(range(start, start + len(keys)))
+            self.vectors[start:start + len(keys)] = np.vstack([latest[k] for k in keys])
+            self.ids[start:start + len(keys)] = keys
+            self.alive[start:start + len(keys)] = 1
+            # header last, so readers never see a half-written row
+            self._bump(count_delta=len(keys), live_delta=len(keys))
+            self._mm.flush()
+            return rows
+
+    def tombstone(self, enrollment_no: str) -> bool:
+        """Mark enrollment_no's row(s) deleted. Returns False if absent."""
+        with _file_lock(self.lock_path):
+            self.refresh()
+            n = self.count
+            hits = np.flatnonzero((self.ids[:n] == _encode_id(enrollment_no)) & (self.alive[:n] == 1))
+            if not hits.size:
+                return False
+            self.alive[hits] = 0
+            self._bump(live_delta=-int(hits.size))
+            self._mm.flush()
+            return True
+
+    def dead_ratio(self) -> float:
+        n = self.count
+        return (n - self.live) / n if n else 0.0
+
+    def compact(self):
+        """Rewrite the file keeping only live rows (capacity kept)."""
+        with _file_lock(self.lock_path):
+            self.refresh()
+            self._rewrite(self.capacity)
+
+    def maybe_compact(self, dead_ratio: float, min_dead: int) -> bool:
+        """Compact when at least min_dead rows and dead_ratio of rows are tombstones."""
+        dead = self.count - self.live
+        if dead >= min_dead and self.dead_ratio() >= dead_ratio:
+            self.compact()
+            return True
+        return False
+
+    def _rewrite(self, capacity: int):
+        """Caller holds the lock. Writes live rows to a new file and swaps it in."""
+        rows = self.live_rows()
+        capacity = max(capacity, int(rows.size))
+        ids = [self.id_at(int(r)) for r in rows]
+        vecs = np.asarray(self.vectors[rows], dtype=np.float32)
+
+        tmp_path = self.path + ".tmp"
+        _write_file(tmp_path, self.dim, capacity, ids, vecs,
+                    generation=self.generation + 1)
+        # tell other processes mapping the old file to reopen, then drop our
+        # own mapping before the swap (Windows refuses to replace mapped files)
+        self._header["flags"] |= FLAG_SUPERSEDED
+        self._mm.flush()
+        self.close()
+        try:
+            os.replace(tmp_path, self.path)
+        except OSError:
+            self._map()
+            self._header["flags"] = int(self._header["flags"][0]) & ~FLAG_SUPERSEDED
+            self._mm.flush()
+            raise
+        self._map()
+
+
+class GalleryView:
+    """
+    Read-only snapshot of a store's rows, for searching without the gallery
+    lock. Rows appended or tombstoned afterwards are not visible, and the
+    arrays keep the current mapping alive if the store is remapped (grow,
+    compaction) while a search is still running.
+    """
+
+    def __init__(self, store: PackedGalleryStore):
+        self.dim = store.dim
+        self.count = store.count
+        self.vectors = store.vectors[:self.count]
+        self.ids = store.ids[:self.count]
+        self.alive = np.array(store.alive[:self.count])   # tombstones flip bytes in place
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive)
+
+    def id_at(self, row: int) -> str:
+        return self.ids[row].decode("utf-8")
+
+
+def _write_file(path: str, dim: int, capacity: int, ids: list[str], vecs: np.ndarray,
+                generation: int = 0):
+    capacity = max(capacity, len(ids))
+    ids_off, alive_off, vecs_off, total = _layout(capacity, dim)
+
+    with open(path, "wb") as f:
+        f.truncate(total)
+
+    mm = np.memmap(path, dtype=np.uint8, mode="r+")
+    header = mm[:HEADER_SIZE].view(HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["dim"] = dim
+    header["capacity"] = capacity
+    header["count"] = len(ids)
+    header["live"] = len(ids)
+    header["generation"] = generation
+    header["flags"] = 0
+
+    n = len(ids)
+    if n:
+        mm[ids_off:alive_off].view(f"S{ID_BYTES}")[:n] = [_encode_id(i) for i in ids]
+        mm[alive_off:alive_off + n] = 1
+        mm[vecs_off:vecs_off + n * dim * 4].view(np.float32).reshape(n, dim)[:] = vecs
+    mm.flush()
+    del mm
+
+
+def import_npy_dir(enroll_dir: str, path: str, dim: int, force: bool = False) -> int:
+    """
+    Import a legacy directory of <enrollment_no>__canonical.npy files into
+    the store at `path`. Returns the number of rows imported.
+
+    An existing store is kept: only students it does not already hold are
+    appended, so rows added since the first import (/enroll,
+    make_canonical_all) survive a re-run. force=True instead rebuilds the
+    store from the .npy files alone, dropping every other row.
+    """
+    held: set[str] = set()
+    if not force and os.path.exists(path):
+        store = PackedGalleryStore(path, mode="r")
+        if store.dim != dim:
+            raise ValueError(f"Gallery store {path} has dim {store.dim}, expected {dim}")
+        held = {store.id_at(int(r)) for r in store.live_rows()}
+        store.close()
+
+    ids: list[str] = []
+    vecs = []
+    for fname in sorted(os.listdir(enroll_dir)):
+        if not fname.endswith("__canonical.npy") or fname.split("__")[0] in held:
+            continue
+        try:
+            v = np.load(os.path.join(enroll_dir, fname))
+        except Exception as e:
+            print(f"Warning: could not load canonical embedding {fname}: {e}")
+            continue
+        ids.append(fname.split("__")[0])
+        vecs.append(np.asarray(v, dtype=np.float32).reshape(dim))
+
+    if held:
+        if ids:
+            store = PackedGalleryStore(path)
+            store.append_many(zip(ids, vecs))
+            store.close()
+        return len(ids)
+
+    mat = np.vstack(vecs) if vecs else np.empty((0, dim), dtype=np.float32)
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with _file_lock(path + ".lock"):
+        tmp_path = path + ".tmp"
+        _write_file(tmp_path, dim, max(DEFAULT_CAPACITY, 2 * len(ids)), ids, mat)
+        if os.path.exists(path):
+            # mark the file being replaced so running workers reopen it
+            try:
+                old = PackedGalleryStore(path)
+                old._header["flags"] |= FLAG_SUPERSEDED
+                old._mm.flush()
+                old.close()
+            except Exception:
+                pass
+        os.replace(tmp_path, path)
+    return len(ids)
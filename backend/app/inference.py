@@ -0,0 +1,110 @@
+# app/inference.py
+"""
+Runs CPU-bound face inference off the asyncio event loop.
+
+InsightFace detection + ArcFace (onnxruntime) take tens to hundreds of ms
+per image. Calling them directly from `async def` handlers blocks the event
+loop, so /health and every other request stall behind a face. Handlers
+instead `await inference.run(fn, *args)`, which executes fn on a thread or
+process pool.
+
+The pool is bounded: at most `workers` jobs run and `max_queue` more may
+wait. Beyond that run() raises InferenceSaturated immediately, which main.py
+turns into a 503 with Retry-After, so clients back off instead of piling up
+latency.
+"""
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class InferenceSaturated(Exception):
+    """Raised when the inference pool and its queue are full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference workers are saturated, retry later")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, kind: str = "thread", workers: int = 2, max_queue: int = 8, retry_after: int = 2,
+                 initializer=None):
+        """initializer: run once in every process worker before its first job (model warm-up)."""
+        self.kind = kind
+        self.initializer = initializer
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._pool = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.kind == "process":
+                # spawn: each worker loads its own model instead of inheriting
+                # a forked onnxruntime session
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._pool
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, or raise InferenceSaturated."""
+        with self._lock:
+            if self._inflight >= self.capacity:
+                self._rejected += 1
+                raise InferenceSaturated(self.retry_after)
+            self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._completed += 1
+
+    async def warm(self, fn, *args):
+        """
+        Warm-up before traffic arrives, bypassing the queue bound.
+
+        Threads share one engine, so fn runs once. Process workers warm
+        themselves in the pool initializer; submitting one job per worker back
+        to back makes the executor start all of them now (a spawn pool starts
+        a new process per submit while none is idle) and returns once every
+        started process has initialized.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        n = self.workers if self.kind == "process" else 1
+        return await asyncio.gather(
+            *[loop.run_in_executor(pool, functools.partial(fn, *args)) for _ in range(n)]
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "inflight": self._inflight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
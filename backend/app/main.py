@@ -1,11 +1,16 @@
 # app/main.py
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select, func, or_
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime, date
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from fastapi.middleware.cors import CORSMiddleware
-from .database import get_db
+from .database import get_db, get_async_db, SessionLocal, pool_status, dispose_async_engine
 from .models import (
     Student,
     StudentImage,
@@ -13,12 +18,97 @@ from .models import (
     PredictionLog,
     Session as DBSess,
     Class,
+    ClassEnrollment,
     Faculty,
 )
-from .embed_utils import get_face_embedding
+from .embed_utils import (
+    EngineUnavailable,
+    warmup as warmup_engine,
+    is_loaded as engine_loaded,
+    warm_worker,
+    get_face_embedding,
+    get_face_embeddings_batch,
+    get_all_face_embeddings,
+    detect_and_align,
+    largest_face_crop_timed,
+    embed_crops,
+)
+from .gallery import Gallery
+from .inference import InferenceExecutor, InferenceSaturated
+from .microbatch import MicroBatcher
+from .metrics import StageStats
+from .audit import AuditWriter, content_hash
+from .embedding_cache import EmbeddingCache
+from .export import attendance_query, iter_csv, iter_parquet, parquet_available
+from .pagination import list_or_page
+from .session_cache import ActiveSessionCache
+from .student_cache import StudentDirectory, MarkedSessions
+from .prediction_log import PredictionLogBuffer
+from .roster import RosterCache, RosterView
+from .tracker import FaceTracker
+from .vector_index import make_index
+from .config import (
+    GALLERY_PATH,
+    GALLERY_COMPACT_DEAD_RATIO,
+    GALLERY_COMPACT_MIN_DEAD,
+    INDEX_BACKEND,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_MIN_TRAIN,
+    IVF_RETRAIN_GROWTH,
+    INDEX_RERANK,
+    MATCH_THRESHOLD,
+    MAX_BATCH_IMAGES,
+    MAX_BATCH_ARCHIVE_BYTES,
+    GROUP_CANDIDATES_PER_FACE,
+    GROUP_MIN_DET_SCORE,
+    INFERENCE_EXECUTOR,
+    INFERENCE_WORKERS,
+    INFERENCE_MAX_QUEUE,
+    INFERENCE_RETRY_AFTER,
+    MICROBATCH_ENABLED,
+    MICROBATCH_MAX_SIZE,
+    MICROBATCH_MAX_WAIT_MS,
+    LOAD_FACE_MODELS,
+    WARMUP_ON_STARTUP,
+    AUDIT_MODE,
+    AUDIT_MAX_SIDE,
+    AUDIT_JPEG_QUALITY,
+    AUDIT_MAX_BYTES,
+    AUDIT_MAX_AGE_DAYS,
+    AUDIT_QUEUE_SIZE,
+    EXPORT_CHUNK_ROWS,
+    PAGE_MAX_LIMIT,
+    ACTIVE_SESSION_CACHE_TTL,
+    MARKED_SESSIONS_CACHE_SIZE,
+    STUDENT_CACHE_TTL,
+    PREDICTION_LOG_MODE,
+    PREDICTION_LOG_FLUSH_ROWS,
+    PREDICTION_LOG_FLUSH_MS,
+    PREDICTION_LOG_MAX_PENDING,
+    ROSTER_SCOPED_MATCHING,
+    ROSTER_FALLBACK_FULL_GALLERY,
+    ROSTER_CACHE_SIZE,
+    ROSTER_CACHE_TTL,
+    PROBE_CACHE_SIZE,
+    PROBE_CACHE_TTL,
+    STREAM_IOU_THRESHOLD,
+    STREAM_MAX_MISSED_FRAMES,
+    STREAM_EMBED_REFRESH_SECS,
+    STREAM_MIN_DET_SCORE,
+    STREAM_MIN_FACE_PX,
+    STREAM_MAX_FRAME_BYTES,
+)
 import numpy as np
 import shutil
 import os
+import io
+import zipfile
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -35,12 +125,13 @@ app.add_middleware(
 def delete_student_files(enrollment_no: str):
     """
     Deletes all filesystem assets belonging to a student:
-    - canonical embedding (.npy)
+    - legacy canonical embedding (.npy), if one is still lying around
+      (the gallery row itself is tombstoned by gallery.remove)
     - raw images under data/raw/
     - optionally prediction images (NOT deleting for now)
     """
 
-    # 1. Delete canonical .npy
+    # 1. Delete legacy canonical .npy
     canonical = canonical_path(enrollment_no)
     if os.path.exists(canonical):
         try:
@@ -102,6 +193,10 @@ class ClassUpdate(BaseModel):
     faculty_id: Optional[str] = None
 
 
+class RosterUpdate(BaseModel):
+    enrollment_nos: List[str]
+
+
 
 
 
@@ -125,24 +220,318 @@ os.makedirs(RAW_DIR, exist_ok=True)
 os.makedirs(PREDICTIONS_DIR, exist_ok=True)
 
 def canonical_path(enrollment_no: str) -> str:
+    # legacy one-file-per-student layout, only used for cleanup / migration
     return os.path.join(ENROLL_DIR, f"{enrollment_no}__canonical.npy")
 
+# Process-wide embedding gallery backed by the packed store in GALLERY_PATH
+# (legacy .npy files in ENROLL_DIR are imported on first use)
+if INDEX_BACKEND == "ivf":
+    vector_index = make_index(
+        "ivf",
+        nlist=IVF_NLIST,
+        nprobe=IVF_NPROBE,
+        min_train=IVF_MIN_TRAIN,
+        retrain_growth=IVF_RETRAIN_GROWTH,
+    )
+elif INDEX_BACKEND in ("float16", "int8"):
+    vector_index = make_index(INDEX_BACKEND, rerank=INDEX_RERANK)
+else:
+    vector_index = make_index(INDEX_BACKEND)
+
+gallery = Gallery(
+    GALLERY_PATH,
+    legacy_dir=ENROLL_DIR,
+    compact_dead_ratio=GALLERY_COMPACT_DEAD_RATIO,
+    compact_min_dead=GALLERY_COMPACT_MIN_DEAD,
+    index=vector_index,
+)
+
+
+# Face inference runs on a bounded pool, never on the event loop
+inference = InferenceExecutor(
+    kind=INFERENCE_EXECUTOR,
+    workers=INFERENCE_WORKERS,
+    max_queue=INFERENCE_MAX_QUEUE,
+    retry_after=INFERENCE_RETRY_AFTER,
+    initializer=warm_worker,
+)
+
+# Concurrent /recognize crops share one batched ArcFace pass
+batcher = MicroBatcher(
+    embed_crops,
+    inference.run,
+    max_batch=MICROBATCH_MAX_SIZE,
+    max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+)
+
+# Recognition probes are stored off the request path, deduplicated by
+# content hash and kept under a size cap
+audit = AuditWriter(
+    PREDICTIONS_DIR,
+    mode=AUDIT_MODE,
+    max_side=AUDIT_MAX_SIDE,
+    jpeg_quality=AUDIT_JPEG_QUALITY,
+    max_bytes=AUDIT_MAX_BYTES,
+    max_age_days=AUDIT_MAX_AGE_DAYS,
+    queue_size=AUDIT_QUEUE_SIZE,
+)
+
+def load_active_sessions(db: Session, now: datetime) -> list[dict]:
+    """Sessions with end_time >= now, class title joined in (one query)."""
+    rows = (
+        db.query(
+            DBSess.id, DBSess.class_id, Class.title, DBSess.session_date,
+            DBSess.start_time, DBSess.end_time, DBSess.is_active,
+        )
+        .outerjoin(Class, DBSess.class_id == Class.id)
+        .filter(DBSess.end_time >= now)
+        .order_by(DBSess.id)
+        .all()
+    )
+    return [{
+        "id": r.id,
+        "class_id": r.class_id,
+        "class_title": r.title,
+        "session_date": r.session_date.isoformat(),
+        "start_time": r.start_time.isoformat() if r.start_time else None,
+        "end_time": r.end_time,
+        "is_active": r.is_active,
+    } for r in rows]
+
+
+# Polled by every kiosk; invalidated by session / class writes below
+active_sessions = ActiveSessionCache(load_active_sessions, ttl=ACTIVE_SESSION_CACHE_TTL)
+
+
+def session_exists(db: Session, session_id: int) -> bool:
+    """Active sessions are answered from the cache, anything else from the DB."""
+    if active_sessions.is_active(db, session_id, datetime.utcnow()):
+        return True
+    return db.query(DBSess.id).filter_by(id=session_id).first() is not None
+
+
+# Name / semester per enrollment_no and "already marked" sets per session,
+# so a recognition needs no Student / Attendance reads
+student_directory = StudentDirectory(ttl=STUDENT_CACHE_TTL)
+marked_sessions = MarkedSessions(max_sessions=MARKED_SESSIONS_CACHE_SIZE)
+
+
+def warm_student_directory():
+    db = SessionLocal()
+    try:
+        student_directory.warm(db, gallery.ids())
+    finally:
+        db.close()
+
+
+def load_session_roster(db: Session, session_id: int) -> tuple[Optional[int], list[str]]:
+    """(class_id, roster enrollment_nos) of a session's class, one query."""
+    rows = (
+        db.query(DBSess.class_id, ClassEnrollment.enrollment_no)
+        .outerjoin(ClassEnrollment, ClassEnrollment.class_id == DBSess.class_id)
+        .filter(DBSess.id == session_id)
+        .all()
+    )
+    if not rows:
+        return None, []
+    return rows[0].class_id, [r.enrollment_no for r in rows if r.enrollment_no is not None]
+
+
+# Roster members' embeddings per recently used session; invalidated by the
+# roster endpoints and class deletes below
+rosters = RosterCache(load_session_roster, gallery, max_sessions=ROSTER_CACHE_SIZE, ttl=ROSTER_CACHE_TTL)
+
+
+def session_roster(db: Session, session_id: Optional[int]) -> Optional[RosterView]:
+    """Roster view to match against, or None for the full gallery."""
+    if session_id is None or not ROSTER_SCOPED_MATCHING:
+        return None
+    view = rosters.get(db, session_id)
+    if view is not None and len(view) == 0 and not ROSTER_FALLBACK_FULL_GALLERY:
+        raise HTTPException(status_code=400, detail="No enrolled students on this session's class roster")
+    return view
+
+
+def match_probes(view: Optional[RosterView], probes: np.ndarray) -> list[tuple[Optional[str], float]]:
+    """
+    Best match per probe: the roster if there is one, otherwise (or, with
+    ROSTER_FALLBACK_FULL_GALLERY, for probes no roster member matched) the
+    full gallery.
+    """
+    if view is None:
+        return gallery.search_many(probes)
+    out = view.search_many(probes)
+    if ROSTER_FALLBACK_FULL_GALLERY:
+        retry = [i for i, (_, score) in enumerate(out) if score < MATCH_THRESHOLD]
+        if retry:
+            for i, (sid, score) in zip(retry, gallery.search_many(probes[retry])):
+                if score > out[i][1]:
+                    out[i] = (sid, score)
+    return out
+
+
+def match_group(view: Optional[RosterView], embs: np.ndarray) -> list[tuple[Optional[str], float]]:
+    """match_probes for group photos: one-to-one assignment, roster first."""
+    if view is None:
+        return gallery.match_unique(embs, MATCH_THRESHOLD, GROUP_CANDIDATES_PER_FACE)
+    assigned = view.match_unique(embs, MATCH_THRESHOLD)
+    if ROSTER_FALLBACK_FULL_GALLERY:
+        left = [i for i, (sid, _) in enumerate(assigned) if sid is None]
+        if left:
+            taken = {sid for sid, _ in assigned if sid is not None}
+            fallback = gallery.match_unique(embs[left], MATCH_THRESHOLD, GROUP_CANDIDATES_PER_FACE)
+            for i, (sid, score) in zip(left, fallback):
+                if sid is not None and sid not in taken:
+                    assigned[i] = (sid, score)
+                    taken.add(sid)
+                elif score > assigned[i][1]:
+                    assigned[i] = (None, score)
+    return assigned
+
+
+# Optional write-behind for predictions_log (None = written in the request)
+prediction_log = None
+if PREDICTION_LOG_MODE == "buffered":
+    prediction_log = PredictionLogBuffer(
+        SessionLocal,
+        max_rows=PREDICTION_LOG_FLUSH_ROWS,
+        max_delay=PREDICTION_LOG_FLUSH_MS / 1000.0,
+        max_pending=PREDICTION_LOG_MAX_PENDING,
+    )
+
+# decode / detect / align / embed timings of /recognize probes
+probe_stages = StageStats()
+
+# Embedding (or "no face" error) per upload content hash, shared by
+# /recognize, /recognize/batch and /enroll
+embedding_cache = EmbeddingCache(max_entries=PROBE_CACHE_SIZE, ttl=PROBE_CACHE_TTL)
+
+
+async def embed_probe(content: bytes, digest: Optional[str] = None) -> np.ndarray:
+    """embed_uncached, answered from embedding_cache for bytes seen recently."""
+    return await embedding_cache.get_or_compute(digest or content_hash(content), lambda: embed_uncached(content))
+
+
+async def embed_uncached(content: bytes) -> np.ndarray:
+    """Detect + align on the pool, then embed through the micro-batcher."""
+    crop, timings = await inference.run(largest_face_crop_timed, content)
+    probe_stages.record_many(timings)
+    t0 = time.perf_counter()
+    if MICROBATCH_ENABLED:
+        emb = await batcher.submit(crop)
+    else:
+        emb = (await inference.run(embed_crops, [crop]))[0]
+    probe_stages.record("embed", time.perf_counter() - t0)
+    return emb
+
+
+@app.exception_handler(InferenceSaturated)
+async def inference_saturated_handler(request: Request, exc: InferenceSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(EngineUnavailable)
+async def engine_unavailable_handler(request: Request, exc: EngineUnavailable):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+# Readiness is separate from /health: models load lazily (first face request)
+# or in the background warm-up below, never at import time. "models" is set by
+# the warm-up for process pools, whose engines live in the worker processes.
+readiness = {"models": False, "error": None}
+
+
+async def warmup():
+    try:
+        await run_in_threadpool(len, gallery)   # open the packed store + index
+        await run_in_threadpool(warm_student_directory)
+        if LOAD_FACE_MODELS:
+            await inference.warm(warmup_engine)
+            readiness["models"] = True
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"Warning: warm-up failed: {e}")
+
+
+@app.on_event("startup")
+async def start_warmup():
+    audit.start()
+    if prediction_log is not None:
+        prediction_log.start()
+    if WARMUP_ON_STARTUP:
+        asyncio.get_running_loop().create_task(warmup())
+
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    # incremental ANN updates since the last rebuild are persisted on shutdown
+    gallery.save_index()
+    inference.shutdown()
+    await run_in_threadpool(audit.stop)   # bounded: drains queued audit images for up to 10s
+    if prediction_log is not None:
+        await run_in_threadpool(prediction_log.stop)   # flush buffered predictions_log rows
+    await dispose_async_engine()
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-@app.post("/enroll")
-async def enroll(
-    enrollment_no: str = Form(...),
-    name: str = Form(...),
-    semester: str = Form(...),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
-):
-    
-    # 0. Read file bytes once (we'll use it both for saving and for embedding)
-    content = await file.read()
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 once the gallery store is open and the face models
+    are loaded. CRUD-only processes (LOAD_FACE_MODELS=0) need no models, and
+    with WARMUP_ON_STARTUP=0 the models are loaded by the first face request,
+    so neither waits for them.
+    """
+    error = readiness["error"]
+    try:
+        len(gallery)   # opens the packed store if nothing has yet
+        gallery_ok = True
+    except Exception as e:
+        gallery_ok = False
+        error = str(e)
+
+    if not LOAD_FACE_MODELS:
+        face_models, models_ok = "disabled", True
+    elif engine_loaded() or readiness["models"]:
+        face_models, models_ok = "loaded", True
+    elif WARMUP_ON_STARTUP:
+        face_models, models_ok = "loading", False
+    else:
+        face_models, models_ok = "lazy", True
+    body = {
+        "ready": gallery_ok and models_ok,
+        "gallery_loaded": gallery_ok,
+        "face_models": face_models,
+        "error": error,
+    }
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+@app.get("/metrics")
+def metrics():
+    """Inference pool, micro-batching, per-stage probe timings, audit writer and caches."""
+    return {
+        "inference": inference.stats(),
+        "microbatch": batcher.stats(),
+        "probe_stages": probe_stages.snapshot(),
+        "audit": audit.stats(),
+        "active_sessions": active_sessions.stats(),
+        "students": student_directory.stats(),
+        "marked_sessions": marked_sessions.stats(),
+        "rosters": rosters.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "prediction_log": prediction_log.stats() if prediction_log is not None else {"mode": "sync"},
+        "db_pool": pool_status(),
+        "stream": stream_stats,
+    }
 
+def save_enrollment_image(db: Session, enrollment_no: str, name: str, semester: str,
+                          upload_name: str, content: bytes):
     # 1. Upsert student
     student = db.query(Student).filter_by(enrollment_no=enrollment_no).first()
     if not student:
@@ -156,34 +545,154 @@ async def enroll(
         db.refresh(student)
 
     # 2. Save uploaded image to RAW_DIR (project-wide raw images folder)
-    filename = f"{enrollment_no}_{file.filename}"
+    filename = f"{enrollment_no}_{upload_name}"
     file_path = os.path.join(RAW_DIR, filename)
     with open(file_path, "wb") as buffer:
         # shutil.copyfileobj(file.file, buffer)
         buffer.write(content)
 
-    # 3. Insert into student_images table
-    img = StudentImage(
-        enrollment_no=enrollment_no,
-        file_path=file_path
-    )
-    db.add(img)
-    db.commit()
-    db.refresh(img)
+    # 3. Insert into student_images table (the same upload sent again keeps its one row)
+    if db.query(StudentImage.id).filter_by(enrollment_no=enrollment_no, file_path=file_path).first() is None:
+        img = StudentImage(
+            enrollment_no=enrollment_no,
+            file_path=file_path
+        )
+        db.add(img)
+        db.commit()
 
-    # 4. Create / overwrite canonical embedding (.npy in data/enrollments)
+
+def merge_enrollment_embedding(enrollment_no: str, upload_name: str, emb: np.ndarray):
+    """
+    Adds one enrollment photo to the student's template instead of replacing
+    a fused multi-image template (make_canonical) with it. The student's
+    other raw images are what the existing template was built from.
+    """
+    filename = f"{enrollment_no}_{upload_name}"
+    existing = sum(1 for f in os.listdir(RAW_DIR) if f.startswith(enrollment_no + "_") and f != filename)
+    gallery.merge(enrollment_no, emb, existing)
+
+
+@app.post("/enroll")
+async def enroll(
+    enrollment_no: str = Form(...),
+    name: str = Form(...),
+    semester: str = Form(...),
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    
+    # 0. Read file bytes once (we'll use it both for saving and for embedding)
+    content = await file.read()
+
+    # 1. Embed before writing anything: a saturated pool answers 503 with
+    #    nothing saved, so the client's retry does not duplicate the upload.
+    #    A photo uploaded before (retry, or already used for recognition) is not re-embedded
+    emb = None
     try:
-        emb = get_face_embedding(content)  # normalized vector
-        out_path = canonical_path(enrollment_no)  # e.g. 22UCS001__canonical.npy
-        np.save(out_path, emb)
+        emb = await embedding_cache.get_or_compute(
+            content_hash(content), lambda: inference.run(get_face_embedding, content)
+        )  # normalized vector
+    except (InferenceSaturated, EngineUnavailable):
+        raise   # 503: nothing has been saved, the client can retry
     except Exception as e:
         # If you prefer failing hard when no face is detected, uncomment this:
         # raise HTTPException(status_code=400, detail=f"Could not create canonical embedding: {e}")
-        print(f"Warning: could not create canonical embedding for {enrollment_no}: {e}")
+        logger.warning("could not create canonical embedding for %s: %s", enrollment_no, e)
+
+    # 2. Upsert student, save the raw image and record it (sync DB/disk work off the loop)
+    await run_in_threadpool(save_enrollment_image, db, enrollment_no, name, semester, file.filename, content)
+
+    student_directory.invalidate(enrollment_no)
+
+    # 3. Fuse the photo into the canonical template (appended to the packed gallery)
+    if emb is not None:
+        await run_in_threadpool(merge_enrollment_embedding, enrollment_no, file.filename, emb)
 
     return {"status": "success", "message": "Student enrolled successfully"}
 
 
+def log_predictions(db: Session, rows: list[dict]):
+    """predictions_log rows go into the caller's transaction, or to the write-behind buffer."""
+    if prediction_log is not None:
+        prediction_log.add(rows)
+    elif rows:
+        db.execute(insert(PredictionLog), rows)
+
+
+def insert_attendance(db: Session, rows: list[dict]) -> set[str]:
+    """
+    Idempotent attendance insert: INSERT ... ON CONFLICT (enrollment_no,
+    session_id) DO NOTHING, so concurrent recognitions of the same student
+    cannot create duplicates. Returns the enrollment_nos actually inserted.
+    """
+    if not rows:
+        return set()
+    dialect_insert = sqlite.insert if db.get_bind().dialect.name == "sqlite" else postgresql.insert
+    stmt = (
+        dialect_insert(Attendance)
+        .on_conflict_do_nothing(index_elements=["enrollment_no", "session_id"])
+        .returning(Attendance.enrollment_no)
+    )
+    return set(db.scalars(stmt, rows).all())
+
+
+def record_recognition(db: Session, now: datetime, probe_path: str, enrollment_no: str,
+                       best_score: float, session_id: Optional[int]) -> bool:
+    """
+    Writes the predictions_log row for one recognition attempt and, on a
+    match with a valid session, the attendance row. Returns is_match.
+    """
+    THRESH = MATCH_THRESHOLD  # tune via MATCH_THRESHOLD in .env
+
+    # 4. Look up student (cached name / semester; enrollment_no is stored as string)
+    student = student_directory.get(db, enrollment_no) if best_score >= THRESH else None
+
+    # 5. Decide match / no match status
+    is_match = best_score >= THRESH and student is not None
+    status = "MATCH" if is_match else "NO_MATCH"
+
+    # 6. Log into predictions_log (request transaction or write-behind buffer)
+    log_predictions(db, [{
+        "attempted_at": now,
+        "image_path": probe_path,
+        "predicted_enrollment": enrollment_no if best_score >= THRESH else None,
+        "predicted_name": student.name if (student and best_score >= THRESH) else None,
+        "confidence": best_score,
+        "status": status,
+        "note": None,
+    }])
+
+    # 7. If match and session_id provided, mark attendance
+    mark = bool(
+        is_match and session_id is not None
+        and marked_sessions.filter_unmarked(session_id, [enrollment_no])   # already marked: nothing to write
+        and session_exists(db, session_id)   # verify that the session exists (cached for active sessions)
+    )
+    if mark:
+        # A mark made by another worker is skipped by the unique
+        # (enrollment_no, session_id) constraint, not by a lookup
+        insert_attendance(db, [{
+            "enrollment_no": enrollment_no,
+            "name_at_time": student.name,
+            "semester_at_time": student.semester,
+            "date": now.date(),
+            "time": now.time().replace(microsecond=0),
+            "timestamp": now,
+            "confidence": best_score,
+            "image_path": probe_path,
+            "model_id": None,         # you can set this if you insert a row in model_info
+            "session_id": session_id,
+        }])
+    # else: no match, already marked or invalid session_id → we still log prediction, but skip attendance
+
+    # 8. Commit DB changes (prediction log, and maybe attendance)
+    db.commit()
+    if mark:
+        marked_sessions.add(session_id, [enrollment_no])
+
+    return is_match
+
+
 @app.post("/recognize")
 async def recognize(
     file: UploadFile = File(...),
@@ -196,8 +705,9 @@ async def recognize(
     db: Session = Depends(get_db)             # DB session
 ):
     """
-    Recognizes the face in the uploaded image by comparing to all canonical
-    embeddings and returning the best match if above threshold.
+    Recognizes the face in the uploaded image by comparing to the canonical
+    embeddings (only the class roster's when session_id's class has one) and
+    returning the best match if above threshold.
 
     Also:
     - Logs every attempt in predictions_log
@@ -208,97 +718,35 @@ async def recognize(
     session_id = session_id_query if session_id_query is not None else session_id_form
 
     # 0. Check that we have enrolled embeddings
-    if not os.listdir(ENROLL_DIR):
+    if len(gallery) == 0:
         raise HTTPException(status_code=400, detail="No enrolled students yet")
 
-    # 1. Read file bytes and save probe image to disk (for logging/audit)
+    # 1. Read file bytes and queue the probe image for the audit writer
     content = await file.read()
     now = datetime.now()
-    ts_str = now.strftime("%Y%m%d_%H%M%S")
-    probe_filename = f"{ts_str}_{file.filename}"
-    probe_path = os.path.join(PREDICTIONS_DIR, probe_filename)
-    with open(probe_path, "wb") as f:
-        f.write(content)
+    digest = content_hash(content)
+    probe_path = audit.submit(content, digest)
 
-    # 2. Get embedding from the uploaded image
+    # 2. Get embedding from the uploaded image (cached by content hash for retries)
     try:
-        probe = get_face_embedding(content)  # normalized
+        probe = await embed_probe(content, digest)  # normalized
     except ValueError as e:
         # Optionally: log a failed prediction attempt here as well
         raise HTTPException(status_code=400, detail=str(e))
 
-    # 3. Load all canonical embeddings
-    student_ids: list[str] = []
-    vecs = []
-    for fname in os.listdir(ENROLL_DIR):
-        if fname.endswith("__canonical.npy"):
-            sid = fname.split("__")[0]
-            v = np.load(os.path.join(ENROLL_DIR, fname))
-            student_ids.append(sid)
-            vecs.append(v)
-
-    if not vecs:
+    # 3. Score against the session's class roster, or the whole in-memory gallery
+    view = await run_in_threadpool(session_roster, db, session_id)
+    if view is None:
+        best_student, best_score = await run_in_threadpool(gallery.search, probe)   # best_student is the enrollment_no
+    else:
+        best_student, best_score = (await run_in_threadpool(match_probes, view, probe.reshape(1, -1)))[0]
+    if best_student is None:
         raise HTTPException(status_code=400, detail="No canonical embeddings found")
 
-    vecs = np.vstack(vecs)              # shape (N, D)
-    scores = vecs.dot(probe)            # cosine similarities (since vectors are normalized)
-    best_idx = int(scores.argmax())
-    best_score = float(scores[best_idx])
-    best_student = student_ids[best_idx]   # this is your "student_id" from file naming
-
-    THRESH = 0.65  # tune this later
-
-    # 4. Look up student in DB (enrollment_no is stored as string)
-    enrollment_no = best_student
-    student = db.query(Student).filter_by(enrollment_no=enrollment_no).first()
-
-    # 5. Decide match / no match status
-    is_match = best_score >= THRESH and student is not None
-    status = "MATCH" if is_match else "NO_MATCH"
-
-    # 6. Log into predictions_log
-    log_entry = PredictionLog(
-        attempted_at=now,
-        image_path=probe_path,
-        predicted_enrollment=enrollment_no if best_score >= THRESH else None,
-        predicted_name=student.name if (student and best_score >= THRESH) else None,
-        confidence=best_score,
-        status=status,
-        note=None
+    # 4-8. Log the attempt and maybe mark attendance (sync DB work, off the loop)
+    is_match = await run_in_threadpool(
+        record_recognition, db, now, probe_path, best_student, best_score, session_id
     )
-    db.add(log_entry)
-
-    # 7. If match and session_id provided, mark attendance
-    if is_match and session_id is not None:
-        # Optional: verify that the session exists
-        session_obj = db.query(DBSess).filter_by(id=session_id).first()
-
-        if session_obj is not None:
-            # Check if attendance already exists for this student in this session
-            existing_att = (
-                db.query(Attendance)
-                .filter_by(enrollment_no=enrollment_no, session_id=session_id)
-                .first()
-            )
-
-            if existing_att is None:
-                attendance_row = Attendance(
-                    enrollment_no=enrollment_no,
-                    name_at_time=student.name,
-                    semester_at_time=student.semester,
-                    date=now.date(),
-                    time=now.time().replace(microsecond=0),
-                    timestamp=now,
-                    confidence=best_score,
-                    image_path=probe_path,
-                    model_id=None,         # you can set this if you insert a row in model_info
-                    session_id=session_id,
-                )
-                db.add(attendance_row)
-        # else: session_id was invalid → we still log prediction, but skip attendance
-
-    # 8. Commit DB changes (prediction log, and maybe attendance)
-    db.commit()
 
     # 9. Return response compatible with your previous version
     if is_match:
@@ -306,7 +754,7 @@ async def recognize(
             "match": True,
             "student_id": best_student,      # same as before
             "score": best_score,
-            "enrollment_no": enrollment_no,
+            "enrollment_no": best_student,
             "logged": True
         }
     else:
@@ -318,16 +766,516 @@ async def recognize(
         }
 
 
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def read_zip_images(content: bytes, max_images: int) -> list[tuple[str, bytes]]:
+    """
+    Returns (filename, bytes) for every image member of a zip archive.
+    The member count and declared uncompressed sizes are checked against the
+    limits before any member is inflated (zip bombs are rejected with 413).
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+    out = []
+    with zf:
+        members = [info for info in zf.infolist()
+                   if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTS)]
+        if len(members) > max_images:
+            raise HTTPException(
+                status_code=413,
+                detail=f"archive holds {len(members)} images, but only {max_images} more fit in this batch "
+                       f"(at most {MAX_BATCH_IMAGES} images per batch)",
+            )
+        if sum(info.file_size for info in members) > MAX_BATCH_ARCHIVE_BYTES:
+            raise HTTPException(status_code=413, detail="archive is too large once uncompressed")
+        for info in members:
+            out.append((os.path.basename(info.filename), zf.read(info)))
+    return out
+
+
+@app.post("/recognize/batch")
+async def recognize_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),   # alternatively: one zip of images
+    session_id_query: Optional[int] = None,
+    session_id_form: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Recognizes many probe images in one call (classroom photo sets, catch-up
+    after offline capture).
+
+    - Images come as repeated `files` parts and/or one zip `archive`
+    - Faces are detected per image, then embedded with one batched model pass
+    - All probes are scored against the gallery with one matrix-matrix product
+    - All predictions_log rows (and attendance rows, if session_id is given)
+      are written with bulk inserts in a single commit
+
+    Returns one result per image, in upload order.
+    """
+    session_id = session_id_query if session_id_query is not None else session_id_form
+
+    if len(gallery) == 0:
+        raise HTTPException(status_code=400, detail="No enrolled students yet")
+
+    # 1. Collect (filename, bytes) for every probe
+    items: list[tuple[str, bytes]] = []
+    for f in files or []:
+        items.append((f.filename, await f.read()))
+    if len(items) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_IMAGES} images per batch")
+    if archive is not None:
+        # the archive gets whatever the loose files left of the per-batch limit
+        items.extend(read_zip_images(await archive.read(), MAX_BATCH_IMAGES - len(items)))
+    if not items:
+        raise HTTPException(status_code=400, detail="No images uploaded")
+
+    # 2. Queue probes for audit (content-hash names, identical images stored once)
+    now = datetime.now()
+    digests = [content_hash(content) for _, content in items]
+    probe_paths = [audit.submit(content, digest) for (_, content), digest in zip(items, digests)]
+
+    # 3. Detect per image, embed all faces in one batch (images embedded recently come from the cache)
+    embs: list = [None] * len(items)
+    todo = []
+    for i, digest in enumerate(digests):
+        found, value = embedding_cache.lookup(digest) if embedding_cache.enabled else (False, None)
+        if found:
+            embs[i] = value
+        else:
+            todo.append(i)
+    if todo:
+        computed = await inference.run(get_face_embeddings_batch, [items[i][1] for i in todo])
+        for i, value in zip(todo, computed):
+            embs[i] = value
+            embedding_cache.put(digests[i], value)
+    ok_idx = [i for i, e in enumerate(embs) if not isinstance(e, Exception)]
+
+    # 4. Score every probe at once (against the class roster if the session's class has one)
+    matches: dict[int, tuple[Optional[str], float]] = {}
+    if ok_idx:
+        view = await run_in_threadpool(session_roster, db, session_id)
+        probes = np.vstack([embs[i] for i in ok_idx])
+        for i, m in zip(ok_idx, await run_in_threadpool(match_probes, view, probes)):
+            matches[i] = m
+
+    # 5-7. DB work runs off the loop
+    return await run_in_threadpool(
+        persist_batch_results, db, now, session_id, items, probe_paths, embs, matches
+    )
+
+
+def persist_batch_results(db: Session, now: datetime, session_id: Optional[int], items: list,
+                          probe_paths: list[str], embs: list, matches: dict) -> dict:
+    # 5. Candidate students (cached, one query for any misses) and the session
+    candidate_ids = {sid for sid, score in matches.values() if sid is not None and score >= MATCH_THRESHOLD}
+    students = student_directory.get_many(db, candidate_ids) if candidate_ids else {}
+
+    session_ok = False
+    unmarked: set[str] = set()
+    if session_id is not None and students:
+        session_ok = session_exists(db, session_id)
+        unmarked = set(marked_sessions.filter_unmarked(session_id, list(students)))
+
+    # 6. Build results + bulk rows
+    log_rows = []
+    att_rows: dict[str, dict] = {}   # one attendance row per student, best score wins
+    results = []
+    for i, (fname, _) in enumerate(items):
+        if i not in matches:
+            err = embs[i]
+            log_rows.append({
+                "attempted_at": now, "image_path": probe_paths[i], "predicted_enrollment": None,
+                "predicted_name": None, "confidence": None, "status": "NO_FACE", "note": str(err),
+            })
+            results.append({"filename": fname, "match": False, "student_id": None, "error": str(err)})
+            continue
+
+        sid, score = matches[i]
+        student = students.get(sid) if score >= MATCH_THRESHOLD else None
+        is_match = student is not None
+        log_rows.append({
+            "attempted_at": now,
+            "image_path": probe_paths[i],
+            "predicted_enrollment": sid if score >= MATCH_THRESHOLD else None,
+            "predicted_name": student.name if student else None,
+            "confidence": score,
+            "status": "MATCH" if is_match else "NO_MATCH",
+            "note": None,
+        })
+
+        if is_match and session_ok and sid in unmarked:
+            prev = att_rows.get(sid)
+            if prev is None or score > prev["confidence"]:
+                att_rows[sid] = {
+                    "enrollment_no": sid,
+                    "name_at_time": student.name,
+                    "semester_at_time": student.semester,
+                    "date": now.date(),
+                    "time": now.time().replace(microsecond=0),
+                    "timestamp": now,
+                    "confidence": score,
+                    "image_path": probe_paths[i],
+                    "model_id": None,
+                    "session_id": session_id,
+                }
+
+        if is_match:
+            results.append({"filename": fname, "match": True, "student_id": sid,
+                            "score": score, "enrollment_no": sid})
+        else:
+            results.append({"filename": fname, "match": False, "student_id": None, "best_score": score})
+
+    # 7. Bulk insert everything in one transaction (already-marked students are skipped)
+    log_predictions(db, log_rows)
+    marked = insert_attendance(db, list(att_rows.values()))
+    db.commit()
+    if att_rows:
+        marked_sessions.add(session_id, att_rows.keys())
+
+    return {
+        "count": len(items),
+        "matched": sum(1 for r in results if r["match"]),
+        "attendance_marked": len(marked),
+        "logged": True,
+        "results": results,
+    }
+
+
+@app.post("/recognize/group")
+async def recognize_group(
+    file: UploadFile = File(...),
+    session_id_query: Optional[int] = None,
+    session_id_form: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Group-photo mode: one classroom image marks the whole session.
+
+    - Every detected face is embedded in one batched pass
+    - Faces are assigned to students one-to-one (no student matched twice)
+    - All matches above threshold get attendance for session_id, together
+      with one predictions_log row per face, in one transaction
+    """
+    session_id = session_id_query if session_id_query is not None else session_id_form
+    if session_id is None:
+        raise HTTPException(status_code=400, detail="session_id is required for group recognition")
+
+    if len(gallery) == 0:
+        raise HTTPException(status_code=400, detail="No enrolled students yet")
+
+    if not await run_in_threadpool(session_exists, db, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    # 1. Queue the photo once for audit
+    content = await file.read()
+    now = datetime.now()
+    probe_path = audit.submit(content)
+
+    # 2. Detect + embed every face
+    try:
+        bboxes, embs = await inference.run(get_all_face_embeddings, content, min_score=GROUP_MIN_DET_SCORE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(embs) == 0:
+        raise HTTPException(status_code=400, detail="No face detected")
+
+    # 3. One-to-one assignment against the class roster (or the whole gallery)
+    view = await run_in_threadpool(session_roster, db, session_id)
+    assigned = await run_in_threadpool(match_group, view, embs)
+
+    # 4-6. DB work runs off the loop
+    return await run_in_threadpool(persist_group_results, db, now, session_id, probe_path, bboxes, assigned)
+
+
+def persist_group_results(db: Session, now: datetime, session_id: int, probe_path: str,
+                          bboxes: np.ndarray, assigned: list) -> dict:
+    # 4. Matched students (cached) and which of them are not known to be marked yet
+    matched_ids = {sid for sid, _ in assigned if sid is not None}
+    students = student_directory.get_many(db, matched_ids) if matched_ids else {}
+    unmarked = set(marked_sessions.filter_unmarked(session_id, list(students)))
+
+    # 5. Build rows
+    log_rows = []
+    att_rows = []
+    faces = []
+    for i, (sid, score) in enumerate(assigned):
+        x1, y1, x2, y2, det_score = (float(v) for v in bboxes[i])
+        student = students.get(sid) if sid is not None else None
+        log_rows.append({
+            "attempted_at": now,
+            "image_path": probe_path,
+            "predicted_enrollment": sid if student else None,
+            "predicted_name": student.name if student else None,
+            "confidence": score,
+            "status": "MATCH" if student else "NO_MATCH",
+            "note": f"group face {i}",
+        })
+        if student is not None and sid in unmarked:
+            att_rows.append({
+                "enrollment_no": sid,
+                "name_at_time": student.name,
+                "semester_at_time": student.semester,
+                "date": now.date(),
+                "time": now.time().replace(microsecond=0),
+                "timestamp": now,
+                "confidence": score,
+                "image_path": probe_path,
+                "model_id": None,
+                "session_id": session_id,
+            })
+        faces.append({
+            "bbox": [x1, y1, x2, y2],
+            "det_score": det_score,
+            "match": student is not None,
+            "student_id": sid if student else None,
+            "score": score,
+        })
+
+    # 6. One transaction for everything (already-marked students are skipped)
+    log_predictions(db, log_rows)
+    marked = insert_attendance(db, att_rows)
+    db.commit()
+    if att_rows:
+        marked_sessions.add(session_id, [row["enrollment_no"] for row in att_rows])
+    for face in faces:
+        face["newly_marked"] = face["student_id"] in marked
+
+    return {
+        "session_id": session_id,
+        "faces_detected": len(faces),
+        "matched": sum(1 for f in faces if f["match"]),
+        "attendance_marked": len(marked),
+        "faces": faces,
+    }
+
+
+# Counters for /ws/recognize/stream ("embeddings" vs "faces" shows what tracking saves)
+stream_stats = {"active": 0, "connections": 0, "frames": 0, "dropped": 0, "busy": 0,
+                "faces": 0, "tracks": 0, "embeddings": 0, "matches": 0}
+
+
+def persist_stream_matches(session_id: int, now: datetime, probe_path: str, embs: np.ndarray) -> list[dict]:
+    """
+    Matches the faces embedded in one frame (one-to-one, roster first) and
+    writes their predictions_log rows and attendance in one transaction.
+    Returns per face {student_id, name, score, match, newly_marked}.
+    """
+    db = SessionLocal()
+    try:
+        view = session_roster(db, session_id)
+        assigned = match_group(view, embs)
+        matched_ids = {sid for sid, _ in assigned if sid is not None}
+        students = student_directory.get_many(db, matched_ids) if matched_ids else {}
+        unmarked = set(marked_sessions.filter_unmarked(session_id, list(students)))
+
+        log_rows = []
+        att_rows = []
+        faces = []
+        for sid, score in assigned:
+            student = students.get(sid) if sid is not None else None
+            log_rows.append({
+                "attempted_at": now,
+                "image_path": probe_path,
+                "predicted_enrollment": sid if student else None,
+                "predicted_name": student.name if student else None,
+                "confidence": score,
+                "status": "MATCH" if student else "NO_MATCH",
+                "note": "stream",
+            })
+            if student is not None and sid in unmarked:
+                att_rows.append({
+                    "enrollment_no": sid,
+                    "name_at_time": student.name,
+                    "semester_at_time": student.semester,
+                    "date": now.date(),
+                    "time": now.time().replace(microsecond=0),
+                    "timestamp": now,
+                    "confidence": score,
+                    "image_path": probe_path,
+                    "model_id": None,
+                    "session_id": session_id,
+                })
+            faces.append({
+                "student_id": sid if student else None,
+                "name": student.name if student else None,
+                "score": score,
+                "match": student is not None,
+            })
+
+        log_predictions(db, log_rows)
+        marked = insert_attendance(db, att_rows)
+        db.commit()
+        if att_rows:
+            marked_sessions.add(session_id, [row["enrollment_no"] for row in att_rows])
+        for face in faces:
+            face["newly_marked"] = face["student_id"] in marked
+        return faces
+    finally:
+        db.close()
+
+
+def check_stream_session(session_id: int) -> Optional[str]:
+    """Error message if frames for session_id cannot be recognized, else None."""
+    db = SessionLocal()
+    try:
+        if not session_exists(db, session_id):
+            return "Session not found"
+        session_roster(db, session_id)   # raises for an empty roster
+        return None
+    except HTTPException as e:
+        return e.detail
+    finally:
+        db.close()
+
+
+@app.websocket("/ws/recognize/stream")
+async def recognize_stream(websocket: WebSocket, session_id: int):
+    """
+    Live camera recognition for one session.
+
+    The client sends encoded frames (JPEG/PNG) as binary messages. Every face
+    is detected per frame and tracked across frames, but embedded only when
+    its track is new (or, while still unmatched, every
+    STREAM_EMBED_REFRESH_SECS). The server sends JSON messages:
+
+    - {"type": "ready"} once the session is validated
+    - {"type": "match", ...} when a track is recognized (attendance is marked
+      as in /recognize/group); {"type": "no_match", ...} after a track's
+      first unsuccessful attempt
+    - {"type": "tracks", "frame": n, "tracks": [...]} after every processed frame
+    - {"type": "error", "detail": ...} for a bad frame; the stream continues
+
+    Only the newest frame is processed: frames that arrive while the previous
+    one is in flight are dropped, so a slow server never falls behind the camera.
+    """
+    await websocket.accept()
+    error = "No enrolled students yet" if len(gallery) == 0 else await run_in_threadpool(check_stream_session, session_id)
+    if error is not None:
+        await websocket.send_json({"type": "error", "detail": error})
+        await websocket.close(code=1008)
+        return
+
+    tracker = FaceTracker(iou_threshold=STREAM_IOU_THRESHOLD, max_missed=STREAM_MAX_MISSED_FRAMES)
+    pending = {"frame": None, "closed": False}
+    arrived = asyncio.Event()
+
+    async def receive_frames():
+        # 1. Keep only the newest frame; older unprocessed ones are dropped
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is None:
+                    continue   # text messages are ignored
+                if pending["frame"] is not None:
+                    stream_stats["dropped"] += 1
+                pending["frame"] = frame
+                arrived.set()
+        finally:
+            pending["closed"] = True
+            arrived.set()
+
+    stream_stats["active"] += 1
+    stream_stats["connections"] += 1
+    receiver = asyncio.get_running_loop().create_task(receive_frames())
+    frame_no = 0
+    try:
+        await websocket.send_json({"type": "ready", "session_id": session_id})
+        while True:
+            await arrived.wait()
+            arrived.clear()
+            if pending["closed"]:
+                break
+            frame, pending["frame"] = pending["frame"], None
+            if frame is None:
+                continue
+            frame_no += 1
+            if len(frame) > STREAM_MAX_FRAME_BYTES:
+                await websocket.send_json({"type": "error", "frame": frame_no, "detail": "Frame too large"})
+                continue
+
+            # 2. Detect + align every face on the pool (a saturated pool skips the frame)
+            try:
+                bboxes, crops = await inference.run(
+                    detect_and_align, frame, STREAM_MIN_DET_SCORE, None, STREAM_MIN_FACE_PX
+                )
+            except InferenceSaturated:
+                stream_stats["busy"] += 1
+                continue
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "frame": frame_no, "detail": str(e)})
+                continue
+            stream_stats["frames"] += 1
+            stream_stats["faces"] += len(crops)
+
+            # 3. Associate detections with tracks
+            now = time.monotonic()
+            tracks_before = tracker.created
+            seen = tracker.update(bboxes, now)
+            stream_stats["tracks"] += tracker.created - tracks_before
+            due = [(track, i) for track, i in seen if track.due_for_embedding(now, STREAM_EMBED_REFRESH_SECS)]
+
+            # 4. Embed only new / still unidentified tracks, then match and persist
+            if due:
+                try:
+                    if MICROBATCH_ENABLED:
+                        embs = np.vstack(await asyncio.gather(*(batcher.submit(crops[i]) for _, i in due)))
+                    else:
+                        embs = await inference.run(embed_crops, [crops[i] for _, i in due])
+                except InferenceSaturated:
+                    stream_stats["busy"] += 1
+                    continue   # the tracks stay due and are embedded on a later frame
+                stream_stats["embeddings"] += len(due)
+
+                probe_path = audit.submit(frame)
+                faces = await run_in_threadpool(persist_stream_matches, session_id, datetime.now(), probe_path, embs)
+                for (track, _), face in zip(due, faces):
+                    track.embedded_at = now
+                    track.embeddings += 1
+                    track.score = face["score"]
+                    event = {"track_id": track.id, "frame": frame_no, "score": face["score"],
+                             "bbox": [float(v) for v in track.bbox]}
+                    if face["match"]:
+                        track.student_id = face["student_id"]
+                        stream_stats["matches"] += 1
+                        await websocket.send_json({"type": "match", **event, "student_id": face["student_id"],
+                                                   "name": face["name"], "newly_marked": face["newly_marked"]})
+                    elif track.embeddings == 1:
+                        await websocket.send_json({"type": "no_match", **event})
+
+            # 5. Every face in this frame with its track identity
+            await websocket.send_json({"type": "tracks", "frame": frame_no,
+                                       "tracks": [track.to_dict() for track, _ in seen]})
+    except HTTPException as e:   # e.g. the class roster was emptied mid-stream
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=1008)
+    except EngineUnavailable as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1011)
+    except (WebSocketDisconnect, OSError):
+        pass   # client went away mid-send (uvicorn raises ClientDisconnected, an OSError)
+    finally:
+        stream_stats["active"] -= 1
+        receiver.cancel()
+
 # ---------------------------
 # New endpoints for frontend flows
 # ---------------------------
 
 @app.get("/faculty/{faculty_id}/classes")
-def get_classes_for_faculty(faculty_id: str, db: Session = Depends(get_db)):
+async def get_classes_for_faculty(faculty_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Returns classes for a given faculty (used to populate dropdown)
     """
-    classes = db.query(Class).filter(Class.faculty_id == faculty_id).all()
+    classes = (
+        await db.execute(select(Class.id, Class.title, Class.course_code).where(Class.faculty_id == faculty_id))
+    ).all()
     out = []
     for c in classes:
         out.append({
@@ -364,6 +1312,7 @@ def create_session(class_id: int, start_time: str, end_time: str, db: Session =
     db.add(sess)
     db.commit()
     db.refresh(sess)
+    active_sessions.invalidate()
     return {
         "id": sess.id,
         "class_id": sess.class_id,
@@ -375,29 +1324,25 @@ def create_session(class_id: int, start_time: str, end_time: str, db: Session =
 
 
 @app.get("/sessions/active")
-def get_active_sessions(db: Session = Depends(get_db)):
+def get_active_sessions(request: Request, db: Session = Depends(get_db)):
     """
     Returns sessions whose end_time is >= now (UTC)
+
+    Served from an in-memory cache. The response carries an ETag; a poll
+    with a matching If-None-Match gets an empty 304.
     """
-    now = datetime.utcnow()
-    sessions = db.query(DBSess).filter(DBSess.end_time >= now).all()
-    out = []
-    for s in sessions:
-        out.append({
-            "id": s.id,
-            "class_id": s.class_id,
-            "class_title": s.class_ref.title if s.class_ref else None,
-            "session_date": s.session_date.isoformat(),
-            "start_time": s.start_time.isoformat() if s.start_time else None,
-            "end_time": s.end_time.isoformat() if s.end_time else None,
-            "is_active": s.is_active
-        })
-    return out
+    out, etag = active_sessions.get(db, datetime.utcnow())
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=out, headers=headers)
 
 
 @app.get("/students/{enrollment_no}")
-def get_student(enrollment_no: str, db: Session = Depends(get_db)):
-    student = db.query(Student).filter(Student.enrollment_no == enrollment_no).first()
+async def get_student(enrollment_no: str, db: AsyncSession = Depends(get_async_db)):
+    student = (
+        await db.execute(select(Student).where(Student.enrollment_no == enrollment_no))
+    ).scalar_one_or_none()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return {
@@ -409,61 +1354,193 @@ def get_student(enrollment_no: str, db: Session = Depends(get_db)):
 
 
 @app.get("/students/{enrollment_no}/attendance")
-def get_student_attendance(enrollment_no: str, db: Session = Depends(get_db)):
-    rows = (
-        db.query(Attendance, DBSess, Class)
+def get_student_attendance(
+    enrollment_no: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Attendance history of one student.
+    Without limit: the full list. With limit: {"items", "next_cursor"}; pass
+    next_cursor back as cursor for the following page.
+    """
+    query = (
+        db.query(
+            Attendance.id.label("attendance_id"),
+            Class.id.label("class_id"),
+            Class.title.label("class_title"),
+            DBSess.id.label("session_id"),
+            Attendance.date,
+            Attendance.time,
+            Attendance.confidence,
+        )
         .join(DBSess, Attendance.session_id == DBSess.id)
         .join(Class, DBSess.class_id == Class.id)
         .filter(Attendance.enrollment_no == enrollment_no)
-        .all()
     )
-    out = []
-    for att, sess, cls in rows:
-        out.append({
-            "attendance_id": att.id,
-            "class_id": cls.id,
-            "class_title": cls.title,
-            "session_id": sess.id,
-            "date": att.date.isoformat(),
-            "time": att.time.isoformat(),
-            "confidence": att.confidence,
-        })
-    return out
+
+    def to_dict(r):
+        return {
+            "attendance_id": r.attendance_id,
+            "class_id": r.class_id,
+            "class_title": r.class_title,
+            "session_id": r.session_id,
+            "date": r.date.isoformat(),
+            "time": r.time.isoformat(),
+            "confidence": r.confidence,
+        }
+
+    return list_or_page(query, Attendance.id, limit, cursor, to_dict, PAGE_MAX_LIMIT, key_attr="attendance_id")
 
 
 @app.get("/faculty/{faculty_id}/classes_with_stats")
-def get_classes_with_stats(faculty_id: str, db: Session = Depends(get_db)):
+def get_classes_with_stats(
+    faculty_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+):
     """
     Returns classes for a faculty with session-wise present counts and a percentage.
-    Percentage currently computed as (sum of present counts across sessions) / total_students.
+
+    - date_from / date_to (YYYY-MM-DD, inclusive) restrict the sessions by session_date
+    - limit / offset page through the classes (ordered by class id)
+    - percentage = present_total / (enrolled * number of sessions), i.e. the
+      average share of the class present per session. "enrolled" is the size
+      of the class roster; a class without a roster has no meaningful
+      denominator, so its percentage is None.
+
+    Three queries in total, however many classes and sessions there are.
     """
-    classes = db.query(Class).filter(Class.faculty_id == faculty_id).all()
-    total_students = db.query(Student).count()  # simplified denominator
+    # 1. Classes (one page)
+    classes_q = db.query(Class.id, Class.title).filter(Class.faculty_id == faculty_id).order_by(Class.id)
+    if offset:
+        classes_q = classes_q.offset(offset)
+    if limit is not None:
+        classes_q = classes_q.limit(limit)
+    classes = classes_q.all()
+    if not classes:
+        return []
+    class_ids = [c.id for c in classes]
+
+    # 2. Sessions with their present counts, one grouped outer join
+    present = func.count(Attendance.id)
+    sessions_q = (
+        db.query(DBSess.id, DBSess.class_id, DBSess.start_time, DBSess.end_time, present)
+        .outerjoin(Attendance, Attendance.session_id == DBSess.id)
+        .filter(DBSess.class_id.in_(class_ids))
+    )
+    if date_from is not None:
+        sessions_q = sessions_q.filter(DBSess.session_date >= date_from)
+    if date_to is not None:
+        sessions_q = sessions_q.filter(DBSess.session_date <= date_to)
+    sessions_q = sessions_q.group_by(DBSess.id, DBSess.class_id, DBSess.start_time, DBSess.end_time).order_by(DBSess.id)
+
+    sessions_by_class: dict[int, list] = {cid: [] for cid in class_ids}
+    for sid, cid, start_time, end_time, present_count in sessions_q:
+        sessions_by_class[cid].append({
+            "session_id": sid,
+            "start_time": start_time.isoformat() if start_time else None,
+            "end_time": end_time.isoformat() if end_time else None,
+            "present_count": present_count,
+        })
+
+    # 3. Per-class denominator: roster size
+    enrolled = dict(
+        db.query(ClassEnrollment.class_id, func.count(ClassEnrollment.id))
+        .filter(ClassEnrollment.class_id.in_(class_ids))
+        .group_by(ClassEnrollment.class_id)
+        .all()
+    )
+
     result = []
     for cls in classes:
-        sessions = db.query(DBSess).filter(DBSess.class_id == cls.id).all()
-        sessions_out = []
-        class_present_count = 0
-        for s in sessions:
-            present_count = db.query(Attendance).filter(Attendance.session_id == s.id).count()
-            sessions_out.append({
-                "session_id": s.id,
-                "start_time": s.start_time.isoformat() if s.start_time else None,
-                "end_time": s.end_time.isoformat() if s.end_time else None,
-                "present_count": present_count,
-            })
-            class_present_count += present_count
-        percentage = (class_present_count / total_students * 100) if total_students > 0 else None
+        sessions_out = sessions_by_class[cls.id]
+        class_present_count = sum(s["present_count"] for s in sessions_out)
+        class_students = enrolled.get(cls.id, 0)
+        possible = class_students * len(sessions_out)
+        percentage = (class_present_count / possible * 100) if possible > 0 else None
         result.append({
             "class_id": cls.id,
             "title": cls.title,
             "sessions": sessions_out,
             "present_total": class_present_count,
+            "enrolled": class_students,
             "percentage": round(percentage, 2) if percentage is not None else None,
         })
     return result
 
 
+def export_response(fmt: str, name: str, class_id: Optional[int] = None, session_id: Optional[int] = None,
+                    date_from: Optional[date] = None, date_to: Optional[date] = None) -> StreamingResponse:
+    stmt = attendance_query(class_id=class_id, session_id=session_id, date_from=date_from, date_to=date_to)
+    if fmt == "csv":
+        body, media_type = iter_csv(stmt, EXPORT_CHUNK_ROWS), "text/csv"
+    elif fmt == "parquet":
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow (pip install pyarrow)")
+        body, media_type = iter_parquet(stmt, EXPORT_CHUNK_ROWS), "application/vnd.apache.parquet"
+    else:
+        raise HTTPException(status_code=400, detail="format must be csv or parquet")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+@app.get("/attendance/export")
+def export_attendance(
+    class_id: Optional[int] = None,
+    session_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    format: str = "csv",
+):
+    """
+    Streams attendance rows as CSV (default) or Parquet (format=parquet).
+
+    All filters are optional and combine: class_id, session_id and an
+    inclusive date_from / date_to range (YYYY-MM-DD) on the attendance date.
+    Rows come from a server-side cursor, so memory use does not grow with
+    the size of the export.
+    """
+    parts = ["attendance"]
+    if class_id is not None:
+        parts.append(f"class{class_id}")
+    if session_id is not None:
+        parts.append(f"session{session_id}")
+    if date_from is not None or date_to is not None:
+        parts.append(f"{date_from or ''}_{date_to or ''}")
+    return export_response(format, "_".join(parts), class_id, session_id, date_from, date_to)
+
+
+@app.get("/classes/{class_id}/attendance/export")
+def export_class_attendance(
+    class_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    format: str = "csv",
+    db: Session = Depends(get_db),
+):
+    """Attendance of every session of one class, optionally within a date range."""
+    if db.query(Class.id).filter_by(id=class_id).first() is None:
+        raise HTTPException(status_code=404, detail="Class not found")
+    return export_response(format, f"attendance_class{class_id}", class_id=class_id,
+                           date_from=date_from, date_to=date_to)
+
+
+@app.get("/sessions/{session_id}/attendance/export")
+def export_session_attendance(session_id: int, format: str = "csv", db: Session = Depends(get_db)):
+    """Attendance of one session."""
+    if db.query(DBSess.id).filter_by(id=session_id).first() is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return export_response(format, f"attendance_session{session_id}", session_id=session_id)
+
+
 
 
 
@@ -499,8 +1576,9 @@ def delete_student(enrollment_no: str, db: Session = Depends(get_db)):
     Deletes:
     - student row
     - student_images rows
+    - class roster entries
     - attendance rows belonging to this student
-    - canonical .npy file
+    - gallery embedding (tombstoned)
     - raw enrollment images
 
     Safe for Admin use.
@@ -514,8 +1592,12 @@ def delete_student(enrollment_no: str, db: Session = Depends(get_db)):
     # 2. Delete attendance for this student
     db.query(Attendance).filter_by(enrollment_no=enrollment_no).delete()
 
-    # 3. Delete student_images rows
+    # 3. Delete student_images rows and class roster entries
     db.query(StudentImage).filter_by(enrollment_no=enrollment_no).delete()
+    roster_class_ids = [
+        cid for (cid,) in db.query(ClassEnrollment.class_id).filter_by(enrollment_no=enrollment_no)
+    ]
+    db.query(ClassEnrollment).filter_by(enrollment_no=enrollment_no).delete()
 
     # 4. Delete student row
     db.delete(student)
@@ -523,8 +1605,13 @@ def delete_student(enrollment_no: str, db: Session = Depends(get_db)):
     # 5. Commit DB side first
     db.commit()
 
-    # 6. Delete files from filesystem
+    # 6. Delete files from filesystem and drop the embedding from the gallery
     delete_student_files(enrollment_no)
+    gallery.remove(enrollment_no)
+    student_directory.invalidate(enrollment_no)
+    marked_sessions.forget_student(enrollment_no)
+    for class_id in roster_class_ids:
+        rosters.invalidate_class(class_id)
 
     return {"status": "success", "message": f"Student {enrollment_no} deleted successfully"}
 
@@ -533,22 +1620,43 @@ def delete_student(enrollment_no: str, db: Session = Depends(get_db)):
 
 
 @app.get("/students")
-def list_students(db: Session = Depends(get_db)):
+def list_students(
+    q: Optional[str] = None,
+    semester: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     """
-    List all students with a flag indicating whether a canonical embedding exists.
+    List students with a flag indicating whether a canonical embedding exists.
     Suitable for Admin 'Edit Student data' table.
+
+    - q: case-insensitive search in name / enrollment_no
+    - semester: exact match
+    - limit / cursor: keyset pages ({"items", "next_cursor"}); without limit
+      the plain list of all matching students is returned
     """
-    students = db.query(Student).all()
-    out = []
-    for s in students:
-        out.append({
+    query = db.query(Student.enrollment_no, Student.name, Student.semester, Student.created_at)
+    if q:
+        query = query.filter(or_(
+            Student.name.icontains(q, autoescape=True),
+            Student.enrollment_no.icontains(q, autoescape=True),
+        ))
+    if semester:
+        query = query.filter(Student.semester == semester)
+
+    registered = gallery.ids()   # one snapshot instead of a lookup per row
+
+    def to_dict(s):
+        return {
             "enrollment_no": s.enrollment_no,
             "name": s.name,
             "semester": s.semester,
             "created_at": s.created_at.isoformat() if s.created_at else None,
-            "face_registered": os.path.exists(canonical_path(s.enrollment_no)),
-        })
-    return out
+            "face_registered": s.enrollment_no in registered,
+        }
+
+    return list_or_page(query, Student.enrollment_no, limit, cursor, to_dict, PAGE_MAX_LIMIT)
 
 
 
@@ -575,6 +1683,7 @@ def update_student_basic(
 
     db.commit()
     db.refresh(student)
+    student_directory.invalidate(enrollment_no)
 
     return {
         "enrollment_no": student.enrollment_no,
@@ -588,21 +1697,34 @@ def update_student_basic(
 
 
 @app.get("/faculty")
-def list_faculty(db: Session = Depends(get_db)):
+def list_faculty(
+    q: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     """
-    List all faculty. Used in Admin 'Edit Faculty data'.
+    List faculty. Used in Admin 'Edit Faculty data'.
+    q searches name / faculty_id / email; limit + cursor give keyset pages.
     """
-    facs = db.query(Faculty).all()
-    out = []
-    for f in facs:
-        out.append({
+    query = db.query(Faculty.faculty_id, Faculty.name, Faculty.email, Faculty.phone, Faculty.created_at)
+    if q:
+        query = query.filter(or_(
+            Faculty.name.icontains(q, autoescape=True),
+            Faculty.faculty_id.icontains(q, autoescape=True),
+            Faculty.email.icontains(q, autoescape=True),
+        ))
+
+    def to_dict(f):
+        return {
             "faculty_id": f.faculty_id,
             "name": f.name,
             "email": f.email,
             "phone": f.phone,
             "created_at": f.created_at.isoformat() if f.created_at else None,
-        })
-    return out
+        }
+
+    return list_or_page(query, Faculty.faculty_id, limit, cursor, to_dict, PAGE_MAX_LIMIT)
 
 
 
@@ -673,60 +1795,102 @@ def update_faculty(
 
 
 
+def delete_classes_cascade(db: Session, class_filter) -> dict:
+    """
+    Deletes the classes matching class_filter together with their rosters,
+    their sessions and the attendance of those sessions, one set-based
+    DELETE per table.
+    Does not commit. Returns rows deleted per table.
+    """
+    class_ids = select(Class.id).where(class_filter).scalar_subquery()
+    session_ids = select(DBSess.id).where(DBSess.class_id.in_(class_ids)).scalar_subquery()
+
+    counts = {}
+    counts["attendance"] = db.query(Attendance).filter(
+        Attendance.session_id.in_(session_ids)
+    ).delete(synchronize_session=False)
+    counts["sessions"] = db.query(DBSess).filter(
+        DBSess.class_id.in_(class_ids)
+    ).delete(synchronize_session=False)
+    counts["class_enrollments"] = db.query(ClassEnrollment).filter(
+        ClassEnrollment.class_id.in_(class_ids)
+    ).delete(synchronize_session=False)
+    counts["classes"] = db.query(Class).filter(class_filter).delete(synchronize_session=False)
+    return counts
+
+
 @app.delete("/faculty/{faculty_id}")
 def delete_faculty(faculty_id: str, db: Session = Depends(get_db)):
     """
-    Deletes:
+    Deletes, in one transaction:
     - faculty row
-    - all classes for that faculty
+    - all classes for that faculty (and their rosters)
     - all sessions for those classes
     - all attendance for those sessions
+
+    Returns the number of rows removed from each table.
     """
 
     fac = db.query(Faculty).filter_by(faculty_id=faculty_id).first()
     if not fac:
         raise HTTPException(status_code=404, detail="Faculty not found")
 
-    # Find classes for this faculty
-    classes = db.query(Class).filter(Class.faculty_id == faculty_id).all()
-
-    for cls in classes:
-        # For each class, delete attendance for its sessions, then sessions
-        sessions = db.query(DBSess).filter(DBSess.class_id == cls.id).all()
-        for s in sessions:
-            db.query(Attendance).filter(Attendance.session_id == s.id).delete()
-        db.query(DBSess).filter(DBSess.class_id == cls.id).delete()
-
-        # Delete the class itself
-        db.delete(cls)
-
-    # Finally delete the faculty
-    db.delete(fac)
-    db.commit()
+    try:
+        # attendance -> sessions -> classes, then the faculty itself
+        deleted = delete_classes_cascade(db, Class.faculty_id == faculty_id)
+        deleted["faculty"] = db.query(Faculty).filter(
+            Faculty.faculty_id == faculty_id
+        ).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    active_sessions.invalidate()
+    marked_sessions.clear()
+    rosters.clear()
 
-    return {"status": "success", "message": f"Faculty {faculty_id} and related classes/sessions/attendance deleted"}
+    return {
+        "status": "success",
+        "message": f"Faculty {faculty_id} and related classes/sessions/attendance deleted",
+        "deleted": deleted,
+    }
 
 
 
 
 
 @app.get("/classes")
-def list_classes(db: Session = Depends(get_db)):
+def list_classes(
+    q: Optional[str] = None,
+    faculty_id: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     """
-    List all classes with their faculty_id (if any).
+    List classes with their faculty_id (if any).
     Used in Admin 'Edit Classes data'.
+    q searches title / course_code; limit + cursor give keyset pages.
     """
-    classes = db.query(Class).all()
-    out = []
-    for c in classes:
-        out.append({
+    query = db.query(Class.id, Class.title, Class.course_code, Class.faculty_id, Class.created_at)
+    if q:
+        query = query.filter(or_(
+            Class.title.icontains(q, autoescape=True),
+            Class.course_code.icontains(q, autoescape=True),
+        ))
+    if faculty_id:
+        query = query.filter(Class.faculty_id == faculty_id)
+
+    def to_dict(c):
+        return {
             "id": c.id,
             "title": c.title,
             "course_code": c.course_code,
             "faculty_id": c.faculty_id,
             "created_at": c.created_at.isoformat() if c.created_at else None,
-        })
-    return out
+        }
+
+    return list_or_page(query, Class.id, limit, cursor, to_dict, PAGE_MAX_LIMIT)
 
 
 
@@ -790,6 +1954,7 @@ def update_class(
 
     db.commit()
     db.refresh(cls)
+    active_sessions.invalidate()   # class_title is part of the cached sessions
 
     return {
         "id": cls.id,
@@ -804,28 +1969,157 @@ def update_class(
 @app.delete("/classes/{class_id}")
 def delete_class(class_id: int, db: Session = Depends(get_db)):
     """
-    Deletes:
-    - class row
+    Deletes, in one transaction:
+    - class row and its roster
     - all sessions for that class
     - all attendance for those sessions
+
+    Returns the number of rows removed from each table.
     """
     cls = db.query(Class).filter_by(id=class_id).first()
     if not cls:
         raise HTTPException(status_code=404, detail="Class not found")
 
-    # Delete attendance for sessions of this class
-    sessions = db.query(DBSess).filter(DBSess.class_id == class_id).all()
-    for s in sessions:
-        db.query(Attendance).filter(Attendance.session_id == s.id).delete()
+    try:
+        deleted = delete_classes_cascade(db, Class.id == class_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    active_sessions.invalidate()
+    marked_sessions.clear()
+    rosters.clear()
+
+    return {
+        "status": "success",
+        "message": f"Class {class_id} and related sessions/attendance deleted",
+        "deleted": deleted,
+    }
+
+
+# ---------------------------
+# Class rosters (which students belong to a class)
+# ---------------------------
+
+def check_roster_students(db: Session, enrollment_nos: list[str]) -> list[str]:
+    """Deduplicated enrollment_nos; 400 if any student does not exist."""
+    ids = list(dict.fromkeys(enrollment_nos))
+    found = set()
+    for i in range(0, len(ids), 1000):
+        found.update(
+            r.enrollment_no for r in
+            db.query(Student.enrollment_no).filter(Student.enrollment_no.in_(ids[i:i + 1000]))
+        )
+    missing = [sid for sid in ids if sid not in found]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown students: {', '.join(missing)}")
+    return ids
+
+
+def add_to_roster(db: Session, class_id: int, enrollment_nos: list[str]) -> int:
+    """INSERT ... ON CONFLICT DO NOTHING; returns how many were new. Does not commit."""
+    if not enrollment_nos:
+        return 0
+    now = datetime.utcnow()
+    dialect_insert = sqlite.insert if db.get_bind().dialect.name == "sqlite" else postgresql.insert
+    stmt = (
+        dialect_insert(ClassEnrollment)
+        .on_conflict_do_nothing(index_elements=["class_id", "enrollment_no"])
+        .returning(ClassEnrollment.enrollment_no)
+    )
+    rows = [{"class_id": class_id, "enrollment_no": sid, "created_at": now} for sid in enrollment_nos]
+    return len(db.scalars(stmt, rows).all())
+
+
+def roster_size(db: Session, class_id: int) -> int:
+    return db.query(func.count(ClassEnrollment.id)).filter(ClassEnrollment.class_id == class_id).scalar()
+
+
+@app.get("/classes/{class_id}/roster")
+def get_class_roster(
+    class_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Students on the roster of a class.
+
+    - limit / cursor: keyset pages ({"items", "next_cursor"}); without limit
+      the plain list is returned
+    """
+    if db.query(Class.id).filter_by(id=class_id).first() is None:
+        raise HTTPException(status_code=404, detail="Class not found")
+
+    query = (
+        db.query(Student.enrollment_no, Student.name, Student.semester)
+        .join(ClassEnrollment, ClassEnrollment.enrollment_no == Student.enrollment_no)
+        .filter(ClassEnrollment.class_id == class_id)
+    )
+    registered = gallery.ids()
+
+    def to_dict(s):
+        return {
+            "enrollment_no": s.enrollment_no,
+            "name": s.name,
+            "semester": s.semester,
+            "face_registered": s.enrollment_no in registered,
+        }
+
+    return list_or_page(query, Student.enrollment_no, limit, cursor, to_dict, PAGE_MAX_LIMIT)
+
+
+@app.post("/classes/{class_id}/roster")
+def add_class_roster(class_id: int, payload: RosterUpdate, db: Session = Depends(get_db)):
+    """
+    Adds students to a class roster (students already on it are ignored).
+    """
+    if db.query(Class.id).filter_by(id=class_id).first() is None:
+        raise HTTPException(status_code=404, detail="Class not found")
+
+    ids = check_roster_students(db, payload.enrollment_nos)
+    added = add_to_roster(db, class_id, ids)
+    db.commit()
+    rosters.invalidate_class(class_id)
+
+    return {"status": "success", "class_id": class_id, "added": added, "roster_size": roster_size(db, class_id)}
+
+
+@app.put("/classes/{class_id}/roster")
+def replace_class_roster(class_id: int, payload: RosterUpdate, db: Session = Depends(get_db)):
+    """
+    Replaces a class roster with exactly the given students, in one
+    transaction. An empty list clears the roster (recognition for the
+    class's sessions then uses the full gallery again).
+    """
+    if db.query(Class.id).filter_by(id=class_id).first() is None:
+        raise HTTPException(status_code=404, detail="Class not found")
+
+    ids = check_roster_students(db, payload.enrollment_nos)
+    try:
+        removed = db.query(ClassEnrollment).filter(
+            ClassEnrollment.class_id == class_id,
+            ClassEnrollment.enrollment_no.not_in(ids),
+        ).delete(synchronize_session=False)
+        added = add_to_roster(db, class_id, ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    rosters.invalidate_class(class_id)
+
+    return {"status": "success", "class_id": class_id, "added": added, "removed": removed, "roster_size": len(ids)}
 
-    # Delete sessions themselves
-    db.query(DBSess).filter(DBSess.class_id == class_id).delete()
 
-    # Delete the class row
-    db.delete(cls)
+@app.delete("/classes/{class_id}/roster/{enrollment_no}")
+def remove_from_class_roster(class_id: int, enrollment_no: str, db: Session = Depends(get_db)):
+    removed = db.query(ClassEnrollment).filter_by(class_id=class_id, enrollment_no=enrollment_no).delete()
+    if not removed:
+        raise HTTPException(status_code=404, detail="Student not on this class roster")
     db.commit()
+    rosters.invalidate_class(class_id)
 
-    return {"status": "success", "message": f"Class {class_id} and related sessions/attendance deleted"}
+    return {"status": "success", "message": f"Student {enrollment_no} removed from class {class_id}"}
 
 
 
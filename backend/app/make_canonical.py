@@ -8,7 +8,8 @@ APP_DIR = os.path.dirname(os.path.abspath(__file__))
 if APP_DIR not in sys.path:
     sys.path.append(APP_DIR)
 
-from embed_utils import get_face_embedding
+from embed_utils import get_face_embeddings_batch
+from gallery_store import PackedGalleryStore, fuse_embeddings
 
 # Adjust paths relative to this file
 BACKEND_DIR = os.path.dirname(APP_DIR)
@@ -16,34 +17,59 @@ REPO_ROOT = os.path.dirname(BACKEND_DIR)
 
 RAW_DIR = os.path.join(REPO_ROOT, "data", "raw")
 ENROLL_DIR = os.path.join(REPO_ROOT, "data", "enrollments")
+GALLERY_PATH = os.getenv("GALLERY_PATH", os.path.join(ENROLL_DIR, "gallery.bin"))
+EMB_DIM = 512
 os.makedirs(ENROLL_DIR, exist_ok=True)
 
-def make_canonical(enrollment_no: str):
-    # Find the first image in RAW_DIR that starts with this enrollment_no
-    candidates = [
-        f for f in os.listdir(RAW_DIR)
+def raw_images_for(enrollment_no: str, raw_dir: str = RAW_DIR) -> list[str]:
+    """All raw images of a student (<enrollment_no>_<anything>), sorted by name."""
+    return sorted(
+        os.path.join(raw_dir, f) for f in os.listdir(raw_dir)
         if f.startswith(enrollment_no + "_")
-    ]
+    )
+
+def build_template(contents: list[bytes]):
+    """
+    Embeds the largest face of every image (one batched recognition pass)
+    and fuses them. Returns (template or None, number of images used,
+    list of per-image errors).
+    """
+    results = get_face_embeddings_batch(contents)
+    embs = [r for r in results if not isinstance(r, Exception)]
+    errors = [str(r) for r in results if isinstance(r, Exception)]
+    if not embs:
+        return None, 0, errors
+    return fuse_embeddings(np.vstack(embs)), len(embs), errors
+
+def make_canonical(enrollment_no: str):
+    # Fuse every image in RAW_DIR that starts with this enrollment_no
+    candidates = raw_images_for(enrollment_no)
     if not candidates:
         print(f"No raw images found for {enrollment_no} in {RAW_DIR}")
         return
 
-    img_file = candidates[0]
-    img_path = os.path.join(RAW_DIR, img_file)
-    print(f"Using image: {img_path}")
+    print(f"Using {len(candidates)} image(s): {', '.join(os.path.basename(c) for c in candidates)}")
 
     # Read bytes
-    with open(img_path, "rb") as f:
-        content = f.read()
+    contents = []
+    for img_path in candidates:
+        with open(img_path, "rb") as f:
+            contents.append(f.read())
 
-    # Get embedding
-    emb = get_face_embedding(content)  # should be normalized already
-    print(f"Embedding shape: {emb.shape}")
+    # Get embeddings and fuse them into one template
+    emb, used, errors = build_template(contents)
+    for err in errors:
+        print(f"Skipped an image: {err}")
+    if emb is None:
+        print(f"No usable face in the images of {enrollment_no}")
+        return
+    print(f"Embedding shape: {emb.shape} (fused from {used} image(s))")
 
-    # Save as <enrollment_no>__canonical.npy
-    out_path = os.path.join(ENROLL_DIR, f"{enrollment_no}__canonical.npy")
-    np.save(out_path, emb)
-    print(f"Saved canonical embedding to: {out_path}")
+    # Append to the packed gallery (replaces any previous row for this student)
+    store = PackedGalleryStore.open_or_create(GALLERY_PATH, EMB_DIM)
+    row = store.append(enrollment_no, emb)
+    store.close()
+    print(f"Saved canonical embedding to: {GALLERY_PATH} (row {row})")
 
 if __name__ == "__main__":
     import sys
@@ -1,18 +1,273 @@
 # app/make_canonical_all.py
-import os, sys
-from app.make_canonical import make_canonical
-
-RAW_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "raw")
-# collect unique enrollment prefixes
-prefixes = set()
-for fname in os.listdir(RAW_DIR):
-    if "_" in fname:
-        prefixes.add(fname.split("_", 1)[0])
-
-print("Found enrollment prefixes:", prefixes)
-for p in sorted(prefixes):
-    print("Processing", p)
+"""
+Bulk (re)build of the packed gallery from data/raw.
+
+Usage (from backend/):
+    python -m app.make_canonical_all                # only new / changed students
+    python -m app.make_canonical_all --workers 8
+    python -m app.make_canonical_all --force        # re-embed everyone
+
+Students are spread over a process pool. Each worker loads its own face
+engine once (onnxruntime threads are split between the workers) and fuses
+all of a student's raw images into one template (make_canonical.build_template).
+The parent writes finished templates into the gallery store in batches.
+
+A manifest next to the gallery (canonical_manifest.json) records the content
+hash of every raw image a template was built from, so re-runs skip students
+whose images have not changed. Size and mtime are compared first; a file is
+only re-hashed when they differ. The manifest is saved after every batch
+write, so an interrupted run resumes where it stopped: Ctrl+C cancels the
+queued students and writes what has finished. If a worker cannot load the
+face engine the run stops at once instead of failing every student.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from app.make_canonical import RAW_DIR, GALLERY_PATH, EMB_DIM, build_template
+from app.audit import content_hash
+import config   # the module embed_utils reads (app/ is on sys.path after make_canonical)
+from embed_utils import get_engine
+from gallery_store import PackedGalleryStore
+
+MANIFEST_PATH = os.path.join(os.path.dirname(GALLERY_PATH), "canonical_manifest.json")
+MANIFEST_VERSION = 1
+
+
+def engine_settings() -> dict:
+    """Settings a template depends on; changing any of them invalidates the manifest."""
+    return {
+        "model_pack": config.EMBED_MODEL_PACK,
+        "det_size": config.EMBED_DET_SIZE,
+        "det_thresh": config.EMBED_DET_THRESH,
+        "color_order": config.EMBED_COLOR_ORDER,
+    }
+
+
+def scan_raw_dir(raw_dir: str) -> dict[str, list[os.DirEntry]]:
+    """Raw images grouped by enrollment prefix (<enrollment_no>_<anything>)."""
+    groups: dict[str, list[os.DirEntry]] = {}
+    with os.scandir(raw_dir) as it:
+        for entry in it:
+            if "_" in entry.name and entry.is_file():
+                groups.setdefault(entry.name.split("_", 1)[0], []).append(entry)
+    for entries in groups.values():
+        entries.sort(key=lambda e: e.name)
+    return groups
+
+
+def load_manifest(path: str) -> dict:
     try:
-        make_canonical(p)
-    except Exception as e:
-        print("Failed for", p, ":", e)
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Warning: ignoring unreadable manifest {path}: {e}")
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    if manifest.get("settings") != engine_settings():
+        print("Face engine settings changed since the last run: rebuilding every template")
+        return {}
+    return manifest.get("students", {})
+
+
+def save_manifest(path: str, students: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "settings": engine_settings(), "students": students}, f)
+    os.replace(tmp_path, path)
+
+
+def is_unchanged(entry: dict, files: list[os.DirEntry]) -> bool:
+    """
+    True if the recorded files match the ones on disk. Files whose size / mtime
+    changed are re-hashed; identical content just refreshes the recorded stat.
+    """
+    recorded = entry.get("files", {})
+    if set(recorded) != {f.name for f in files}:
+        return False
+    for f in files:
+        st = f.stat()
+        size, mtime_ns, digest = recorded[f.name]
+        if (size, mtime_ns) == (st.st_size, st.st_mtime_ns):
+            continue
+        with open(f.path, "rb") as fh:
+            if content_hash(fh.read()) != digest:
+                return False
+        recorded[f.name] = [st.st_size, st.st_mtime_ns, digest]
+    return True
+
+
+# ---------------------------
+# Worker side
+# ---------------------------
+
+def init_worker(intra_threads: int):
+    """Pool initializer: one face engine per worker process, loaded up front."""
+    if config.ORT_INTRA_OP_THREADS == 0:
+        config.ORT_INTRA_OP_THREADS = intra_threads
+    get_engine()
+
+
+def embed_student(enrollment_no: str, paths: list[str]) -> dict:
+    files = {}
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+            st = os.fstat(f.fileno())
+        files[os.path.basename(path)] = [st.st_size, st.st_mtime_ns, content_hash(content)]
+        contents.append(content)
+    emb, used, errors = build_template(contents)
+    return {"enrollment_no": enrollment_no, "files": files, "emb": emb, "used": used, "errors": errors}
+
+
+# ---------------------------
+# Driver
+# ---------------------------
+
+class Progress:
+    def __init__(self, total: int, every: float):
+        self.total = total
+        self.every = every
+        self.done = 0
+        self.images = 0
+        self.failed = 0
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+
+    def update(self, result: dict):
+        self.done += 1
+        self.images += len(result["files"])
+        if result["emb"] is None:
+            self.failed += 1
+        now = time.perf_counter()
+        if now - self._last >= self.every or self.done == self.total:
+            self._last = now
+            print(self.line(now))
+            sys.stdout.flush()
+
+    def line(self, now: float) -> str:
+        elapsed = max(now - self.t0, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0.0
+        return (
+            f"[{self.done}/{self.total}] {rate:.1f} students/s, {self.images / elapsed:.1f} images/s, "
+            f"{self.failed} without a usable face, elapsed {elapsed:.0f}s, ETA {eta:.0f}s"
+        )
+
+
+def build_all(raw_dir: str = RAW_DIR, gallery_path: str = GALLERY_PATH, manifest_path: str = MANIFEST_PATH,
+              workers: int = 1, threads: int = 1, force: bool = False, retry_failed: bool = False,
+              batch_size: int = 200, progress_every: float = 5.0) -> dict:
+    groups = scan_raw_dir(raw_dir)
+    manifest = {} if force else load_manifest(manifest_path)
+    store = PackedGalleryStore.open_or_create(gallery_path, EMB_DIM)
+    in_gallery = {store.id_at(int(r)) for r in store.live_rows()}
+
+    todo = []
+    skipped = 0
+    for enrollment_no in sorted(groups):
+        entry = manifest.get(enrollment_no)
+        if entry is not None and is_unchanged(entry, groups[enrollment_no]):
+            built = entry.get("used", 0) > 0
+            if (built and enrollment_no in in_gallery) or (not built and not retry_failed):
+                skipped += 1
+                continue
+        todo.append(enrollment_no)
+    # students whose raw images are gone: forget them (their gallery rows are left alone)
+    manifest = {k: v for k, v in manifest.items() if k in groups}
+    print(f"Found {len(groups)} students in {raw_dir}: {len(todo)} to embed, {skipped} unchanged")
+
+    progress = Progress(len(todo), progress_every)
+    pending = []
+
+    def write_batch():
+        store.append_many([(r["enrollment_no"], r["emb"]) for r in pending if r["emb"] is not None])
+        # gallery first, then the manifest: it never claims a template the store lacks
+        for r in pending:
+            manifest[r["enrollment_no"]] = {
+                "files": r["files"], "used": r["used"], "errors": r["errors"],
+            }
+        save_manifest(manifest_path, manifest)
+        pending.clear()
+
+    def collect(result: dict):
+        for err in result["errors"]:
+            print(f"Skipped an image of {result['enrollment_no']}: {err}")
+        pending.append(result)
+        progress.update(result)
+        if len(pending) >= batch_size:
+            write_batch()
+
+    jobs = [(p, [e.path for e in groups[p]]) for p in todo]
+    try:
+        if workers <= 1:
+            init_worker(threads)
+            for enrollment_no, paths in jobs:
+                collect(embed_student(enrollment_no, paths))
+        else:
+            # spawn: every worker builds its own onnxruntime session
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=init_worker, initargs=(threads,))
+            try:
+                futures = {pool.submit(embed_student, p, paths): p for p, paths in jobs}
+                for fut in as_completed(futures):
+                    try:
+                        collect(fut.result())
+                    except BrokenProcessPool:
+                        print("A worker process died (face engine failed to load in init_worker, or it crashed)")
+                        raise
+                    except Exception as e:
+                        print(f"Failed for {futures[fut]}: {e}")
+            except BaseException:
+                # Ctrl+C or a broken pool: drop the queued students instead of waiting for them
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown()
+    finally:
+        # also on Ctrl+C: keep what was finished so the next run resumes from here
+        write_batch()
+        live = store.live
+        store.close()
+
+    print(f"Gallery {gallery_path}: {live} live rows")
+    return {"students": len(groups), "embedded": progress.done - progress.failed,
+            "failed": progress.failed, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Build canonical templates for every student in data/raw")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--gallery", default=GALLERY_PATH)
+    parser.add_argument("--manifest", default=None, help="default: canonical_manifest.json next to the gallery")
+    parser.add_argument("--workers", type=int, default=max(1, cpus // 2), help="processes, 1 = run in-process")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="onnxruntime intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and re-embed everyone")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="retry unchanged students whose images had no usable face")
+    parser.add_argument("--batch-size", type=int, default=200, help="templates per gallery write")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    manifest_path = args.manifest or os.path.join(os.path.dirname(args.gallery), "canonical_manifest.json")
+    build_all(
+        raw_dir=args.raw_dir,
+        gallery_path=args.gallery,
+        manifest_path=manifest_path,
+        workers=args.workers,
+        threads=args.threads or max(1, cpus // max(1, args.workers)),
+        force=args.force,
+        retry_failed=args.retry_failed,
+        batch_size=args.batch_size,
+        progress_every=args.progress_every,
+    )
@@ -0,0 +1,32 @@
+# app/metrics.py
+import threading
+
+
+class StageStats:
+    """Thread-safe count / average / max of per-stage durations (seconds in, ms out)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: dict[str, list] = {}   # stage -> [count, total, max]
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            d = self._data.setdefault(stage, [0, 0.0, 0.0])
+            d[0] += 1
+            d[1] += seconds
+            d[2] = max(d[2], seconds)
+
+    def record_many(self, timings: dict):
+        for stage, seconds in timings.items():
+            self.record(stage, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                stage: {
+                    "count": count,
+                    "avg_ms": round(1000.0 * total / count, 3) if count else None,
+                    "max_ms": round(1000.0 * mx, 3),
+                }
+                for stage, (count, total, mx) in self._data.items()
+            }
@@ -0,0 +1,101 @@
+# app/microbatch.py
+"""
+Dynamic micro-batching for the recognition model.
+
+Concurrent /recognize requests each produce one aligned face crop. Instead of
+running one ArcFace forward pass per request, submit() parks the crop and
+its future; the batcher flushes once `max_batch` crops are waiting or the
+oldest has waited `max_wait_ms`, runs a single batched forward pass on the
+inference pool, and fans the embeddings back out to the waiting requests.
+
+Everything here runs on the event loop thread, so no locking is needed.
+"""
+import asyncio
+import time
+from typing import Callable
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, embed_fn: Callable, run_fn: Callable, max_batch: int = 16, max_wait_ms: float = 5.0):
+        """
+        embed_fn: list of crops -> (N, D) embeddings (embed_utils.embed_crops)
+        run_fn:   coroutine used to run embed_fn off the loop (InferenceExecutor.run)
+        """
+        self.embed_fn = embed_fn
+        self.run_fn = run_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: list[tuple[np.ndarray, asyncio.Future, float]] = []
+        self._timer = None
+
+        # metrics
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: dict[int, int] = {}
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.total_run = 0.0
+
+    async def submit(self, crop: np.ndarray) -> np.ndarray:
+        """Embed one aligned crop as part of the next batch."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((crop, fut, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[: self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: list):
+        started = time.perf_counter()
+        crops = [crop for crop, _, _ in batch]
+        try:
+            embs = await self.run_fn(self.embed_fn, crops)
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._record(batch, started)
+
+        for (_, fut, _), emb in zip(batch, embs):
+            if not fut.done():
+                fut.set_result(emb)
+
+    def _record(self, batch: list, started: float):
+        n = len(batch)
+        self.batches += 1
+        self.items += n
+        self.batch_sizes[n] = self.batch_sizes.get(n, 0) + 1
+        for _, _, enqueued in batch:
+            wait = started - enqueued
+            self.total_wait += wait
+            self.max_wait_seen = max(self.max_wait_seen, wait)
+        self.total_run += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 3) if self.batches else None,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "avg_queue_wait_ms": round(1000.0 * self.total_wait / self.items, 3) if self.items else None,
+            "max_queue_wait_ms": round(1000.0 * self.max_wait_seen, 3),
+            "avg_batch_run_ms": round(1000.0 * self.total_run / self.batches, 3) if self.batches else None,
+        }
@@ -0,0 +1,71 @@
+# app/migrate_enrollments.py
+"""
+Converts the legacy one-file-per-student layout
+(data/enrollments/<enrollment_no>__canonical.npy) into the packed gallery
+file used by the API, and optionally compacts an existing gallery.
+
+Usage (from backend/):
+    python -m app.migrate_enrollments              # add the .npy files missing from gallery.bin
+    python -m app.migrate_enrollments --delete-npy # ... and remove the .npy files afterwards
+    python -m app.migrate_enrollments --force      # rebuild gallery.bin from the .npy files only
+    python -m app.migrate_enrollments --compact    # drop tombstoned rows from gallery.bin
+"""
+import os
+import sys
+import argparse
+
+# Ensure app directory is on path when running as a script
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
+from gallery_store import PackedGalleryStore, import_npy_dir
+
+BACKEND_DIR = os.path.dirname(APP_DIR)
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+
+ENROLL_DIR = os.path.join(REPO_ROOT, "data", "enrollments")
+GALLERY_PATH = os.getenv("GALLERY_PATH", os.path.join(ENROLL_DIR, "gallery.bin"))
+EMB_DIM = 512
+
+
+def migrate(enroll_dir: str = ENROLL_DIR, gallery_path: str = GALLERY_PATH, delete_npy: bool = False,
+            force: bool = False) -> int:
+    n = import_npy_dir(enroll_dir, gallery_path, EMB_DIM, force=force)
+    print(f"Wrote {n} embeddings to {gallery_path}")
+
+    # sanity check: reopen the new file and report what it holds
+    store = PackedGalleryStore(gallery_path, mode="r")
+    print(f"Gallery: {store.live} live rows, capacity {store.capacity}, dim {store.dim}")
+    store.close()
+
+    if delete_npy:
+        for fname in os.listdir(enroll_dir):
+            if fname.endswith("__canonical.npy"):
+                os.remove(os.path.join(enroll_dir, fname))
+        print("Removed legacy .npy files")
+    return n
+
+
+def compact(gallery_path: str = GALLERY_PATH):
+    store = PackedGalleryStore(gallery_path)
+    before = store.count
+    store.compact()
+    print(f"Compacted {gallery_path}: {before} -> {store.count} rows")
+    store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate/compact the packed embedding gallery")
+    parser.add_argument("--enroll-dir", default=ENROLL_DIR)
+    parser.add_argument("--gallery", default=GALLERY_PATH)
+    parser.add_argument("--delete-npy", action="store_true", help="remove legacy .npy files after migrating")
+    parser.add_argument("--compact", action="store_true", help="only compact an existing gallery")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild the gallery from the .npy files, dropping rows they do not have")
+    args = parser.parse_args()
+
+    if args.compact:
+        compact(args.gallery)
+    else:
+        migrate(args.enroll_dir, args.gallery, args.delete_npy, args.force)
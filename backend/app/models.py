@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, Date, Time, Text, Boolean, ForeignKey, Float, DateTime
+from sqlalchemy import Column, Integer, String, Date, Time, Text, Boolean, ForeignKey, Float, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -46,21 +46,38 @@ class Class(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     course_code = Column(String(50))
-    faculty_id = Column(String(50), ForeignKey("faculty.faculty_id"), nullable=True)
+    faculty_id = Column(String(50), ForeignKey("faculty.faculty_id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     sessions = relationship("Session", back_populates="class_ref")
     faculty = relationship("Faculty", back_populates="classes")
+    roster = relationship("ClassEnrollment", back_populates="class_ref")
+
+
+class ClassEnrollment(Base):
+    """Class roster: the students expected in a class (see migrations/ 0002)."""
+    __tablename__ = "class_enrollments"
+    __table_args__ = (
+        UniqueConstraint("class_id", "enrollment_no", name="uq_class_enrollments_class_student"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    class_id = Column(Integer, ForeignKey("classes.id"), nullable=False, index=True)
+    enrollment_no = Column(String(50), ForeignKey("students.enrollment_no"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    class_ref = relationship("Class", back_populates="roster")
+    student = relationship("Student")
 
 
 class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    class_id = Column(Integer, ForeignKey("classes.id"))
+    class_id = Column(Integer, ForeignKey("classes.id"), index=True)
     session_date = Column(Date, nullable=False)
     start_time = Column(DateTime)
-    end_time = Column(DateTime)
+    end_time = Column(DateTime, index=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -81,9 +98,13 @@ class ModelInfo(Base):
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        # one attendance row per student per session (see migrations/)
+        UniqueConstraint("enrollment_no", "session_id", name="uq_attendance_enrollment_session"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    enrollment_no = Column(String(50), ForeignKey("students.enrollment_no"))
+    enrollment_no = Column(String(50), ForeignKey("students.enrollment_no"), index=True)
     name_at_time = Column(String(255))
     semester_at_time = Column(String(50))
     date = Column(Date, nullable=False)
@@ -92,7 +113,7 @@ class Attendance(Base):
     confidence = Column(Float)
     image_path = Column(Text)
     model_id = Column(Integer, ForeignKey("model_info.id"))
-    session_id = Column(Integer, ForeignKey("sessions.id"))
+    session_id = Column(Integer, ForeignKey("sessions.id"), index=True)
 
     student = relationship("Student", back_populates="attendance_records")
     model = relationship("ModelInfo", back_populates="attendance_records")
@@ -103,7 +124,7 @@ class PredictionLog(Base):
     __tablename__ = "predictions_log"
 
     id = Column(Integer, primary_key=True, index=True)
-    attempted_at = Column(DateTime, default=datetime.utcnow)
+    attempted_at = Column(DateTime, default=datetime.utcnow, index=True)
     image_path = Column(Text)
     predicted_enrollment = Column(String(50))
     predicted_name = Column(String(255))
@@ -0,0 +1,57 @@
+# app/pagination.py
+"""
+Keyset ("seek") pagination for the admin list endpoints.
+
+Pages are ordered by a unique key column and the next page starts strictly
+after the last key of the previous one (WHERE key > :last ORDER BY key
+LIMIT n), so every page costs one index range scan no matter how deep the
+client has scrolled, unlike OFFSET. The cursor handed to clients is the
+last key, JSON-encoded and base64'd so it stays opaque.
+"""
+import json
+import base64
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+
+def encode_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query, key, limit: int, cursor: Optional[str], to_dict: Callable,
+                key_attr: Optional[str] = None) -> dict:
+    """
+    One page of a column-projection query ordered by key.
+    key_attr is the key's name in the result rows if it was selected under a label.
+    Returns {"items": [...], "next_cursor": str or None}.
+    """
+    if cursor:
+        query = query.filter(key > decode_cursor(cursor))
+    rows = query.order_by(key).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [to_dict(r) for r in rows],
+        "next_cursor": encode_cursor(getattr(rows[-1], key_attr or key.key)) if has_more else None,
+    }
+
+
+def list_or_page(query, key, limit: Optional[int], cursor: Optional[str], to_dict: Callable, max_limit: int,
+                 key_attr: Optional[str] = None):
+    """
+    Without limit: the legacy plain list of every row (ordered by key).
+    With limit: a keyset page, limit capped at max_limit.
+    """
+    if limit is None:
+        return [to_dict(r) for r in query.order_by(key)]
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    return keyset_page(query, key, min(limit, max_limit), cursor, to_dict, key_attr)
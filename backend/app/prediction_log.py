@@ -0,0 +1,143 @@
+# app/prediction_log.py
+"""
+Write-behind buffer for predictions_log rows.
+
+With PREDICTION_LOG_MODE=buffered, recognition handlers hand their
+predictions_log rows to PredictionLogBuffer.add() instead of inserting them
+in the request transaction. A background thread writes them with one bulk
+INSERT per flush, whenever `max_rows` rows are waiting or the oldest has
+waited `max_delay` seconds. stop() (FastAPI shutdown) flushes what is left,
+retrying a few times; rows it still cannot write are counted as dropped and
+reported at ERROR level.
+
+Attendance is still written synchronously by the request; only the audit
+log is deferred, so a crash can lose at most the last `max_delay` seconds
+of predictions_log rows.
+"""
+import time
+import logging
+import threading
+from typing import Callable
+
+from sqlalchemy import insert
+
+from .models import PredictionLog
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionLogBuffer:
+    def __init__(self, session_factory: Callable, max_rows: int = 200, max_delay: float = 1.0,
+                 max_pending: int = 20000):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._rows: list[dict] = []
+        self._oldest = None   # monotonic time the oldest pending row was added
+        self._thread = None
+        self._stopping = False
+        self.flushes = 0
+        self.written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    def add(self, rows: list[dict]):
+        if not rows:
+            return
+        with self._cond:
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            overflow = len(self._rows) - self.max_pending
+            if overflow > 0:
+                # DB unreachable for a long time: bound memory, drop the oldest
+                del self._rows[:overflow]
+                self.dropped += overflow
+                print(f"Warning: predictions_log buffer full, dropped {overflow} rows")
+            if len(self._rows) >= self.max_rows:
+                self._cond.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0, attempts: int = 3):
+        """Stop the writer, then flush everything still buffered (up to `attempts` tries)."""
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify()
+            self._thread.join(timeout)
+            self._thread = None
+        for attempt in range(attempts):
+            self.flush()
+            with self._cond:
+                if not self._rows:
+                    return
+            if attempt + 1 < attempts:
+                time.sleep(min(self.max_delay, 1.0))
+        with self._cond:
+            lost = len(self._rows)
+            self._rows = []
+            self._oldest = None
+        self.dropped += lost
+        logger.error("predictions_log: dropped %d buffered rows at shutdown, "
+                     "the database could not be written in %d attempts", lost, attempts)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._rows) >= self.max_rows:
+                        break
+                    if self._rows and time.monotonic() - self._oldest >= self.max_delay:
+                        break
+                    wait = self.max_delay if not self._rows else self.max_delay - (time.monotonic() - self._oldest)
+                    self._cond.wait(max(wait, 0.01))
+                if self._stopping:
+                    return
+            failed = self.failed_flushes
+            self.flush()
+            if self.failed_flushes != failed:
+                time.sleep(self.max_delay)   # back off while the DB is unavailable
+
+    def flush(self) -> int:
+        with self._cond:
+            rows, self._rows = self._rows, []
+            self._oldest = None
+        if not rows:
+            return 0
+        db = self.session_factory()
+        try:
+            db.execute(insert(PredictionLog), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failed_flushes += 1
+            print(f"Warning: could not write {len(rows)} predictions_log rows, will retry: {e}")
+            with self._cond:
+                # put them back in front of anything added meanwhile
+                self._rows[:0] = rows
+                self._oldest = time.monotonic()
+            return 0
+        finally:
+            db.close()
+        self.flushes += 1
+        self.written += len(rows)
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._rows)
+        return {
+            "pending": pending,
+            "flushes": self.flushes,
+            "written": self.written,
+            "avg_rows_per_flush": round(self.written / self.flushes, 2) if self.flushes else None,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
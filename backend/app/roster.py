@@ -0,0 +1,150 @@
+# app/roster.py
+"""
+Roster-scoped matching.
+
+A probe sent with a session_id can only belong to a student on the roster
+of that session's class (class_enrollments). RosterCache keeps, for the
+most recently used sessions, the roster members' embeddings copied out of
+the gallery, so recognition scores a few dozen vectors instead of every
+enrolled student, which is faster and leaves fewer look-alikes to confuse
+the probe with.
+
+- roster ids are reloaded after `ttl` seconds, or right away when
+  invalidate_class() / clear() is called (roster edited, class deleted)
+- the vectors are re-copied whenever the gallery changes (enrol, delete,
+  compaction), detected through Gallery.version()
+- get() returns None for a session whose class has no roster; callers then
+  match against the full gallery as before
+
+Invalidation only reaches the worker that handled the write; other uvicorn
+workers pick up roster changes within `ttl` seconds.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from .gallery import assign_unique
+
+
+class RosterView:
+    """Embeddings of the roster members that are enrolled in the gallery."""
+
+    def __init__(self, class_id: int, ids: list[str], vectors: np.ndarray, version: tuple):
+        self.class_id = class_id
+        self.ids = ids
+        self.vectors = vectors
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search_many(self, probes: np.ndarray) -> list[tuple[Optional[str], float]]:
+        """Best roster member for every row of a (Q, D) probe matrix."""
+        if not self.ids:
+            return [(None, float("-inf"))] * probes.shape[0]
+        scores = probes.astype(np.float32, copy=False).dot(self.vectors.T)   # (Q, M)
+        best = scores.argmax(axis=1)
+        return [(self.ids[j], float(scores[i, j])) for i, j in enumerate(best.tolist())]
+
+    def match_unique(self, probes: np.ndarray, threshold: float) -> list[tuple[Optional[str], float]]:
+        """
+        One-to-one assignment of probes to roster members (see
+        Gallery.match_unique); the roster is small enough to solve the full
+        probe x member matrix.
+        """
+        q = probes.shape[0]
+        if not self.ids:
+            return [(None, float("-inf"))] * q
+        scores = probes.astype(np.float32, copy=False).dot(self.vectors.T)
+        out: list[tuple[Optional[str], float]] = [(None, float(scores[i].max())) for i in range(q)]
+        for i, j in enumerate(assign_unique(scores, threshold)):
+            if j >= 0:
+                out[i] = (self.ids[j], float(scores[i, j]))
+        return out
+
+
+class RosterCache:
+    def __init__(self, loader: Callable, gallery, max_sessions: int = 64, ttl: float = 60.0):
+        """
+        loader: (db, session_id) -> (class_id or None, [enrollment_no, ...])
+        gallery: the process Gallery (version() / subset())
+        """
+        self.loader = loader
+        self.gallery = gallery
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._invalidations = 0
+        self.hits = 0
+        self.loads = 0
+        self.builds = 0
+        self.unscoped = 0
+
+    def _entry(self, db, session_id: int) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and now - entry["loaded_at"] <= self.ttl:
+                self._entries.move_to_end(session_id)
+                return entry
+            invalidations = self._invalidations
+
+        class_id, ids = self.loader(db, session_id)
+        entry = {"class_id": class_id, "ids": ids, "loaded_at": now, "view": None}
+        with self._lock:
+            self.loads += 1
+            # a roster write while we were loading: use the result once, don't cache it
+            if invalidations == self._invalidations:
+                self._entries[session_id] = entry
+                self._entries.move_to_end(session_id)
+                while len(self._entries) > self.max_sessions:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def get(self, db, session_id: int) -> Optional[RosterView]:
+        entry = self._entry(db, session_id)
+        if not entry["ids"]:
+            with self._lock:
+                self.unscoped += 1
+            return None
+
+        version = self.gallery.version()
+        view = entry["view"]
+        if view is not None and view.version == version:
+            with self._lock:
+                self.hits += 1
+            return view
+
+        ids, vectors, version = self.gallery.subset(entry["ids"])
+        view = RosterView(entry["class_id"], ids, vectors, version)
+        with self._lock:
+            entry["view"] = view
+            self.builds += 1
+        return view
+
+    def invalidate_class(self, class_id: int):
+        with self._lock:
+            self._invalidations += 1
+            for session_id in [s for s, e in self._entries.items() if e["class_id"] == class_id]:
+                del self._entries[session_id]
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "loads": self.loads,
+                "builds": self.builds,
+                "unscoped": self.unscoped,
+            }
@@ -0,0 +1,73 @@
+# app/session_cache.py
+"""
+Process-local cache of the currently active sessions.
+
+Every attendance kiosk polls GET /sessions/active. Instead of querying all
+sessions (plus one lazy class lookup per row) on each poll, the active set
+is loaded once with the class titles joined in and served from memory:
+
+- rows drop out on their own once their end_time passes
+- the whole set is reloaded after `ttl` seconds, or right away when
+  invalidate() is called (session created, class edited / deleted)
+- an ETag derived from the visible rows lets idle kiosks get 304s
+
+Invalidation only reaches the worker that handled the write; other uvicorn
+workers pick up changes within `ttl` seconds.
+"""
+import time
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Callable
+
+
+class ActiveSessionCache:
+    def __init__(self, loader: Callable, ttl: float = 30.0):
+        """
+        loader: (db, now) -> list of session dicts, each with an "id" and a
+                datetime "end_time" (serialized on the way out)
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows: list[dict] = []
+        self._loaded_at = None   # monotonic time of the last load, None = stale
+        self._etags: dict[tuple, str] = {}
+        self.hits = 0
+        self.loads = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _current(self, db, now: datetime) -> list[dict]:
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._rows = self.loader(db, now)
+                self._loaded_at = time.monotonic()
+                self._etags = {}
+                self.loads += 1
+            else:
+                self.hits += 1
+            return [r for r in self._rows if r["end_time"] is not None and r["end_time"] >= now]
+
+    def get(self, db, now: datetime) -> tuple[list[dict], str]:
+        """(active sessions as JSON-ready dicts, ETag)"""
+        rows = self._current(db, now)
+        key = tuple(r["id"] for r in rows)
+        out = [dict(r, end_time=r["end_time"].isoformat()) for r in rows]
+        etag = self._etags.get(key)
+        if etag is None:
+            digest = hashlib.blake2b(json.dumps(out, sort_keys=True).encode("utf-8"), digest_size=12)
+            etag = f'"{digest.hexdigest()}"'
+            with self._lock:
+                self._etags[key] = etag
+        return out, etag
+
+    def is_active(self, db, session_id: int, now: datetime) -> bool:
+        return any(r["id"] == session_id for r in self._current(db, now))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"ttl": self.ttl, "cached": len(self._rows), "hits": self.hits, "loads": self.loads}
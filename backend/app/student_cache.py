@@ -0,0 +1,145 @@
+# app/student_cache.py
+"""
+In-memory lookups for the recognition hot path.
+
+StudentDirectory: read-through cache of each student's name / semester,
+keyed by enrollment_no like the gallery, so scoring a probe needs no
+Student query. The enroll / update / delete handlers invalidate the
+student they changed; a read that raced with that invalidation is returned
+but not cached. Other uvicorn workers do not see the invalidation, so
+entries also expire after `ttl` seconds: a name changed through another
+worker is picked up (and written to attendance / predictions_log) within
+that time.
+
+MarkedSessions: LRU of per-session sets of students already marked present.
+A repeat recognition of a marked student skips the attendance insert
+entirely. The sets only ever hold students this process has inserted or
+seen conflict, so they can never claim a mark that another worker made but
+this one has not seen; the unique constraint still backs every insert.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from .models import Student
+
+
+class StudentInfo(NamedTuple):
+    enrollment_no: str
+    name: str
+    semester: str
+
+
+class StudentDirectory:
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._info: dict[str, tuple[float, StudentInfo]] = {}   # enrollment_no -> (loaded_at, info)
+        self._epoch = 0                      # bumped by every invalidate()
+        self._invalidated: dict[str, int] = {}   # enrollment_no -> epoch of its last invalidate()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, db: Session, ids) -> dict[str, StudentInfo]:
+        with self._lock:
+            epoch = self._epoch
+        loaded_at = time.monotonic()
+        rows = (
+            db.query(Student.enrollment_no, Student.name, Student.semester)
+            .filter(Student.enrollment_no.in_(list(ids)))
+            .all()
+        )
+        found = {r.enrollment_no: StudentInfo(r.enrollment_no, r.name, r.semester) for r in rows}
+        with self._lock:
+            for sid, info in found.items():
+                # invalidated while we were reading: return it once, don't cache it
+                if self._invalidated.get(sid, -1) <= epoch:
+                    self._info[sid] = (loaded_at, info)
+        return found
+
+    def warm(self, db: Session, ids):
+        """Preload the given students (e.g. everyone in the gallery) in one query."""
+        ids = list(ids)
+        for i in range(0, len(ids), 1000):
+            self._load(db, ids[i:i + 1000])
+
+    def get(self, db: Session, enrollment_no: str) -> Optional[StudentInfo]:
+        return self.get_many(db, [enrollment_no]).get(enrollment_no)
+
+    def get_many(self, db: Session, ids) -> dict[str, StudentInfo]:
+        out = {}
+        missing = []
+        expired = time.monotonic() - self.ttl
+        with self._lock:
+            for sid in ids:
+                entry = self._info.get(sid)
+                if entry is None or entry[0] < expired:
+                    missing.append(sid)
+                else:
+                    out[sid] = entry[1]
+            self.hits += len(out)
+            self.misses += len(missing)
+        if missing:
+            out.update(self._load(db, missing))
+        return out
+
+    def invalidate(self, enrollment_no: str):
+        with self._lock:
+            self._info.pop(enrollment_no, None)
+            self._epoch += 1
+            self._invalidated[enrollment_no] = self._epoch
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": len(self._info), "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+class MarkedSessions:
+    def __init__(self, max_sessions: int = 64):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sets: "OrderedDict[int, set[str]]" = OrderedDict()
+        self.skipped = 0
+
+    def filter_unmarked(self, session_id: int, ids) -> list[str]:
+        """The ids not known to be marked in this session."""
+        with self._lock:
+            marked = self._sets.get(session_id)
+            if marked is None:
+                return list(ids)
+            self._sets.move_to_end(session_id)
+            out = [sid for sid in ids if sid not in marked]
+            self.skipped += len(ids) - len(out)
+            return out
+
+    def add(self, session_id: int, ids):
+        """Record students as marked (after their insert committed or conflicted)."""
+        with self._lock:
+            marked = self._sets.get(session_id)
+            if marked is None:
+                marked = self._sets[session_id] = set()
+                while len(self._sets) > self.max_sessions:
+                    self._sets.popitem(last=False)
+            else:
+                self._sets.move_to_end(session_id)
+            marked.update(ids)
+
+    def forget_student(self, enrollment_no: str):
+        with self._lock:
+            for marked in self._sets.values():
+                marked.discard(enrollment_no)
+
+    def clear(self):
+        with self._lock:
+            self._sets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sets),
+                "max_sessions": self.max_sessions,
+                "skipped_inserts": self.skipped,
+            }
@@ -0,0 +1,159 @@
+# app/tracker.py
+"""
+Lightweight multi-face tracker for the WebSocket frame stream.
+
+Same scheme as SORT: every track carries a constant-velocity Kalman filter
+over its box (centre, area, aspect ratio). On each frame the filters predict
+where their faces moved, predictions and detections are paired by IoU with
+the Hungarian algorithm, and:
+
+- paired tracks correct their filter with the detection
+- unpaired detections start new tracks
+- tracks unseen for more than `max_missed` frames are dropped
+
+A track remembers who it was matched to, so the stream embeds a face once
+when its track appears (and again every `refresh_secs` while it is still
+unmatched), not once per frame.
+"""
+from typing import Optional
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) x1, y1, x2, y2 boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _box_to_z(bbox) -> np.ndarray:
+    w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    return np.array([bbox[0] + w / 2.0, bbox[1] + h / 2.0, w * h, w / max(h, 1e-6)], dtype=np.float64)
+
+
+def _z_to_box(z) -> np.ndarray:
+    area, ratio = max(z[2], 1e-6), max(z[3], 1e-6)
+    w = np.sqrt(area * ratio)
+    h = area / w
+    return np.array([z[0] - w / 2.0, z[1] - h / 2.0, z[0] + w / 2.0, z[1] + h / 2.0], dtype=np.float32)
+
+
+class KalmanBoxFilter:
+    """Constant-velocity Kalman filter, state (cx, cy, area, aspect, vcx, vcy, varea)."""
+
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1.0
+    H = np.eye(4, 7)
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+    R = np.diag([1.0, 1.0, 10.0, 10.0])
+
+    def __init__(self, bbox):
+        self.x = np.zeros(7)
+        self.x[:4] = _box_to_z(bbox)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])   # velocities unknown at first
+
+    def predict(self) -> np.ndarray:
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0   # never shrink to a negative area
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return _z_to_box(self.x)
+
+    def update(self, bbox):
+        y = _box_to_z(bbox) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+
+    @property
+    def box(self) -> np.ndarray:
+        return _z_to_box(self.x)
+
+
+class Track:
+    def __init__(self, track_id: int, bbox: np.ndarray, det_score: float, now: float):
+        self.id = track_id
+        self.kf = KalmanBoxFilter(bbox)
+        self.bbox = np.asarray(bbox[:4], dtype=np.float32)   # last detection
+        self.det_score = det_score
+        self.created_at = now
+        self.hits = 1
+        self.missed = 0
+        # identity
+        self.student_id: Optional[str] = None
+        self.score: Optional[float] = None
+        self.embedded_at: Optional[float] = None
+        self.embeddings = 0
+
+    def due_for_embedding(self, now: float, refresh_secs: float) -> bool:
+        """Embed new tracks once; unmatched ones again every refresh_secs."""
+        if self.student_id is not None:
+            return False
+        return self.embedded_at is None or now - self.embedded_at >= refresh_secs
+
+    def to_dict(self) -> dict:
+        return {
+            "track_id": self.id,
+            "bbox": [float(v) for v in self.bbox],
+            "student_id": self.student_id,
+            "score": self.score,
+        }
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 15):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks: list[Track] = []
+        self._next_id = 1
+        self.created = 0
+
+    def update(self, bboxes: np.ndarray, now: float) -> list[tuple[Track, int]]:
+        """
+        Advance every track by one frame with the (N, 5) detections
+        (x1, y1, x2, y2, score). Returns (track, detection index) for every
+        face seen in this frame, new tracks included.
+        """
+        predicted = np.array([t.kf.predict() for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        pairs: list[tuple[int, int]] = []
+        if len(self.tracks) and len(bboxes):
+            iou = iou_matrix(predicted, bboxes[:, :4])
+            rows, cols = linear_sum_assignment(iou, maximize=True)
+            pairs = [(r, c) for r, c in zip(rows.tolist(), cols.tolist()) if iou[r, c] >= self.iou_threshold]
+
+        seen: list[tuple[Track, int]] = []
+        paired_tracks = set()
+        paired_dets = set()
+        for r, c in pairs:
+            track = self.tracks[r]
+            track.kf.update(bboxes[c, :4])
+            track.bbox = bboxes[c, :4].astype(np.float32)
+            track.det_score = float(bboxes[c, 4])
+            track.hits += 1
+            track.missed = 0
+            seen.append((track, c))
+            paired_tracks.add(r)
+            paired_dets.add(c)
+
+        for r, track in enumerate(self.tracks):
+            if r not in paired_tracks:
+                track.missed += 1
+
+        for c in range(len(bboxes)):
+            if c not in paired_dets:
+                track = Track(self._next_id, bboxes[c], float(bboxes[c, 4]), now)
+                self._next_id += 1
+                self.created += 1
+                self.tracks.append(track)
+                seen.append((track, c))
+
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return seen
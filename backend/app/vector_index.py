@@ -0,0 +1,451 @@
+# app/vector_index.py
+"""
+Pluggable nearest-neighbour indexes over the packed gallery store.
+
+Indexes never own the vectors: they hold row numbers into the store
+(gallery_store.PackedGalleryStore) and score against its memory-mapped matrix.
+
+- ExactIndex: brute force over every live row (default, always correct).
+- IVFIndex:   inverted-file index. A spherical k-means coarse quantizer splits
+              the gallery into `nlist` cells; a query only scores the rows of
+              its `nprobe` closest cells. Recall/speed are traded with nprobe.
+- QuantizedIndex: brute force over a float16 or int8 copy of the gallery
+              (a half / a quarter of the bytes to stream per probe), then an
+              exact float32 re-rank of the best `rerank` candidates.
+
+All searches take a (Q, D) batch of normalized queries and return
+(rows, scores), both shaped (Q, k), best first; missing results are row -1
+with score -inf.
+
+snapshot() returns a copy that later add / remove calls do not change, so
+the gallery can search it (against a GalleryView) without holding its lock.
+"""
+import os
+import copy
+from typing import Optional
+
+import numpy as np
+
+
+def _topk(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Per-row top-k over a (Q, M) score matrix. Returns (cols, scores)."""
+    m = scores.shape[1]
+    if m == 0:
+        q = scores.shape[0]
+        return np.full((q, k), -1, dtype=np.int64), np.full((q, k), -np.inf, dtype=np.float32)
+    kk = min(k, m)
+    if kk == 1:
+        cols = scores.argmax(axis=1)[:, None]
+    else:
+        cols = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        order = np.argsort(-np.take_along_axis(scores, cols, axis=1), axis=1)
+        cols = np.take_along_axis(cols, order, axis=1)
+    top = np.take_along_axis(scores, cols, axis=1)
+    if kk < k:
+        pad = k - kk
+        cols = np.pad(cols, ((0, 0), (0, pad)), constant_values=-1)
+        top = np.pad(top, ((0, 0), (0, pad)), constant_values=-np.inf)
+    return cols, top
+
+
+class VectorIndex:
+    """Interface every index backend implements."""
+
+    name = "base"
+
+    def rebuild(self, store, rows: np.ndarray):
+        """Index exactly `rows` of `store` (called on load and after compaction)."""
+        raise NotImplementedError
+
+    def add(self, store, rows: np.ndarray):
+        raise NotImplementedError
+
+    def remove(self, rows: np.ndarray):
+        raise NotImplementedError
+
+    def search(self, store, queries: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def snapshot(self) -> "VectorIndex":
+        """Search-only copy of the current state (stateless indexes return self)."""
+        return self
+
+    def save(self, path: str, generation: int):
+        """Persist index state next to the store (no-op for stateless indexes)."""
+
+    def load(self, path: str, store, rows: np.ndarray, generation: int) -> bool:
+        """Restore persisted state. Returns False if a rebuild is needed."""
+        return False
+
+
+class ExactIndex(VectorIndex):
+    """Brute force: one (Q, N) matrix product over the live rows."""
+
+    name = "exact"
+
+    def rebuild(self, store, rows):
+        pass
+
+    def add(self, store, rows):
+        pass
+
+    def remove(self, rows):
+        pass
+
+    def search(self, store, queries, k=1):
+        n = store.count
+        scores = queries.astype(np.float32, copy=False).dot(store.vectors[:n].T)   # (Q, N)
+        scores[:, store.alive[:n] == 0] = -np.inf   # tombstones never win
+        rows, top = _topk(scores, k)
+        rows[~np.isfinite(top)] = -1
+        return rows, top
+
+
+def spherical_kmeans(x: np.ndarray, k: int, n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """Cosine k-means on normalized rows of x. Returns (k, D) unit centroids."""
+    rng = np.random.default_rng(seed)
+    k = min(k, x.shape[0])
+    centroids = x[rng.choice(x.shape[0], size=k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = x.dot(centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # re-seed empty cells with random points
+            sums[empty] = x[rng.choice(x.shape[0], size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file ANN index.
+
+    nlist:       number of cells (0 -> about 4*sqrt(N) at training time)
+    nprobe:      cells scanned per query (higher = better recall, slower)
+    min_train:   below this many live rows the index just brute-forces
+    retrain_growth: retrain the quantizer once the gallery grows this many
+                 times past the size it was trained on
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, min_train: int = 2048,
+                 retrain_growth: float = 4.0, train_sample: int = 65536, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.retrain_growth = retrain_growth
+        self.train_sample = train_sample
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_on = 0
+        self._lists: list[list[int]] = []
+        self._list_arrays: list[Optional[np.ndarray]] = []
+        self._cell_of: dict[int, int] = {}   # row -> cell
+        self.dirty = False
+
+    # ---------------------------
+    # Training / assignment
+    # ---------------------------
+
+    def _train(self, store, rows: np.ndarray):
+        sample = rows
+        if sample.size > self.train_sample:
+            rng = np.random.default_rng(self.seed)
+            sample = rng.choice(rows, size=self.train_sample, replace=False)
+            sample.sort()
+        x = np.asarray(store.vectors[sample], dtype=np.float32)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(rows.size)))
+        self.centroids = spherical_kmeans(x, nlist, seed=self.seed)
+        self.trained_on = int(rows.size)
+
+    def _reset_lists(self):
+        nlist = self.centroids.shape[0]
+        self._lists = [[] for _ in range(nlist)]
+        self._list_arrays = [None] * nlist
+        self._cell_of = {}
+
+    def _assign(self, store, rows: np.ndarray, cells: Optional[np.ndarray] = None):
+        if rows.size == 0:
+            return
+        if cells is None:
+            cells = np.empty(rows.size, dtype=np.int64)
+            for start in range(0, rows.size, 8192):
+                chunk = rows[start:start + 8192]
+                cells[start:start + 8192] = store.vectors[chunk].dot(self.centroids.T).argmax(axis=1)
+        for r, c in zip(rows.tolist(), cells.tolist()):
+            self._lists[c].append(r)
+            self._list_arrays[c] = None
+            self._cell_of[r] = c
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def rebuild(self, store, rows):
+        if rows.size < self.min_train:
+            self.centroids = None
+            self.trained_on = 0
+            self._lists, self._list_arrays, self._cell_of = [], [], {}
+            return
+        if not self.trained or rows.size > self.retrain_growth * self.trained_on:
+            self._train(store, rows)
+        self._reset_lists()
+        self._assign(store, rows)
+        self.dirty = True
+
+    def add(self, store, rows):
+        if not self.trained:
+            live = store.live_rows()
+            if live.size >= self.min_train:
+                self.rebuild(store, live)
+            return
+        if len(self._cell_of) + rows.size > self.retrain_growth * self.trained_on:
+            self.rebuild(store, store.live_rows())
+            return
+        self._assign(store, rows)
+        self.dirty = True
+
+    def remove(self, rows):
+        if not self.trained:
+            return
+        for r in rows.tolist():
+            c = self._cell_of.pop(r, None)
+            if c is not None:
+                self._lists[c].remove(r)
+                self._list_arrays[c] = None
+        self.dirty = True
+
+    def _cell_rows(self, c: int) -> np.ndarray:
+        arr = self._list_arrays[c]
+        if arr is None:
+            arr = np.asarray(self._lists[c], dtype=np.int64)
+            self._list_arrays[c] = arr
+        return arr
+
+    def snapshot(self):
+        snap = copy.copy(self)
+        snap._list_arrays = [self._cell_rows(c) for c in range(len(self._lists))]
+        snap._lists, snap._cell_of = None, None   # search only reads the arrays
+        return snap
+
+    # ---------------------------
+    # Search
+    # ---------------------------
+
+    def search(self, store, queries, k=1):
+        if not self.trained:
+            return ExactIndex().search(store, queries, k)
+
+        queries = queries.astype(np.float32, copy=False)
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        coarse = queries.dot(self.centroids.T)                       # (Q, nlist)
+        probe_cells, _ = _topk(coarse, nprobe)
+
+        q = queries.shape[0]
+        out_rows = np.full((q, k), -1, dtype=np.int64)
+        out_scores = np.full((q, k), -np.inf, dtype=np.float32)
+        for i in range(q):
+            cand = np.concatenate([self._cell_rows(int(c)) for c in probe_cells[i]])
+            if cand.size == 0:
+                continue
+            scores = store.vectors[cand].dot(queries[i])[None, :]
+            cols, top = _topk(scores, k)
+            valid = cols[0] >= 0
+            out_rows[i, valid] = cand[cols[0][valid]]
+            out_scores[i, valid] = top[0][valid]
+        return out_rows, out_scores
+
+    # ---------------------------
+    # Persistence (<store>.ivf.npz)
+    # ---------------------------
+
+    def save(self, path, generation):
+        if not self.trained:
+            return
+        rows = np.fromiter(self._cell_of.keys(), dtype=np.int64, count=len(self._cell_of))
+        cells = np.fromiter(self._cell_of.values(), dtype=np.int64, count=len(self._cell_of))
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, rows=rows, cells=cells,
+                 generation=np.int64(generation), trained_on=np.int64(self.trained_on))
+        os.replace(tmp, path)
+        self.dirty = False
+
+    def load(self, path, store, rows, generation):
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as f:
+                centroids = f["centroids"]
+                saved_rows, saved_cells = f["rows"], f["cells"]
+                saved_gen = int(f["generation"])
+                trained_on = int(f["trained_on"])
+        except Exception as e:
+            print(f"Warning: could not load ANN index {path}: {e}")
+            return False
+        if centroids.shape[1] != store.dim:
+            return False
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_on = trained_on
+        self._reset_lists()
+        if saved_gen == generation and np.array_equal(np.sort(saved_rows), rows):
+            # same gallery snapshot: reuse the cell assignment as-is
+            self._assign(store, saved_rows, saved_cells)
+            self.dirty = False
+        else:
+            # gallery moved on: keep the trained quantizer, reassign rows
+            self._assign(store, rows)
+            self.dirty = True
+        return True
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    Brute force over a compressed in-memory copy of the live rows.
+
+    encoding="float16": half-precision copy of every vector.
+    encoding="int8":    symmetric per-row int8, x ~= codes * scale with
+                        scale = max|x| / 127.
+
+    Approximate scores are computed block by block (each block is widened to
+    float32 while it is in cache, so memory traffic stays at the compressed
+    size). The `rerank` best candidates per query are then re-scored against
+    the float32 store, so the returned scores, and every threshold decision
+    made on them, are exact float32 cosines. A true best match is only missed
+    if the approximation pushes it out of the top `rerank`.
+    """
+
+    def __init__(self, encoding: str = "int8", rerank: int = 16, block_rows: int = 512):
+        if encoding not in ("float16", "int8"):
+            raise ValueError(f"Unknown gallery encoding: {encoding!r}")
+        self.name = encoding
+        self.encoding = encoding
+        self.rerank = rerank
+        self.block_rows = block_rows
+        self._n = 0
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._rows = np.empty(0, dtype=np.int64)   # position -> store row
+        self._pos: dict[int, int] = {}             # store row -> position
+
+    def _encode(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self.encoding == "float16":
+            return x.astype(np.float16), np.ones(x.shape[0], dtype=np.float32)
+        scales = np.abs(x).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(x / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _reserve(self, n: int, dim: int):
+        cap = 0 if self._codes is None else self._codes.shape[0]
+        if n <= cap:
+            return
+        cap = max(1024, 2 * cap, n)
+        codes = np.zeros((cap, dim), dtype=np.float16 if self.encoding == "float16" else np.int8)
+        scales = np.ones(cap, dtype=np.float32)
+        rows = np.full(cap, -1, dtype=np.int64)
+        if self._n:
+            codes[:self._n] = self._codes[:self._n]
+            scales[:self._n] = self._scales[:self._n]
+            rows[:self._n] = self._rows[:self._n]
+        self._codes, self._scales, self._rows = codes, scales, rows
+
+    def rebuild(self, store, rows):
+        self._n = 0
+        self._codes = self._scales = None
+        self._rows = np.empty(0, dtype=np.int64)
+        self._pos = {}
+        self.add(store, rows)
+
+    def add(self, store, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[[r not in self._pos for r in rows.tolist()]] if self._pos else rows
+        if rows.size == 0:
+            return
+        self._reserve(self._n + rows.size, store.dim)
+        for start in range(0, rows.size, self.block_rows):
+            chunk = rows[start:start + self.block_rows]
+            codes, scales = self._encode(np.asarray(store.vectors[chunk], dtype=np.float32))
+            at = self._n + start
+            self._codes[at:at + chunk.size] = codes
+            self._scales[at:at + chunk.size] = scales
+            self._rows[at:at + chunk.size] = chunk
+        for i, r in enumerate(rows.tolist()):
+            self._pos[r] = self._n + i
+        self._n += rows.size
+
+    def remove(self, rows):
+        rows = [r for r in np.asarray(rows).tolist() if r in self._pos]
+        if rows:
+            # copy on write: snapshots still searching the old arrays stay intact
+            self._codes, self._scales, self._rows = self._codes.copy(), self._scales.copy(), self._rows.copy()
+        for r in rows:
+            pos = self._pos.pop(r)
+            last = self._n - 1
+            if pos != last:
+                # move the last entry into the hole
+                self._codes[pos] = self._codes[last]
+                self._scales[pos] = self._scales[last]
+                moved = int(self._rows[last])
+                self._rows[pos] = moved
+                self._pos[moved] = pos
+            self._rows[last] = -1
+            self._n -= 1
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the live codes, scales and row map."""
+        if self._codes is None:
+            return 0
+        return self._n * (self._codes.shape[1] * self._codes.itemsize + 4 + 8)
+
+    def approx_scores(self, queries: np.ndarray) -> np.ndarray:
+        """(Q, n) approximate scores against every indexed position."""
+        queries = queries.astype(np.float32, copy=False)
+        out = np.empty((queries.shape[0], self._n), dtype=np.float32)
+        for start in range(0, self._n, self.block_rows):
+            end = min(start + self.block_rows, self._n)
+            out[:, start:end] = queries.dot(self._codes[start:end].astype(np.float32).T)
+        if self.encoding == "int8":
+            out *= self._scales[:self._n]
+        return out
+
+    def snapshot(self):
+        # add() only writes past _n and remove() copies first, so views are stable
+        snap = copy.copy(self)
+        snap._codes = None if self._codes is None else self._codes[:self._n]
+        snap._scales = None if self._scales is None else self._scales[:self._n]
+        snap._rows = self._rows[:self._n]
+        snap._pos = None
+        return snap
+
+    def search(self, store, queries, k=1):
+        queries = queries.astype(np.float32, copy=False)
+        q = queries.shape[0]
+        if self._n == 0:
+            return np.full((q, k), -1, dtype=np.int64), np.full((q, k), -np.inf, dtype=np.float32)
+
+        kk = min(max(k, self.rerank), self._n)
+        cols, _ = _topk(self.approx_scores(queries), kk)
+        cand = self._rows[cols]                                               # (Q, kk) store rows
+        exact = np.einsum("qkd,qd->qk", store.vectors[cand], queries)        # float32 re-rank
+        order, top = _topk(exact, k)
+        rows = np.where(order >= 0, np.take_along_axis(cand, np.maximum(order, 0), axis=1), -1)
+        return rows, top
+
+
+def make_index(backend: str, **knobs) -> VectorIndex:
+    backend = (backend or "exact").lower()
+    if backend == "exact":
+        return ExactIndex()
+    if backend == "ivf":
+        return IVFIndex(**knobs)
+    if backend in ("float16", "int8"):
+        return QuantizedIndex(encoding=backend, **knobs)
+    raise ValueError(f"Unknown vector index backend: {backend!r}")
@@ -0,0 +1,220 @@
+# benchmarks/bench_attendance_db.py
+"""
+Seeds a scratch database with a large attendance history and times the
+queries behind /recognize, /students/{id}/attendance, /sessions/active and
+/faculty/{id}/classes_with_stats, first without and then with the indexes
+and the unique (enrollment_no, session_id) constraint of migration 0001.
+
+The target database is DROPPED and recreated, never point it at real data.
+
+Usage (from backend/):
+    python benchmarks/bench_attendance_db.py --url postgresql://postgres:pw@localhost:5432/fa_bench
+    python benchmarks/bench_attendance_db.py --url sqlite:///bench.sqlite --students 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import MetaData, create_engine, insert, select, func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from app.database import Base
+from app.models import Student, Faculty, Class, Session as DBSess, Attendance, PredictionLog
+
+
+def bare_metadata() -> MetaData:
+    """The model tables without secondary indexes or unique constraints (the pre-0001 schema)."""
+    md = MetaData()
+    for table in Base.metadata.sorted_tables:
+        t = table.to_metadata(md)
+        t.indexes.clear()
+        for c in [c for c in t.constraints if c.__class__.__name__ == "UniqueConstraint"]:
+            t.constraints.discard(c)
+    return md
+
+
+def add_indexes(engine):
+    """Migration 0001: the model indexes plus the attendance uniqueness."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for ix in table.indexes:
+                ix.create(conn)
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_attendance_enrollment_session ON attendance (enrollment_no, session_id)"
+        ))
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE"))
+
+
+def seed(engine, n_students: int, n_faculty: int, classes_per_faculty: int, sessions_per_class: int,
+         attend_rate: float, n_logs: int, seed_value: int = 0):
+    rnd = random.Random(seed_value)
+    start = datetime(2022, 1, 1, 9, 0)
+    with engine.begin() as conn:
+        conn.execute(insert(Student), [
+            {"enrollment_no": f"S{i:06d}", "name": f"student {i}", "semester": str(1 + i % 8), "created_at": start}
+            for i in range(n_students)
+        ])
+        conn.execute(insert(Faculty), [
+            {"faculty_id": f"F{i:04d}", "name": f"faculty {i}", "email": f"f{i}@example.com", "created_at": start}
+            for i in range(n_faculty)
+        ])
+        classes = []
+        for f in range(n_faculty):
+            for c in range(classes_per_faculty):
+                classes.append({"id": len(classes) + 1, "title": f"class {f}-{c}", "course_code": f"C{c}",
+                                "faculty_id": f"F{f:04d}", "created_at": start})
+        conn.execute(insert(Class), classes)
+
+        # each class has a fixed group of ~60 students that attend its sessions
+        sess_rows, att_rows = [], []
+        for cls in classes:
+            group = rnd.sample(range(n_students), min(60, n_students))
+            for k in range(sessions_per_class):
+                sid = len(sess_rows) + 1
+                t0 = start + timedelta(days=k, hours=cls["id"] % 8)
+                sess_rows.append({"id": sid, "class_id": cls["id"], "session_date": t0.date(), "start_time": t0,
+                                  "end_time": t0 + timedelta(hours=1), "is_active": True, "created_at": t0})
+                for s in group:
+                    if rnd.random() < attend_rate:
+                        att_rows.append({"enrollment_no": f"S{s:06d}", "date": t0.date(), "time": t0.time(),
+                                         "timestamp": t0, "confidence": 0.8, "session_id": sid})
+        conn.execute(insert(DBSess), sess_rows)
+        for i in range(0, len(att_rows), 50000):
+            conn.execute(insert(Attendance), att_rows[i:i + 50000])
+
+        log_rows = [{"attempted_at": start + timedelta(seconds=30 * i), "predicted_enrollment": None,
+                     "confidence": 0.5, "status": "NO_MATCH"} for i in range(n_logs)]
+        for i in range(0, len(log_rows), 50000):
+            conn.execute(insert(PredictionLog), log_rows[i:i + 50000])
+    return len(sess_rows), len(att_rows)
+
+
+def queries(n_students: int, n_faculty: int, n_sessions: int):
+    """(name, fn(db, rnd)) pairs mirroring the hot endpoint queries."""
+    def student_attendance(db, rnd):
+        sid = f"S{rnd.randrange(n_students):06d}"
+        return db.query(Attendance).filter(Attendance.enrollment_no == sid).all()
+
+    def already_marked(db, rnd):
+        sid = f"S{rnd.randrange(n_students):06d}"
+        return db.query(Attendance.id).filter_by(enrollment_no=sid, session_id=rnd.randrange(1, n_sessions + 1)).first()
+
+    def active_sessions(db, rnd):
+        return db.query(DBSess).filter(DBSess.end_time >= datetime(2099, 1, 1)).all()
+
+    def class_stats(db, rnd):
+        fid = f"F{rnd.randrange(n_faculty):04d}"
+        class_ids = select(Class.id).where(Class.faculty_id == fid).scalar_subquery()
+        return (
+            db.query(DBSess.id, func.count(Attendance.id))
+            .outerjoin(Attendance, Attendance.session_id == DBSess.id)
+            .filter(DBSess.class_id.in_(class_ids))
+            .group_by(DBSess.id)
+            .all()
+        )
+
+    def recent_predictions(db, rnd):
+        since = datetime(2022, 1, 1) + timedelta(days=rnd.randrange(30))
+        return db.query(func.count(PredictionLog.id)).filter(
+            PredictionLog.attempted_at >= since, PredictionLog.attempted_at < since + timedelta(hours=1)
+        ).scalar()
+
+    return [
+        ("student attendance", student_attendance),
+        ("already marked?", already_marked),
+        ("active sessions", active_sessions),
+        ("faculty class stats", class_stats),
+        ("predictions last hour", recent_predictions),
+    ]
+
+
+def time_queries(engine, qs, repeat: int, seed_value: int = 1) -> dict:
+    out = {}
+    with Session(engine) as db:
+        for name, fn in qs:
+            rnd = random.Random(seed_value)
+            fn(db, rnd)   # warm caches / plans
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                fn(db, rnd)
+            out[name] = 1000.0 * (time.perf_counter() - t0) / repeat
+    return out
+
+
+def time_marking(engine, n_students: int, n_sessions: int, repeat: int, seed_value: int = 2) -> dict:
+    """Select-then-insert vs INSERT ... ON CONFLICT DO NOTHING for repeated recognitions."""
+    dialect_insert = sqlite.insert if engine.dialect.name == "sqlite" else postgresql.insert
+    stmt = dialect_insert(Attendance).on_conflict_do_nothing(index_elements=["enrollment_no", "session_id"])
+    now = datetime.now()
+
+    def row(rnd):
+        return {"enrollment_no": f"S{rnd.randrange(n_students):06d}", "date": now.date(), "time": now.time(),
+                "timestamp": now, "confidence": 0.9, "session_id": rnd.randrange(1, n_sessions + 1)}
+
+    out = {}
+    with Session(engine) as db:
+        rnd = random.Random(seed_value)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            r = row(rnd)
+            if db.query(Attendance.id).filter_by(enrollment_no=r["enrollment_no"], session_id=r["session_id"]).first() is None:
+                db.execute(insert(Attendance), [r])
+            db.commit()
+        out["select + insert"] = 1000.0 * (time.perf_counter() - t0) / repeat
+
+        rnd = random.Random(seed_value)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            db.execute(stmt, [row(rnd)])
+            db.commit()
+        out["on conflict do nothing"] = 1000.0 * (time.perf_counter() - t0) / repeat
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark attendance queries with and without indexes")
+    parser.add_argument("--url", required=True, help="scratch database URL (will be wiped)")
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--faculty", type=int, default=100)
+    parser.add_argument("--classes-per-faculty", type=int, default=5)
+    parser.add_argument("--sessions-per-class", type=int, default=120)
+    parser.add_argument("--attend-rate", type=float, default=0.8)
+    parser.add_argument("--logs", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    md = bare_metadata()
+    md.drop_all(engine)
+    md.create_all(engine)
+
+    t0 = time.perf_counter()
+    n_sessions, n_att = seed(engine, args.students, args.faculty, args.classes_per_faculty,
+                             args.sessions_per_class, args.attend_rate, args.logs)
+    print(f"seeded {args.students} students, {n_sessions} sessions, {n_att} attendance rows, "
+          f"{args.logs} prediction logs in {time.perf_counter() - t0:.1f}s\n")
+
+    qs = queries(args.students, args.faculty, n_sessions)
+    before = time_queries(engine, qs, args.repeat)
+    t0 = time.perf_counter()
+    add_indexes(engine)
+    print(f"migration 0001 indexes built in {time.perf_counter() - t0:.1f}s\n")
+    after = time_queries(engine, qs, args.repeat)
+
+    print(f"{'query (ms)':<26}{'no index':>12}{'indexed':>12}{'speedup':>10}")
+    for name, _ in qs:
+        print(f"{name:<26}{before[name]:12.3f}{after[name]:12.3f}{before[name] / max(after[name], 1e-9):9.1f}x")
+
+    print(f"\n{'marking attendance (ms)':<26}")
+    for name, ms in time_marking(engine, args.students, n_sessions, args.repeat).items():
+        print(f"{name:<26}{ms:12.3f}")
@@ -0,0 +1,97 @@
+# benchmarks/bench_decode.py
+"""
+Decode / detect / align / embed timings for uploaded probes: full-resolution
+decode vs the bounded, reduced-resolution decode path (DECODE_MAX_SIDE),
+plus top-1 embedding agreement between the two.
+
+Each reduced path is run twice: with the default alignment (faces of at least
+ALIGN_MIN_FACE_PX on the reduced image are aligned there) and with
+ALIGN_FULL_RESOLUTION (every crop from a full-resolution decode).
+"cos vs full-res align" is the cosine between the two for the same detections,
+i.e. what aligning from the reduced image costs in embedding accuracy.
+
+Usage (from backend/):
+    python benchmarks/bench_decode.py --images ../data/raw --max-sides 1280,960,640
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
+import embed_utils
+from embed_utils import get_face_embedding, warmup
+
+STAGES = ["decode", "detect", "align", "embed"]
+
+
+def run(images: list[bytes], max_side: int, repeat: int, full_res_align: bool = False):
+    embed_utils.config.DECODE_MAX_SIDE = max_side
+    embed_utils.config.ALIGN_FULL_RESOLUTION = full_res_align
+    totals = {k: 0.0 for k in STAGES}
+    embs = []
+    n = 0
+    for r in range(repeat):
+        for content in images:
+            timings: dict = {}
+            try:
+                emb = get_face_embedding(content, timings)
+            except ValueError:
+                if r == 0:
+                    embs.append(None)
+                continue
+            if r == 0:
+                embs.append(emb)
+            for k in STAGES:
+                totals[k] += timings.get(k, 0.0)
+            n += 1
+    return {k: 1000.0 * v / max(n, 1) for k, v in totals.items()}, embs
+
+
+def mean_cos(a: list, b: list) -> str:
+    sims = [float(x.dot(y)) for x, y in zip(a, b) if x is not None and y is not None]
+    return f"{np.mean(sims):13.4f}" if sims else f"{'n/a':>13}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark probe decode paths")
+    parser.add_argument("--images", default=os.path.join(REPO_ROOT, "data", "raw"))
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-sides", default="1280,960,640")
+    args = parser.parse_args()
+
+    images = []
+    for fname in sorted(os.listdir(args.images)):
+        if fname.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(args.images, fname), "rb") as f:
+                images.append(f.read())
+        if len(images) >= args.limit:
+            break
+    if not images:
+        print(f"No images found in {args.images}")
+        sys.exit(1)
+
+    warmup()
+    print(f"{len(images)} images x {args.repeat} repeats, ms per image\n")
+    print(f"{'decode path':<30}" + "".join(f"{k:>10}" for k in STAGES) + f"{'total':>10}{'cos vs full':>13}"
+          f"{'cos vs full-res align':>23}")
+
+    base, base_embs = run(images, 0, args.repeat)
+    print(f"{'full resolution':<30}" + "".join(f"{base[k]:10.2f}" for k in STAGES) + f"{sum(base.values()):10.2f}")
+
+    for side in [int(s) for s in args.max_sides.split(",") if s.strip()]:
+        full, full_embs = run(images, side, args.repeat, full_res_align=True)
+        r, embs = run(images, side, args.repeat)
+        print(f"{'max side ' + str(side):<30}" + "".join(f"{r[k]:10.2f}" for k in STAGES) + f"{sum(r.values()):10.2f}"
+              + mean_cos(base_embs, embs) + f"{mean_cos(full_embs, embs):>23}")
+        print(f"{'max side ' + str(side) + ', full-res align':<30}" + "".join(f"{full[k]:10.2f}" for k in STAGES)
+              + f"{sum(full.values()):10.2f}" + mean_cos(base_embs, full_embs))
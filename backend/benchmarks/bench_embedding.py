@@ -0,0 +1,115 @@
+# benchmarks/bench_embedding.py
+"""
+Per-stage timing of the face pipeline: stock FaceAnalysis() (every model in
+the pack, 640x640 detector) vs the configured engine from embed_utils
+(detection + recognition only, EMBED_DET_SIZE, ORT_* session options).
+
+Usage (from backend/):
+    python benchmarks/bench_embedding.py                       # images from data/raw
+    python benchmarks/bench_embedding.py --det-sizes 640,480,320 --repeat 10
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
+import insightface
+from insightface.utils import face_align
+import embed_utils
+from embed_utils import bytes_to_rgb_image, build_face_analysis, largest_face_index
+
+STAGES = ["decode", "detect", "other_heads", "align", "embed"]
+
+
+def time_pipeline(fa, images: list[bytes], repeat: int) -> dict:
+    """Average ms per image for each stage."""
+    rec = fa.models["recognition"]
+    others = [m for name, m in fa.models.items() if name not in ("detection", "recognition")]
+    totals = {k: 0.0 for k in STAGES}
+    n = 0
+    for _ in range(repeat):
+        for content in images:
+            t0 = time.perf_counter()
+            img = bytes_to_rgb_image(content)
+            t1 = time.perf_counter()
+            bboxes, kpss = fa.det_model.detect(img, max_num=0, metric="default")
+            t2 = time.perf_counter()
+            if len(bboxes) == 0:
+                continue
+            # what FaceAnalysis.get() would also run for every face
+            faces = [insightface.app.common.Face(bbox=b[:4], kps=k, det_score=b[4]) for b, k in zip(bboxes, kpss)]
+            for m in others:
+                for face in faces:
+                    m.get(img, face)
+            t3 = time.perf_counter()
+            i = largest_face_index(bboxes)
+            crop = face_align.norm_crop(img, landmark=kpss[i], image_size=rec.input_size[0])
+            t4 = time.perf_counter()
+            rec.get_feat([crop])
+            t5 = time.perf_counter()
+
+            for k, dt in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                totals[k] += dt
+            n += 1
+    return {k: 1000.0 * v / max(n, 1) for k, v in totals.items()} | {"images": n}
+
+
+def load_images(path: str, limit: int) -> list[bytes]:
+    out = []
+    for fname in sorted(os.listdir(path)):
+        if fname.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(path, fname), "rb") as f:
+                out.append(f.read())
+        if len(out) >= limit:
+            break
+    return out
+
+
+def print_row(label: str, r: dict, baseline: dict = None):
+    total = sum(r[k] for k in STAGES)
+    cells = "  ".join(f"{r[k]:9.2f}" for k in STAGES)
+    saved = ""
+    if baseline is not None:
+        base_total = sum(baseline[k] for k in STAGES)
+        saved = f"  saved {base_total - total:8.2f} ms ({100.0 * (base_total - total) / base_total:5.1f}%)"
+    print(f"{label:<34}{cells}  {total:9.2f}{saved}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark face pipeline stages")
+    parser.add_argument("--images", default=os.path.join(REPO_ROOT, "data", "raw"))
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--det-sizes", default="", help="extra detector sizes to try, e.g. 480,320")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    if not images:
+        print(f"No images found in {args.images}")
+        sys.exit(1)
+    print(f"{len(images)} images x {args.repeat} repeats, ms per image\n")
+    print(f"{'engine':<34}" + "  ".join(f"{k:>9}" for k in STAGES) + f"  {'total':>9}")
+
+    stock = insightface.app.FaceAnalysis(name=embed_utils.config.EMBED_MODEL_PACK, root=embed_utils.config.EMBED_MODEL_ROOT)
+    stock.prepare(ctx_id=-1)
+    time_pipeline(stock, images[:1], 1)   # warm-up
+    base = time_pipeline(stock, images, args.repeat)
+    print_row("stock FaceAnalysis (all, 640)", base)
+    del stock
+
+    sizes = [embed_utils.config.EMBED_DET_SIZE] + [int(s) for s in args.det_sizes.split(",") if s.strip()]
+    for size in sizes:
+        fa = build_face_analysis(det_size=size)
+        time_pipeline(fa, images[:1], 1)
+        r = time_pipeline(fa, images, args.repeat)
+        print_row(f"configured (det+rec, {size})", r, base)
+        del fa
@@ -0,0 +1,113 @@
+# benchmarks/bench_gallery_quant.py
+"""
+Float32 brute force (ExactIndex) vs the float16 / int8 gallery encodings
+(QuantizedIndex) on a synthetic gallery: memory, per-probe latency and how
+often the quantized search agrees with float32.
+
+Genuine probes are noisy copies of gallery rows (cosine ~= --genuine-cos to
+their source), impostor probes are random. "top-1" is agreement on the best
+row; "decision" is agreement on (row, score >= threshold) as recognize uses
+it; "approx top-1" is the quantized scores alone, without the float32 re-rank.
+
+Usage (from backend/):
+    python benchmarks/bench_gallery_quant.py                         # 100k identities
+    python benchmarks/bench_gallery_quant.py --sizes 20000,200000 --rerank 8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(BACKEND_DIR, "app")
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
+from gallery_store import PackedGalleryStore
+from vector_index import ExactIndex, QuantizedIndex
+
+DIM = 512
+
+
+def unit(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_store(path: str, n: int, rng) -> PackedGalleryStore:
+    store = PackedGalleryStore.create(path, DIM, capacity=n)
+    for start in range(0, n, 50000):
+        m = min(50000, n - start)
+        vecs = unit(rng.standard_normal((m, DIM)))
+        store.append_many([(f"S{start + i:07d}", v) for i, v in enumerate(vecs)])
+    return store
+
+
+def make_probes(store: PackedGalleryStore, n: int, genuine_cos: float, rng) -> np.ndarray:
+    """Half genuine (noisy gallery rows), half impostors."""
+    half = n // 2
+    src = rng.choice(store.count, size=half, replace=False)
+    noise = unit(rng.standard_normal((half, DIM)))
+    sin = np.sqrt(1.0 - genuine_cos ** 2)
+    genuine = unit(genuine_cos * np.asarray(store.vectors[src]) + sin * noise)
+    impostors = unit(rng.standard_normal((n - half, DIM)))
+    return np.vstack([genuine, impostors])
+
+
+def time_search(index, store, probes: np.ndarray, repeat: int) -> tuple[float, np.ndarray, np.ndarray]:
+    """Average ms per single-probe search, plus the (rows, scores) of the last pass."""
+    index.search(store, probes[:1])   # warm-up (page in the matrix)
+    rows = np.empty(probes.shape[0], dtype=np.int64)
+    scores = np.empty(probes.shape[0], dtype=np.float32)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(probes.shape[0]):
+            r, s = index.search(store, probes[i:i + 1])
+            rows[i], scores[i] = r[0, 0], s[0, 0]
+    ms = 1000.0 * (time.perf_counter() - t0) / (repeat * probes.shape[0])
+    return ms, rows, scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark quantized gallery encodings")
+    parser.add_argument("--sizes", default="100000", help="gallery sizes, comma separated")
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--rerank", type=int, default=16)
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("MATCH_THRESHOLD", "0.65")))
+    parser.add_argument("--genuine-cos", type=float, default=0.7, help="cosine of genuine probes to their source")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    header = f"{'encoding':<10}{'memory MB':>11}{'ms/probe':>10}{'speedup':>9}{'top-1':>9}{'decision':>10}{'approx top-1':>14}"
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            store = make_store(os.path.join(tmp, f"bench_{n}.bin"), n, rng)
+            rows = store.live_rows()
+            probes = make_probes(store, args.probes, args.genuine_cos, rng)
+            print(f"\n{n} identities, {probes.shape[0]} probes (half genuine at cos {args.genuine_cos}), "
+                  f"threshold {args.threshold}, re-rank {args.rerank}")
+            print(header)
+
+            base_ms, base_rows, base_scores = time_search(ExactIndex(), store, probes, args.repeat)
+            base_mb = n * DIM * 4 / 2 ** 20
+            base_decision = np.where(base_scores >= args.threshold, base_rows, -1)
+            print(f"{'float32':<10}{base_mb:>11.1f}{base_ms:>10.2f}{1.0:>9.2f}{'':>9}{'':>10}{'':>14}")
+
+            for encoding in ("float16", "int8"):
+                index = QuantizedIndex(encoding=encoding, rerank=args.rerank)
+                index.rebuild(store, rows)
+                ms, q_rows, q_scores = time_search(index, store, probes, args.repeat)
+                decision = np.where(q_scores >= args.threshold, q_rows, -1)
+                approx_top1 = index._rows[index.approx_scores(probes).argmax(axis=1)]
+                print(
+                    f"{encoding:<10}{index.nbytes / 2 ** 20:>11.1f}{ms:>10.2f}{base_ms / ms:>9.2f}"
+                    f"{100.0 * np.mean(q_rows == base_rows):>8.1f}%"
+                    f"{100.0 * np.mean(decision == base_decision):>9.1f}%"
+                    f"{100.0 * np.mean(approx_top1 == base_rows):>13.1f}%"
+                )
+            store.close()
@@ -0,0 +1,58 @@
+"""Indexes for the hot lookups + one attendance row per student per session
+
+The base schema comes from database/facial_attendance.sql; this is the first
+revision on top of it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (index name, table, column) -- names match what index=True in models.py generates
+INDEXES = [
+    ("ix_attendance_enrollment_no", "attendance", "enrollment_no"),
+    ("ix_attendance_session_id", "attendance", "session_id"),
+    ("ix_sessions_class_id", "sessions", "class_id"),
+    ("ix_sessions_end_time", "sessions", "end_time"),
+    ("ix_classes_faculty_id", "classes", "faculty_id"),
+    ("ix_predictions_log_attempted_at", "predictions_log", "attempted_at"),
+]
+
+
+def upgrade():
+    for name, table, column in INDEXES:
+        op.create_index(name, table, [column], if_not_exists=True)
+
+    # Concurrent /recognize calls could insert the same (student, session)
+    # twice; keep the earliest row before adding the constraint. Rows without
+    # a session are left alone (NULLs never conflict).
+    op.execute(sa.text(
+        """
+        DELETE FROM attendance
+        WHERE session_id IS NOT NULL
+          AND id NOT IN (
+              SELECT MIN(id) FROM attendance
+              WHERE session_id IS NOT NULL
+              GROUP BY enrollment_no, session_id
+          )
+        """
+    ))
+    with op.batch_alter_table("attendance") as batch_op:
+        batch_op.create_unique_constraint(
+            "uq_attendance_enrollment_session", ["enrollment_no", "session_id"]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("attendance") as batch_op:
+        batch_op.drop_constraint("uq_attendance_enrollment_session", type_="unique")
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,39 @@
+"""Class rosters (class_enrollments)
+
+Which students belong to which class. Recognition with a session_id scores
+only the session's class roster, and attendance percentages use the roster
+size as the denominator.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "class_enrollments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("class_id", sa.Integer(), sa.ForeignKey("classes.id"), nullable=False),
+        sa.Column("enrollment_no", sa.String(50), sa.ForeignKey("students.enrollment_no"), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.UniqueConstraint("class_id", "enrollment_no", name="uq_class_enrollments_class_student"),
+    )
+    op.create_index("ix_class_enrollments_id", "class_enrollments", ["id"])
+    op.create_index("ix_class_enrollments_class_id", "class_enrollments", ["class_id"])
+    op.create_index("ix_class_enrollments_enrollment_no", "class_enrollments", ["enrollment_no"])
+
+
+def downgrade():
+    op.drop_index("ix_class_enrollments_enrollment_no", table_name="class_enrollments")
+    op.drop_index("ix_class_enrollments_class_id", table_name="class_enrollments")
+    op.drop_index("ix_class_enrollments_id", table_name="class_enrollments")
+    op.drop_table("class_enrollments")
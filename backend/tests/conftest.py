@@ -0,0 +1,43 @@
+# tests/conftest.py
+# Run from backend/:  python -m pytest
+import os
+import sys
+
+import numpy as np
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+# app.database builds its engine at import time: never point tests at a real server
+os.environ["DATABASE_URL"] = "sqlite://"
+
+
+def unit(rng: np.random.Generator, *shape) -> np.ndarray:
+    """Random L2-normalized float32 vectors."""
+    v = rng.standard_normal(shape).astype(np.float32)
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def db():
+    """Session on a fresh in-memory SQLite database with every table created."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app import models  # noqa: F401  (registers the tables)
+    from app.database import Base
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,69 @@
+# tests/test_audit.py
+import os
+
+import pytest
+
+pytest.importorskip("cv2")
+
+from app.audit import AuditWriter, content_hash, image_ext   # noqa: E402
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"x" * 100
+
+
+def write(path, size, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_prune_only_touches_the_shards(tmp_path):
+    root = str(tmp_path)
+    legacy = os.path.join(root, "20251208_052326_capture.jpg")
+    write(legacy, 5000, 1.0)                     # old flat layout: oldest and largest
+    other = os.path.join(root, "notes", "ab", "readme.txt")
+    write(other, 5000, 1.0)
+    old = os.path.join(root, "ab", "cd", "abcd01.jpg")
+    new = os.path.join(root, "ef", "01", "ef0102.jpg")
+    write(old, 600, 100.0)
+    write(new, 600, 200.0)
+
+    writer = AuditWriter(root, max_bytes=1000)
+    assert writer._scan_size() == 1200
+    writer._prune()
+
+    assert os.path.exists(legacy) and os.path.exists(other)
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert writer.stats()["pruned"] == 1
+    assert writer.stats()["total_bytes"] == 600
+
+
+def test_original_mode_keeps_the_upload_format(tmp_path):
+    writer = AuditWriter(str(tmp_path), mode="original")
+    path = writer.submit(PNG)
+    assert path == writer.path_for(content_hash(PNG), ".png")
+    assert image_ext(b"\xff\xd8\xff\xe0") == ".jpg"
+    assert image_ext(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == ".webp"
+    assert image_ext(b"nonsense") == ".bin"
+
+
+def test_submit_returns_none_when_nothing_will_be_stored(tmp_path):
+    assert AuditWriter(str(tmp_path), mode="off").submit(PNG) is None
+    writer = AuditWriter(str(tmp_path), mode="original", queue_size=1)
+    assert writer.submit(PNG) is not None
+    assert writer.submit(PNG + b"2") is None     # queue full: dropped
+    assert writer.stats()["dropped"] == 1
+
+
+def test_writer_stores_and_deduplicates(tmp_path):
+    writer = AuditWriter(str(tmp_path), mode="original")
+    writer.start()
+    first = writer.submit(PNG)
+    again = writer.submit(PNG)
+    writer.stop(timeout=5.0)
+    assert first == again
+    with open(first, "rb") as f:
+        assert f.read() == PNG
+    assert writer.stats()["written"] == 1
+    assert writer.stats()["deduplicated"] == 1
@@ -0,0 +1,96 @@
+# tests/test_embedding_cache.py
+import asyncio
+
+import numpy as np
+import pytest
+
+import app.embedding_cache as embedding_cache
+from app.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_lru_and_ttl(clock):
+    cache = EmbeddingCache(max_entries=2, ttl=10.0)
+    cache.put("a", np.ones(3, dtype=np.float32))
+    cache.put("b", np.ones(3, dtype=np.float32))
+    assert cache.lookup("a")[0]                 # a is now most recently used
+    cache.put("c", np.ones(3, dtype=np.float32))
+    assert not cache.lookup("b")[0]
+    assert cache.stats()["evictions"] == 1
+    clock[0] += 11.0
+    assert not cache.lookup("a")[0]
+    assert cache.stats()["entries"] == 1
+
+
+def test_only_embeddings_and_value_errors_are_cached():
+    cache = EmbeddingCache()
+    emb = np.ones(3, dtype=np.float32)
+    cache.put("a", emb)
+    assert not emb.flags.writeable              # shared between requests
+    cache.put("b", ValueError("No face detected"))
+    cache.put("c", RuntimeError("pool saturated"))
+    assert cache.lookup("b")[0] and not cache.lookup("c")[0]
+    with pytest.raises(ValueError):
+        EmbeddingCache.unwrap(cache.lookup("b")[1])
+    disabled = EmbeddingCache(max_entries=0)
+    disabled.put("a", emb)
+    assert not disabled.enabled and not disabled.lookup("a")[0]
+
+
+def test_concurrent_requests_compute_once():
+    cache = EmbeddingCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return np.full(3, len(calls), dtype=np.float32)
+
+    async def main():
+        results = await asyncio.gather(*(cache.get_or_compute("d", compute) for _ in range(5)))
+        again = await cache.get_or_compute("d", compute)
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(np.array_equal(r, results[0]) for r in results + [again])
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_failures_are_shared_or_retried_as_appropriate():
+    cache = EmbeddingCache()
+    calls = []
+
+    async def no_face():
+        calls.append("no face")
+        raise ValueError("No face detected")
+
+    async def saturated():
+        calls.append("saturated")
+        await asyncio.sleep(0.01)
+        raise RuntimeError("saturated")
+
+    async def ok():
+        calls.append("ok")
+        return np.zeros(3, dtype=np.float32)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.get_or_compute("x", no_face)
+        first = asyncio.ensure_future(cache.get_or_compute("y", saturated))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_compute("y", ok))
+        with pytest.raises(RuntimeError):
+            await first
+        return await waiter
+
+    emb = asyncio.run(main())
+    assert calls == ["no face", "saturated", "ok"]   # the ValueError was cached, the RuntimeError not
+    assert emb.shape == (3,)
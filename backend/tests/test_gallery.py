@@ -0,0 +1,143 @@
+# tests/test_gallery.py
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from app.gallery import Gallery
+from app.gallery_store import fuse_embeddings
+from app.vector_index import ExactIndex, IVFIndex, QuantizedIndex
+from conftest import unit
+
+DIM = 16
+
+
+def make_gallery(tmp_path, **kw) -> Gallery:
+    gallery = Gallery(os.path.join(tmp_path, "g.bin"), dim=DIM, **kw)
+    gallery.load()
+    return gallery
+
+
+def template_of(gallery, enrollment_no):
+    _, vecs, _ = gallery.subset([enrollment_no])
+    return vecs[0]
+
+
+def test_merge_weights_the_existing_template_by_its_image_count(tmp_path, rng):
+    face = unit(rng, DIM)
+    images = face + 0.3 * unit(rng, 4, DIM)                # four photos of one person
+    images /= np.linalg.norm(images, axis=1, keepdims=True)
+    gallery = make_gallery(tmp_path)
+    gallery.upsert("S1", fuse_embeddings(images[:3]))     # make_canonical over 3 images
+
+    stored = gallery.merge("S1", images[3], existing_images=3)
+
+    expected = fuse_embeddings(images)                     # as if all 4 had been fused at once
+    np.testing.assert_allclose(template_of(gallery, "S1"), stored, atol=1e-6)
+    # the stored template is normalized, so this is close to, not exactly, the 4-image mean
+    assert float(stored.dot(expected)) > 0.999
+    assert float(stored.dot(expected)) > float(images[3].dot(expected))   # better than replacing
+
+
+def test_merge_without_a_template_stores_the_embedding(tmp_path, rng):
+    gallery = make_gallery(tmp_path)
+    emb = unit(rng, DIM)
+    gallery.merge("S1", emb, existing_images=5)
+    np.testing.assert_allclose(template_of(gallery, "S1"), emb, atol=1e-6)
+    gallery.upsert("S2", unit(rng, DIM))
+    gallery.merge("S2", emb, existing_images=0)            # no other images: replace
+    np.testing.assert_allclose(template_of(gallery, "S2"), emb, atol=1e-6)
+
+
+def backends():
+    return [
+        ExactIndex(),
+        IVFIndex(nlist=4, nprobe=4, min_train=8),
+        QuantizedIndex("int8", rerank=4),
+    ]
+
+
+@pytest.mark.parametrize("index", backends(), ids=lambda i: i.name)
+def test_search_remove_and_replace(tmp_path, rng, index):
+    gallery = make_gallery(tmp_path, index=index)
+    vecs = unit(rng, 20, DIM)
+    for i, v in enumerate(vecs):
+        gallery.upsert(f"S{i}", v)
+    assert len(gallery) == 20 and "S3" in gallery
+
+    sid, score = gallery.search(vecs[3])
+    assert sid == "S3" and score == pytest.approx(1.0, abs=1e-5)
+    assert [m[0] for m in gallery.search_many(vecs[[1, 2]])] == ["S1", "S2"]
+
+    version = gallery.version()
+    assert gallery.remove("S3")
+    assert not gallery.remove("S3")
+    assert gallery.version() != version
+    assert gallery.search(vecs[3])[0] != "S3"
+
+    gallery.upsert("S4", vecs[3])                  # re-enrolled with a new photo
+    assert gallery.search(vecs[3])[0] == "S4"
+    assert gallery.ids() == {f"S{i}" for i in range(20)} - {"S3"}
+
+
+def test_empty_gallery(tmp_path):
+    gallery = make_gallery(tmp_path)
+    assert gallery.search(np.ones(DIM, dtype=np.float32)) == (None, float("-inf"))
+    assert gallery.match_unique(np.ones((2, DIM), dtype=np.float32), 0.5) == [(None, float("-inf"))] * 2
+
+
+def test_subset_follows_the_requested_order(tmp_path, rng):
+    gallery = make_gallery(tmp_path)
+    vecs = unit(rng, 3, DIM)
+    for i, v in enumerate(vecs):
+        gallery.upsert(f"S{i}", v)
+    found, sub, version = gallery.subset(["S2", "missing", "S0"])
+    assert found == ["S2", "S0"]
+    np.testing.assert_array_equal(sub, vecs[[2, 0]])
+    assert version == gallery.version()
+
+
+def test_other_workers_pick_up_changes_and_compaction(tmp_path, rng):
+    a = make_gallery(tmp_path, compact_dead_ratio=0.25, compact_min_dead=2)
+    b = make_gallery(tmp_path)
+    vecs = unit(rng, 6, DIM)
+    for i, v in enumerate(vecs):
+        a.upsert(f"S{i}", v)
+    assert len(b) == 6
+    a.remove("S0")
+    a.remove("S1")                                 # compacts: row numbers change
+    assert a.store.count == 4
+    assert b.ids() == {"S2", "S3", "S4", "S5"}
+    assert b.search(vecs[4])[0] == "S4"
+
+
+def test_searches_run_while_the_gallery_is_written(tmp_path, rng):
+    gallery = make_gallery(tmp_path, compact_dead_ratio=0.2, compact_min_dead=4)
+    stable = unit(rng, 8, DIM)
+    for i, v in enumerate(stable):
+        gallery.upsert(f"K{i}", v)
+    churn = unit(rng, 200, DIM)
+    errors = []
+
+    def write():
+        for i, v in enumerate(churn):
+            gallery.upsert(f"T{i}", v)
+            if i % 3 == 0:
+                gallery.remove(f"T{i}")
+
+    def read():
+        try:
+            for _ in range(200):
+                for i, m in enumerate(gallery.search_many(stable)):
+                    assert m[0] == f"K{i}"
+        except Exception as e:   # surfaced below
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(gallery) == 8 + 200 - len(range(0, 200, 3))
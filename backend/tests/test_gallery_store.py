@@ -0,0 +1,112 @@
+# tests/test_gallery_store.py
+import os
+
+import numpy as np
+import pytest
+
+from app.gallery_store import PackedGalleryStore, fuse_embeddings
+from conftest import unit
+
+DIM = 8
+
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, "gallery.bin")
+
+
+def live_ids(store):
+    return [store.id_at(int(r)) for r in store.live_rows()]
+
+
+def test_append_find_and_replace(path, rng):
+    store = PackedGalleryStore.create(path, DIM, capacity=4)
+    a, a2, b = unit(rng, 3, DIM)
+    assert store.append("A", a) == 0
+    assert store.append("B", b) == 1
+    gen = store.generation
+    assert store.append("A", a2) == 2          # replacing tombstones the old row
+    assert store.generation > gen
+    assert (store.count, store.live) == (3, 2)
+    assert store.find("A") == 2
+    np.testing.assert_array_equal(store.vectors[store.find("A")], a2)
+    assert live_ids(store) == ["B", "A"]
+
+
+def test_tombstone_and_compact(path, rng):
+    store = PackedGalleryStore.create(path, DIM, capacity=8)
+    for i, v in enumerate(unit(rng, 4, DIM)):
+        store.append(f"S{i}", v)
+    assert store.tombstone("S1")
+    assert not store.tombstone("S1")
+    assert store.find("S1") is None
+    assert store.dead_ratio() == pytest.approx(0.25)
+    assert not store.maybe_compact(dead_ratio=0.5, min_dead=1)
+    assert store.maybe_compact(dead_ratio=0.25, min_dead=1)
+    assert (store.count, store.live, store.capacity) == (3, 3, 8)
+    assert live_ids(store) == ["S0", "S2", "S3"]
+
+
+def test_append_grows_the_file(path, rng):
+    store = PackedGalleryStore.create(path, DIM, capacity=2)
+    vecs = unit(rng, 5, DIM)
+    for i, v in enumerate(vecs):
+        store.append(f"S{i}", v)
+    assert store.capacity >= 5
+    assert live_ids(store) == [f"S{i}" for i in range(5)]
+    np.testing.assert_array_equal(store.vectors[:5], vecs)
+
+
+def test_append_many_one_grow_and_last_pair_wins(path, rng):
+    store = PackedGalleryStore.create(path, DIM, capacity=2)
+    store.append("A", unit(rng, DIM))
+    vecs = unit(rng, 4, DIM)
+    rows = store.append_many([("A", vecs[0]), ("B", vecs[1]), ("C", vecs[2]), ("B", vecs[3])])
+    assert len(rows) == 3
+    assert sorted(live_ids(store)) == ["A", "B", "C"]
+    np.testing.assert_array_equal(store.vectors[store.find("B")], vecs[3])
+    assert store.append_many([]) == []
+
+
+def test_other_handles_see_writes_and_rewrites(path, rng):
+    writer = PackedGalleryStore.create(path, DIM, capacity=2)
+    reader = PackedGalleryStore(path, mode="r")
+    writer.append("A", unit(rng, DIM))
+    assert live_ids(reader) == ["A"]            # same pages: appends are visible at once
+    assert not reader.refresh()
+
+    writer.append("B", unit(rng, DIM))
+    writer.append("C", unit(rng, DIM))          # grows: the file is rewritten
+    assert reader.superseded
+    assert reader.refresh()
+    assert live_ids(reader) == ["A", "B", "C"]
+    assert reader.generation == writer.generation
+
+
+def test_view_is_a_snapshot(path, rng):
+    store = PackedGalleryStore.create(path, DIM, capacity=8)
+    store.append("A", unit(rng, DIM))
+    view = store.view()
+    store.append("B", unit(rng, DIM))
+    store.tombstone("A")
+    assert [view.id_at(int(r)) for r in view.live_rows()] == ["A"]
+
+
+def test_open_or_create_checks_the_file(path, tmp_path):
+    PackedGalleryStore.open_or_create(path, DIM).close()
+    with pytest.raises(ValueError):
+        PackedGalleryStore.open_or_create(path, DIM * 2)
+    junk = os.path.join(tmp_path, "junk.bin")
+    with open(junk, "wb") as f:
+        f.write(b"\0" * 4096)
+    with pytest.raises(ValueError):
+        PackedGalleryStore(junk)
+
+
+def test_fuse_embeddings(rng):
+    a, b = unit(rng, 2, DIM)
+    fused = fuse_embeddings(np.vstack([a, b]))
+    assert np.linalg.norm(fused) == pytest.approx(1.0, abs=1e-6)
+    assert float(fused.dot(a)) == pytest.approx(float(fused.dot(b)), abs=1e-6)
+    heavy = fuse_embeddings(np.vstack([a, b]), weights=[3, 1])
+    assert float(heavy.dot(a)) > float(heavy.dot(b))
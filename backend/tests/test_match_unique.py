@@ -0,0 +1,40 @@
+# tests/test_match_unique.py
+import os
+
+import numpy as np
+
+from app.gallery import Gallery, assign_unique
+from app.roster import RosterView
+
+# probe 0 is above the 0.5 threshold only for A, but the raw-score optimum
+# (0.49 + 0.49 > 0.55 - 0.50) pairs both probes below threshold instead
+SCORES = np.array([[0.55, 0.49],
+                   [0.49, -0.50]], dtype=np.float32)
+
+
+def test_assign_unique_keeps_the_above_threshold_pair():
+    assert assign_unique(SCORES, 0.5) == [0, -1]
+
+
+def test_assign_unique_maximizes_accepted_pairs_first():
+    scores = np.array([[0.90, 0.35],
+                       [0.35, 0.20]], dtype=np.float32)
+    # 0.90 alone beats 0.35 + 0.35, but both probes can be accepted
+    assert assign_unique(scores, 0.3) == [1, 0]
+
+
+def test_roster_match_unique_thresholds_before_assigning():
+    view = RosterView(1, ["A", "B"], SCORES.T.copy(), version=(0, 0))
+    out = view.match_unique(np.eye(2, dtype=np.float32), threshold=0.5)
+    assert out[0] == ("A", float(SCORES[0, 0]))
+    assert out[1][0] is None
+
+
+def test_gallery_match_unique_thresholds_before_assigning(tmp_path):
+    gallery = Gallery(os.path.join(tmp_path, "g.bin"), dim=2)
+    gallery.load()
+    gallery.upsert("A", np.array([1.0, 0.0], dtype=np.float32))
+    gallery.upsert("B", np.array([0.0, 1.0], dtype=np.float32))
+    out = gallery.match_unique(SCORES, threshold=0.5, k=2)   # probe . A, probe . B == SCORES
+    assert out[0][0] == "A"
+    assert out[1][0] is None
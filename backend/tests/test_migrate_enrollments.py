@@ -0,0 +1,73 @@
+# tests/test_migrate_enrollments.py
+import os
+
+import numpy as np
+
+from app.gallery import Gallery
+from app.gallery_store import PackedGalleryStore
+from app.migrate_enrollments import migrate, EMB_DIM
+from conftest import unit
+
+
+def write_npy(enroll_dir, enrollment_no, emb):
+    np.save(os.path.join(enroll_dir, f"{enrollment_no}__canonical.npy"), emb)
+
+
+def live_ids(path):
+    store = PackedGalleryStore(path, mode="r")
+    ids = {store.id_at(int(r)) for r in store.live_rows()}
+    store.close()
+    return ids
+
+
+def test_migrate_keeps_rows_enrolled_after_the_auto_import(tmp_path, rng):
+    enroll_dir = str(tmp_path)
+    path = os.path.join(enroll_dir, "gallery.bin")
+    legacy = unit(rng, 2, EMB_DIM)
+    write_npy(enroll_dir, "OLD1", legacy[0])
+    write_npy(enroll_dir, "OLD2", legacy[1])
+
+    # backend start-up: the legacy files are imported, then a student enrolls
+    gallery = Gallery(path, legacy_dir=enroll_dir, dim=EMB_DIM)
+    gallery.load()
+    new = unit(rng, EMB_DIM)
+    gallery.upsert("NEW1", new)
+
+    # the documented manual step afterwards
+    assert migrate(enroll_dir, path, delete_npy=True) == 0
+
+    assert live_ids(path) == {"OLD1", "OLD2", "NEW1"}
+    store = PackedGalleryStore(path, mode="r")
+    np.testing.assert_allclose(store.vectors[store.find("NEW1")], new)
+    store.close()
+    assert not [f for f in os.listdir(enroll_dir) if f.endswith(".npy")]
+
+
+def test_migrate_only_appends_missing_students(tmp_path, rng):
+    enroll_dir = str(tmp_path)
+    path = os.path.join(enroll_dir, "gallery.bin")
+    store = PackedGalleryStore.create(path, EMB_DIM)
+    kept = unit(rng, EMB_DIM)
+    store.append("S1", kept)
+    store.close()
+    write_npy(enroll_dir, "S1", unit(rng, EMB_DIM))   # stale legacy copy of S1
+    write_npy(enroll_dir, "S2", unit(rng, EMB_DIM))
+
+    assert migrate(enroll_dir, path) == 1
+
+    store = PackedGalleryStore(path, mode="r")
+    assert {store.id_at(int(r)) for r in store.live_rows()} == {"S1", "S2"}
+    np.testing.assert_allclose(store.vectors[store.find("S1")], kept)
+    store.close()
+
+
+def test_force_rebuilds_from_npy_only(tmp_path, rng):
+    enroll_dir = str(tmp_path)
+    path = os.path.join(enroll_dir, "gallery.bin")
+    store = PackedGalleryStore.create(path, EMB_DIM)
+    store.append("S1", unit(rng, EMB_DIM))
+    store.close()
+    write_npy(enroll_dir, "S2", unit(rng, EMB_DIM))
+
+    assert migrate(enroll_dir, path, force=True) == 1
+    assert live_ids(path) == {"S2"}
@@ -0,0 +1,52 @@
+# tests/test_pagination.py
+import pytest
+from fastapi import HTTPException
+
+from app.models import Student
+from app.pagination import decode_cursor, encode_cursor, keyset_page, list_or_page
+
+
+def to_dict(r):
+    return r.enrollment_no
+
+
+@pytest.fixture
+def students(db):
+    for i in range(7):
+        db.add(Student(enrollment_no=f"S{i:02d}", name=f"n{i}", semester="7"))
+    db.commit()
+    return db.query(Student.enrollment_no)
+
+
+def test_keyset_pages_cover_every_row_once(students):
+    seen, cursor = [], None
+    while True:
+        page = keyset_page(students, Student.enrollment_no, 3, cursor, to_dict)
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"S{i:02d}" for i in range(7)]
+
+
+def test_last_full_page_has_no_cursor(students):
+    page = keyset_page(students.filter(Student.enrollment_no < "S06"), Student.enrollment_no, 3,
+                       encode_cursor("S02"), to_dict)
+    assert page == {"items": ["S03", "S04", "S05"], "next_cursor": None}
+
+
+def test_list_or_page(students):
+    assert list_or_page(students, Student.enrollment_no, None, None, to_dict, max_limit=2) == \
+        [f"S{i:02d}" for i in range(7)]
+    page = list_or_page(students, Student.enrollment_no, 100, None, to_dict, max_limit=2)
+    assert page["items"] == ["S00", "S01"]           # limit capped at max_limit
+    with pytest.raises(HTTPException) as e:
+        list_or_page(students, Student.enrollment_no, 0, None, to_dict, max_limit=2)
+    assert e.value.status_code == 400
+
+
+def test_cursor_round_trip_and_garbage():
+    assert decode_cursor(encode_cursor(["a", 3])) == ["a", 3]
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("not a cursor!")
+    assert e.value.status_code == 400
@@ -0,0 +1,64 @@
+# tests/test_prediction_log.py
+import logging
+
+from app.models import PredictionLog
+from app.prediction_log import PredictionLogBuffer
+
+
+def row(i):
+    return {"predicted_enrollment": f"S{i}", "confidence": 0.9, "status": "matched"}
+
+
+def test_rows_are_bulk_written_on_flush_and_stop(db):
+    buf = PredictionLogBuffer(lambda: db, max_rows=1000, max_delay=60.0)
+    buf.start()
+    buf.add([row(0), row(1)])
+    buf.add([row(2)])
+    buf.stop(timeout=5.0)
+    assert db.query(PredictionLog).count() == 3
+    assert buf.stats()["written"] == 3
+    assert buf.stats()["pending"] == 0
+
+
+def test_max_pending_drops_the_oldest_rows(db):
+    buf = PredictionLogBuffer(lambda: db, max_rows=1000, max_pending=2)
+    buf.add([row(0), row(1), row(2)])
+    assert buf.flush() == 2
+    assert [r.predicted_enrollment for r in db.query(PredictionLog).order_by(PredictionLog.id)] == ["S1", "S2"]
+    assert buf.stats()["dropped"] == 1
+
+
+class BrokenSession:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def execute(self, *a):
+        self.calls.append(1)
+        raise RuntimeError("database is gone")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_failed_shutdown_flush_is_retried_then_reported(caplog):
+    calls = []
+    buf = PredictionLogBuffer(lambda: BrokenSession(calls), max_delay=0.01)
+    buf.add([row(0), row(1)])
+    with caplog.at_level(logging.ERROR, logger="app.prediction_log"):
+        buf.stop(attempts=3)
+    assert len(calls) == 3
+    assert buf.stats()["dropped"] == 2
+    assert buf.stats()["pending"] == 0
+    assert "dropped 2 buffered rows" in caplog.text
+
+
+def test_shutdown_flush_succeeds_on_a_retry(db):
+    sessions = iter([BrokenSession([]), db])
+    buf = PredictionLogBuffer(lambda: next(sessions), max_delay=0.01)
+    buf.add([row(0)])
+    buf.stop(attempts=3)
+    assert db.query(PredictionLog).count() == 1
+    assert buf.stats()["dropped"] == 0
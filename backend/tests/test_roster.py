@@ -0,0 +1,92 @@
+# tests/test_roster.py
+import os
+
+import numpy as np
+import pytest
+
+import app.roster as roster
+from app.gallery import Gallery
+from app.roster import RosterCache
+from conftest import unit
+
+DIM = 16
+
+
+@pytest.fixture
+def gallery(tmp_path, rng):
+    gallery = Gallery(os.path.join(tmp_path, "g.bin"), dim=DIM)
+    gallery.load()
+    for i in range(6):
+        gallery.upsert(f"S{i}", unit(rng, DIM))
+    return gallery
+
+
+class Loader:
+    """session_id -> (class_id, roster); counts calls."""
+
+    def __init__(self, rosters):
+        self.rosters = rosters
+        self.calls = 0
+
+    def __call__(self, db, session_id):
+        self.calls += 1
+        return self.rosters.get(session_id, (None, []))
+
+
+def test_view_holds_only_enrolled_roster_members(gallery):
+    cache = RosterCache(Loader({1: (10, ["S0", "S2", "NOT_ENROLLED"])}), gallery)
+    view = cache.get(None, 1)
+    assert view.class_id == 10
+    assert view.ids == ["S0", "S2"]
+    _, expected, _ = gallery.subset(["S0", "S2"])
+    np.testing.assert_array_equal(view.vectors, expected)
+    matches = view.search_many(expected)
+    assert [m[0] for m in matches] == ["S0", "S2"]
+
+
+def test_sessions_without_a_roster_are_unscoped(gallery):
+    cache = RosterCache(Loader({}), gallery)
+    assert cache.get(None, 7) is None
+    assert cache.stats()["unscoped"] == 1
+
+
+def test_cached_until_invalidated_or_expired(gallery, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(roster.time, "monotonic", lambda: now[0])
+    loader = Loader({1: (10, ["S0"]), 2: (20, ["S1"])})
+    cache = RosterCache(loader, gallery, ttl=60.0)
+    first = cache.get(None, 1)
+    cache.get(None, 2)
+    assert cache.get(None, 1) is first
+    assert loader.calls == 2
+
+    loader.rosters[1] = (10, ["S0", "S3"])
+    cache.invalidate_class(10)
+    assert cache.get(None, 1).ids == ["S0", "S3"]
+    cache.get(None, 2)
+    assert loader.calls == 3                        # class 20 was not invalidated
+
+    now[0] += 61.0
+    cache.get(None, 2)
+    assert loader.calls == 4
+
+    cache.clear()
+    cache.get(None, 2)
+    assert loader.calls == 5
+
+
+def test_view_is_rebuilt_when_the_gallery_changes(gallery, rng):
+    cache = RosterCache(Loader({1: (10, ["S0", "S1"])}), gallery)
+    before = cache.get(None, 1)
+    gallery.remove("S1")
+    after = cache.get(None, 1)
+    assert after is not before
+    assert after.ids == ["S0"]
+    assert cache.stats()["builds"] == 2
+
+
+def test_lru_bound(gallery):
+    cache = RosterCache(Loader({i: (i, ["S0"]) for i in range(5)}), gallery, max_sessions=2)
+    for i in range(5):
+        cache.get(None, i)
+    assert cache.stats()["sessions"] == 2
@@ -0,0 +1,83 @@
+# tests/test_student_cache.py
+from app.models import Student
+from app.student_cache import StudentDirectory, MarkedSessions
+
+
+def add_student(db, enrollment_no, name, semester="7"):
+    db.add(Student(enrollment_no=enrollment_no, name=name, semester=semester))
+    db.commit()
+
+
+def rename(db, enrollment_no, name):
+    db.query(Student).filter(Student.enrollment_no == enrollment_no).update({"name": name})
+    db.commit()
+
+
+def test_directory_caches_and_invalidates_one_student(db):
+    add_student(db, "S1", "Asha")
+    add_student(db, "S2", "Ben")
+    directory = StudentDirectory(ttl=60.0)
+    directory.warm(db, ["S1", "S2"])
+
+    rename(db, "S1", "Asha K")
+    rename(db, "S2", "Ben K")
+    assert directory.get(db, "S1").name == "Asha"   # cached
+    directory.invalidate("S1")
+    assert directory.get(db, "S1").name == "Asha K"
+    assert directory.get(db, "S2").name == "Ben"    # other students stay cached
+    assert directory.get(db, "missing") is None
+
+
+def test_directory_entries_expire_after_ttl(db, monkeypatch):
+    import app.student_cache as student_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(student_cache.time, "monotonic", lambda: now[0])
+    add_student(db, "S1", "Asha")
+    directory = StudentDirectory(ttl=30.0)
+    assert directory.get(db, "S1").name == "Asha"
+
+    rename(db, "S1", "Asha K")   # e.g. through another worker: no invalidate() here
+    now[0] += 29.0
+    assert directory.get(db, "S1").name == "Asha"
+    now[0] += 2.0
+    assert directory.get(db, "S1").name == "Asha K"
+
+
+def test_directory_does_not_cache_a_read_that_raced_with_invalidate(db):
+    add_student(db, "S1", "Asha")
+    directory = StudentDirectory(ttl=60.0)
+
+    class RacingQuery:
+        """The student is renamed and invalidated right after the directory's read."""
+
+        def __init__(self, query):
+            self.query = query
+
+        def filter(self, *criteria):
+            return RacingQuery(self.query.filter(*criteria))
+
+        def all(self):
+            rows = self.query.all()
+            rename(db, "S1", "Asha K")
+            directory.invalidate("S1")
+            return rows
+
+    class RacingSession:
+        def query(self, *cols):
+            return RacingQuery(db.query(*cols))
+
+    assert directory.get(RacingSession(), "S1").name == "Asha"   # the racing read is returned once ...
+    assert directory.get(db, "S1").name == "Asha K"              # ... but not cached
+
+
+def test_marked_sessions_lru_and_forget():
+    marked = MarkedSessions(max_sessions=2)
+    marked.add(1, ["A", "B"])
+    assert marked.filter_unmarked(1, ["A", "B", "C"]) == ["C"]
+    marked.add(2, ["A"])
+    marked.add(3, ["A"])   # evicts session 1
+    assert marked.filter_unmarked(1, ["A"]) == ["A"]
+    marked.forget_student("A")
+    assert marked.filter_unmarked(3, ["A"]) == ["A"]
+    assert marked.stats()["skipped_inserts"] == 2
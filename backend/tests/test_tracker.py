@@ -0,0 +1,66 @@
+# tests/test_tracker.py
+import numpy as np
+import pytest
+
+from app.tracker import FaceTracker, KalmanBoxFilter, iou_matrix
+
+
+def det(*boxes):
+    """(N, 5) detections: x1, y1, x2, y2, score."""
+    return np.array([list(b) + [0.9] for b in boxes], dtype=np.float32).reshape(-1, 5)
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32)
+    np.testing.assert_allclose(iou_matrix(a, b), [[1.0, 50 / 150, 0.0]], atol=1e-6)
+    assert iou_matrix(a, b[:0]).shape == (1, 0)
+
+
+def test_kalman_filter_follows_constant_motion():
+    kf = KalmanBoxFilter([0, 0, 20, 20])
+    for t in range(1, 10):
+        kf.predict()
+        kf.update([4 * t, 0, 4 * t + 20, 20])
+    predicted = kf.predict()
+    assert predicted[0] == pytest.approx(40, abs=1.5)
+    assert predicted[2] - predicted[0] == pytest.approx(20, abs=1.5)
+
+
+def test_a_moving_face_keeps_its_track():
+    tracker = FaceTracker(iou_threshold=0.3)
+    ids = set()
+    for t in range(10):
+        seen = tracker.update(det([5 * t, 0, 5 * t + 40, 40]), now=float(t))
+        assert len(seen) == 1
+        ids.add(seen[0][0].id)
+    assert ids == {1}
+    assert tracker.created == 1
+    assert tracker.tracks[0].hits == 10
+
+
+def test_new_faces_start_tracks_and_lost_ones_are_dropped():
+    tracker = FaceTracker(iou_threshold=0.3, max_missed=2)
+    seen = tracker.update(det([0, 0, 40, 40], [100, 0, 140, 40]), now=0.0)
+    assert sorted(t.id for t, _ in seen) == [1, 2]
+    assert {c for _, c in seen} == {0, 1}
+    for t in range(1, 4):
+        seen = tracker.update(det([0, 0, 40, 40]), now=float(t))
+        assert [tr.id for tr, _ in seen] == [1]
+    assert [t.id for t in tracker.tracks] == [1]       # track 2 missed 3 > max_missed frames
+
+    seen = tracker.update(det([0, 0, 40, 40], [300, 0, 340, 40]), now=5.0)
+    assert sorted(t.id for t, _ in seen) == [1, 3]
+    assert tracker.update(det(), now=6.0) == []
+
+
+def test_due_for_embedding():
+    tracker = FaceTracker()
+    track = tracker.update(det([0, 0, 40, 40]), now=0.0)[0][0]
+    assert track.due_for_embedding(now=0.0, refresh_secs=2.0)
+    track.embedded_at = 0.0
+    assert not track.due_for_embedding(now=1.0, refresh_secs=2.0)
+    assert track.due_for_embedding(now=2.0, refresh_secs=2.0)
+    track.student_id = "S1"
+    assert not track.due_for_embedding(now=10.0, refresh_secs=2.0)
+    assert track.to_dict()["student_id"] == "S1"
@@ -0,0 +1,133 @@
+# tests/test_vector_index.py
+import os
+
+import numpy as np
+import pytest
+
+from app.gallery_store import PackedGalleryStore
+from app.vector_index import ExactIndex, IVFIndex, QuantizedIndex, make_index, _topk
+from conftest import unit
+
+DIM = 32
+N = 400
+
+
+@pytest.fixture
+def store(tmp_path, rng):
+    store = PackedGalleryStore.create(os.path.join(tmp_path, "g.bin"), DIM, capacity=1024)
+    store.append_many((f"S{i}", v) for i, v in enumerate(unit(rng, N, DIM)))
+    return store
+
+
+def near(store, rows, rng, noise=0.1):
+    """Noisy copies of the given store rows (queries whose true match is known)."""
+    q = store.vectors[rows] + noise * unit(rng, len(rows), DIM)
+    return (q / np.linalg.norm(q, axis=1, keepdims=True)).astype(np.float32)
+
+
+def indexes():
+    return [
+        ExactIndex(),
+        IVFIndex(nlist=8, nprobe=8, min_train=64),          # every cell probed: exact
+        QuantizedIndex("float16", rerank=8),
+        QuantizedIndex("int8", rerank=8),
+    ]
+
+
+@pytest.mark.parametrize("index", indexes(), ids=lambda i: i.name)
+def test_search_agrees_with_brute_force(store, rng, index):
+    index.rebuild(store, store.live_rows())
+    targets = rng.choice(N, size=20, replace=False)
+    queries = near(store, targets, rng)
+    rows, scores = index.search(store, queries, k=3)
+    assert rows.shape == scores.shape == (20, 3)
+    np.testing.assert_array_equal(rows[:, 0], targets)
+    exact = queries.dot(store.vectors[:N].T)
+    np.testing.assert_allclose(scores[:, 0], exact[np.arange(20), targets], atol=1e-5)
+    assert np.all(np.diff(scores, axis=1) <= 0)     # best first
+
+
+@pytest.mark.parametrize("index", indexes(), ids=lambda i: i.name)
+def test_removed_rows_are_never_returned(store, rng, index):
+    index.rebuild(store, store.live_rows())
+    snap = index.snapshot()
+    view = store.view()
+    store.tombstone("S5")
+    index.remove(np.array([5]))
+    queries = near(store, [5], rng, noise=0.0)
+    rows, _ = index.search(store, queries, k=1)
+    assert rows[0, 0] != 5
+    # a snapshot taken earlier still sees the row
+    rows, _ = snap.search(view, queries, k=1)
+    assert rows[0, 0] == 5
+
+
+@pytest.mark.parametrize("index", indexes(), ids=lambda i: i.name)
+def test_added_rows_are_found(store, rng, index):
+    index.rebuild(store, store.live_rows())
+    v = unit(rng, DIM)
+    row = store.append("NEW", v)
+    index.add(store, np.array([row]))
+    rows, scores = index.search(store, v[None, :], k=1)
+    assert rows[0, 0] == row
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_empty_index_returns_missing_results(tmp_path):
+    store = PackedGalleryStore.create(os.path.join(tmp_path, "g.bin"), DIM)
+    for index in indexes():
+        index.rebuild(store, store.live_rows())
+        rows, scores = index.search(store, np.ones((2, DIM), dtype=np.float32), k=2)
+        assert (rows == -1).all() and np.isneginf(scores).all()
+
+
+def test_ivf_brute_forces_until_trained(store, rng):
+    index = IVFIndex(nlist=8, min_train=N + 1)
+    index.rebuild(store, store.live_rows())
+    assert not index.trained
+    rows, _ = index.search(store, near(store, [7], rng), k=1)
+    assert rows[0, 0] == 7
+    index.min_train = N
+    index.add(store, np.array([], dtype=np.int64))
+    assert index.trained
+
+
+def test_ivf_save_and_load(store, tmp_path):
+    path = os.path.join(tmp_path, "g.bin.ivf.npz")
+    index = IVFIndex(nlist=8, nprobe=2, min_train=64)
+    live = store.live_rows()
+    index.rebuild(store, live)
+    index.save(path, store.generation)
+    assert not index.dirty
+
+    same = IVFIndex(nlist=8, nprobe=2, min_train=64)
+    assert same.load(path, store, live, store.generation)
+    assert not same.dirty
+    q = np.asarray(store.vectors[:10])
+    np.testing.assert_array_equal(same.search(store, q, k=2)[0], index.search(store, q, k=2)[0])
+
+    moved = IVFIndex(nlist=8, nprobe=2, min_train=64)
+    assert moved.load(path, store, live[1:], store.generation + 1)   # gallery changed: reassigned
+    assert moved.dirty
+    assert not IVFIndex().load(os.path.join(tmp_path, "missing.npz"), store, live, 0)
+
+
+def test_quantized_index_is_smaller_than_float32(store):
+    for encoding, ratio in (("float16", 2), ("int8", 4)):
+        index = QuantizedIndex(encoding)
+        index.rebuild(store, store.live_rows())
+        assert index.nbytes < N * DIM * 4 / ratio + N * 12 + 1
+
+
+def test_topk_pads_missing_results():
+    cols, top = _topk(np.array([[0.1, 0.9]], dtype=np.float32), 3)
+    assert cols.tolist() == [[1, 0, -1]]
+    assert np.isneginf(top[0, 2])
+
+
+def test_make_index():
+    assert isinstance(make_index("exact"), ExactIndex)
+    assert isinstance(make_index("IVF", nprobe=4), IVFIndex)
+    assert make_index("int8").name == "int8"
+    with pytest.raises(ValueError):
+        make_index("hnsw")